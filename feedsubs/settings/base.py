@@ -213,3 +213,8 @@ SPINACH_BROKER = RedisBroker(redis=StrictRedis.from_url(
 ))
 SPINACH_NAMESPACE = 'feedsubs'
 SPINACH_CLEAR_SESSIONS_PERIODICITY = timedelta(weeks=1)
+
+READER_REDIS = StrictRedis.from_url(
+    config('REDIS_READER_URL', default='redis://'),
+    **recommended_socket_opts
+)
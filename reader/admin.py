@@ -1,16 +1,35 @@
 from django.contrib import admin
+from redis import RedisError
 from spinach import Batch
 
-from . import models
+from . import models, politeness
 from .tasks import tasks
 
 
 @admin.register(models.Feed)
 class FeedAdmin(admin.ModelAdmin):
 
-    list_display = ('name', 'domain', 'last_fetched_at', 'last_failure', 'is_sync_enabled')
+    list_display = ('name', 'domain', 'last_fetched_at', 'last_failure',
+                    'failure_count', 'not_modified_rate', 'last_sync_articles',
+                    'last_sync_bytes', 'last_sync_duration',
+                    'total_sync_duration', 'is_sync_enabled')
+    readonly_fields = ('host_limiter',)
     actions = ['sync']
 
+    def host_limiter(self, obj):
+        host = politeness.get_host(obj.uri)
+        try:
+            state = politeness.get_host_state(host)
+        except RedisError as e:
+            return 'Unavailable: {}'.format(e)
+
+        return '{}: {:.1f} tokens, {}/{} requests in progress'.format(
+            host, state['tokens'], state['active_requests'],
+            state['max_concurrency']
+        )
+
+    host_limiter.short_description = 'Host limiter'
+
     def sync(self, request, queryset):
         batch = Batch()
         for feed in queryset:
@@ -0,0 +1,88 @@
+"""Fetch many feeds concurrently from a single process.
+
+Synchronizing one feed per task means that a worker thread waits on the
+network for each feed it synchronizes. This module downloads a whole group
+of feeds on a pool of threads shared by the process, and hands each result
+to the caller as soon as it arrives so that the database work of a feed
+overlaps with the downloads of the others.
+
+Each download goes through http_fetcher.fetch_feed, so the User-Agent, the
+size caps, the conditional requests and the per-host limits are exactly the
+same as for a single feed, each thread keeping its own HTTP session. The
+number of requests in flight is bounded by READER_BULK_FETCH_CONCURRENCY,
+the size of the pool: requests is a blocking client.
+
+A group never holds more than READER_BULK_FETCH_CONCURRENCY results that
+are downloading or waiting for the caller, a new download only starts when
+the caller takes a result. With the caller dropping each result once
+processed, the memory used by a group is bounded by this number times
+http_fetcher.MAX_DOWNLOAD_BYTES.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from logging import getLogger
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from . import http_fetcher
+from .settings import READER_BULK_FETCH_CONCURRENCY
+
+logger = getLogger(__name__)
+_executor = None  # type: Optional[ThreadPoolExecutor]
+_executor_lock = threading.Lock()
+
+FetchResult = Union[http_fetcher.FeedFetchResult, Exception]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=READER_BULK_FETCH_CONCURRENCY,
+                thread_name_prefix='bulk-fetch'
+            )
+        return _executor
+
+
+def fetch_feeds(fetch_kwargs: List[dict]) -> Iterator[Tuple[int, FetchResult]]:
+    """Fetch feeds concurrently, yielding results as they complete.
+
+    Each element of the list is the arguments of a call to fetch_feed. Each
+    result is yielded with the index of its arguments, a fetch that failed
+    gives the exception it raised.
+    """
+    executor = _get_executor()
+    window = min(len(fetch_kwargs), READER_BULK_FETCH_CONCURRENCY)
+    remaining = iter(enumerate(fetch_kwargs))
+    pending = dict()  # type: Dict[Future, int]
+
+    def submit_next():
+        try:
+            index, kwargs = next(remaining)
+        except StopIteration:
+            return
+        pending[executor.submit(_fetch_feed, kwargs)] = index
+
+    for _ in range(window):
+        submit_next()
+
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                yield index, result
+                del result
+                submit_next()
+    finally:
+        # The caller stopped early, do not start downloads nobody will read
+        for future in pending:
+            future.cancel()
+
+
+def _fetch_feed(kwargs: dict) -> http_fetcher.FeedFetchResult:
+    return http_fetcher.fetch_feed(**kwargs)
@@ -0,0 +1,123 @@
+"""Merge feeds that turn out to be the same one.
+
+Feeds get duplicated when two URIs point to the same document, for instance
+when a feed starts redirecting to the address of another feed. Keeping both
+means fetching, parsing and storing the same articles twice. The duplicate
+is merged into the surviving feed: subscriptions, stars and read articles
+are moved over, then the duplicate is deleted.
+"""
+from collections import defaultdict
+from logging import getLogger
+from typing import Dict, Optional
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Greatest
+
+from . import feed_stats, inbox, models, read_state
+from .utils import canonicalize_uri
+
+logger = getLogger(__name__)
+
+
+def find_feed(uri: str,
+              exclude: Optional[models.Feed]=None) -> Optional[models.Feed]:
+    """Find the feed an URI points to, whatever its exact spelling."""
+    feeds = models.Feed.objects.filter(canonical_uri=canonicalize_uri(uri))
+    if exclude is not None:
+        feeds = feeds.exclude(id=exclude.id)
+
+    return feeds.order_by('id').first()
+
+
+@transaction.atomic
+def merge_feeds(duplicate: models.Feed, survivor: models.Feed):
+    """Move everything attached to a duplicate feed to its survivor.
+
+    Callers hold the sync leases of both feeds, like the merge_feeds task.
+    """
+    article_mapping = _merge_articles(duplicate, survivor)
+    # Needs the watermarks of both feeds, before subscriptions are merged
+    read_state.merge_feeds(duplicate.id, survivor.id, article_mapping)
+    _merge_subscriptions(duplicate, survivor)
+    duplicate.delete()
+    feed_stats.reconcile(survivor)
+    for subscription in survivor.subscription_set.all():
+        inbox.add_subscription(subscription)
+    logger.info('Merged feed %d into %s', duplicate.id, survivor)
+
+
+def _merge_subscriptions(duplicate: models.Feed, survivor: models.Feed):
+    survivor_subscriptions = {
+        subscription.reader_id: subscription
+        for subscription in survivor.subscription_set.all()
+    }
+    for subscription in duplicate.subscription_set.all():
+        existing = survivor_subscriptions.get(subscription.reader_id)
+        if existing is None:
+            # Moved articles keep their ids, the watermark still holds. Older
+            # articles only the survivor has end up read.
+            subscription.feed = survivor
+            subscription.save(update_fields=['feed'])
+            continue
+
+        # The reader was subscribed to both feeds, articles between the two
+        # watermarks end up read
+        if subscription.read_up_to_id is not None:
+            models.Subscription.objects.filter(id=existing.id).update(
+                read_up_to_id=Greatest('read_up_to_id',
+                                       Value(subscription.read_up_to_id))
+            )
+        new_tags = [t for t in subscription.tags if t not in existing.tags]
+        if new_tags:
+            existing.tags = existing.tags + new_tags
+            existing.save(update_fields=['tags'])
+        subscription.delete()
+
+
+def _merge_articles(duplicate: models.Feed,
+                    survivor: models.Feed) -> Dict[int, int]:
+    """Move articles, or the stars of articles both feeds have.
+
+    Returns the mapping of duplicate article ids to the survivor articles
+    replacing them.
+    """
+    survivor_articles = dict(
+        survivor.article_set.values_list('id_in_feed', 'id')
+    )
+    duplicate_articles = dict(
+        duplicate.article_set.values_list('id_in_feed', 'id')
+    )
+
+    # Articles only the duplicate has are moved as is, with their stars
+    articles_to_move = [
+        article_id for id_in_feed, article_id in duplicate_articles.items()
+        if id_in_feed not in survivor_articles
+    ]
+    models.Article.objects.filter(id__in=articles_to_move).update(
+        feed=survivor
+    )
+
+    # Stars of articles both feeds have are copied to the article of the
+    # survivor, the duplicate article is deleted with its feed
+    article_mapping = {
+        article_id: survivor_articles[id_in_feed]
+        for id_in_feed, article_id in duplicate_articles.items()
+        if id_in_feed in survivor_articles
+    }
+    through = models.ReaderProfile.stars.through
+    readers_by_article = defaultdict(set)
+    for reader_id, article_id in (
+            through.objects.filter(article_id__in=article_mapping)
+            .values_list('readerprofile_id', 'article_id')):
+        readers_by_article[article_mapping[article_id]].add(reader_id)
+
+    through.objects.bulk_create(
+        [
+            through(readerprofile_id=reader_id, article_id=article_id)
+            for article_id, readers in readers_by_article.items()
+            for reader_id in readers
+        ],
+        ignore_conflicts=True
+    )
+    return article_mapping
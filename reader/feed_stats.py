@@ -0,0 +1,180 @@
+"""Denormalized counters of feeds.
+
+Counting the articles and subscribers of a feed on every synchronization
+means aggregating large tables over and over. Instead a FeedStats row per
+feed is updated with deltas when articles are ingested or trimmed and when
+users subscribe or unsubscribe.
+
+Subscribers are counted only if they are active: their account is enabled
+and they logged in recently.
+
+Deltas can drift, for instance when articles are deleted from the admin or
+when subscribers become inactive. Stats are read with get_feed_stats, which
+reconciles them from the real tables when they are missing or were last
+reconciled more than READER_FEED_STATS_MAX_AGE ago. Stats used by a
+synchronization are thus at most a day old by default, plus the changes
+not tracked since their last reconciliation.
+"""
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Count, DateTimeField, F, Min, Value
+from django.db.models.functions import Coalesce, Least
+from django.utils.timezone import now
+
+from . import models
+from .settings import READER_FEED_STATS_MAX_AGE
+
+WINDOW = timedelta(days=365)
+
+logger = getLogger(__name__)
+
+
+def get_active_reader_threshold(current_date: datetime) -> datetime:
+    """Readers who did not log in since this date are inactive."""
+    return current_date - timedelta(seconds=settings.SESSION_COOKIE_AGE) * 2
+
+
+def get_feed_stats(feed: models.Feed,
+                   current_date: Optional[datetime]=None) -> models.FeedStats:
+    """Stats of a feed, reconciled from the real tables if missing or stale."""
+    current_date = current_date or now()
+    try:
+        stats = feed.stats
+    except models.FeedStats.DoesNotExist:
+        return reconcile(feed, current_date)
+
+    reconciled_at = stats.reconciled_at
+    if reconciled_at is None or (
+            reconciled_at <= current_date - READER_FEED_STATS_MAX_AGE):
+        return reconcile(feed, current_date)
+
+    return stats
+
+
+def reconcile(feed: models.Feed,
+              current_date: Optional[datetime]=None) -> models.FeedStats:
+    """Recompute all the stats of a feed from the real tables."""
+    current_date = current_date or now()
+    window = _aggregate_window(feed, current_date)
+    stats, _ = models.FeedStats.objects.update_or_create(
+        feed=feed,
+        defaults={
+            'article_count': feed.article_set.count(),
+            'subscriber_count': _count_active_subscribers(feed,
+                                                          current_date),
+            'articles_in_window': window['articles_in_window'],
+            'oldest_in_window': window['oldest_in_window'],
+            'reconciled_at': current_date
+        }
+    )
+    feed.stats = stats
+    logger.info('Reconciled stats of feed %d', feed.id)
+    return stats
+
+
+def get_window(feed: models.Feed,
+               current_date: Optional[datetime]=None) -> models.FeedStats:
+    """Stats of a feed with an up to date window of articles.
+
+    The window is recomputed only when its oldest article got older than a
+    year, until then counting the new articles is enough.
+    """
+    current_date = current_date or now()
+    stats = get_feed_stats(feed, current_date)
+    oldest = stats.oldest_in_window
+    if oldest is None or oldest > current_date - WINDOW:
+        return stats
+
+    window = _aggregate_window(feed, current_date)
+    stats.articles_in_window = window['articles_in_window']
+    stats.oldest_in_window = window['oldest_in_window']
+    stats.save(update_fields=['articles_in_window', 'oldest_in_window'])
+    return stats
+
+
+def record_new_articles(feed: models.Feed,
+                        published_dates: List[Optional[datetime]],
+                        current_date: Optional[datetime]=None):
+    """Account for articles inserted in a feed."""
+    if not published_dates:
+        return
+
+    current_date = current_date or now()
+    in_window = [d for d in published_dates
+                 if d is not None and d > current_date - WINDOW]
+    updates = {
+        'article_count': F('article_count') + len(published_dates),
+        'articles_in_window': F('articles_in_window') + len(in_window)
+    }
+    if in_window:
+        oldest = Value(min(in_window), output_field=DateTimeField())
+        updates['oldest_in_window'] = Least(
+            Coalesce('oldest_in_window', oldest), oldest
+        )
+
+    updated = models.FeedStats.objects.filter(feed=feed).update(**updates)
+    if not updated:
+        reconcile(feed, current_date)
+        return
+
+    # Cached stats are outdated
+    _forget_cached_stats(feed)
+
+
+def record_removed_articles(feed: models.Feed, count: int,
+                            current_date: Optional[datetime]=None):
+    """Account for articles deleted from a feed.
+
+    Removed articles may have been in the window, it is recomputed.
+    """
+    if not count:
+        return
+
+    current_date = current_date or now()
+    window = _aggregate_window(feed, current_date)
+    updated = models.FeedStats.objects.filter(feed=feed).update(
+        article_count=F('article_count') - count,
+        **window
+    )
+    if not updated:
+        reconcile(feed, current_date)
+        return
+
+    _forget_cached_stats(feed)
+
+
+def record_subscription(feed_id: int, delta: int):
+    """Account for a user subscribing (1) or unsubscribing (-1) from a feed.
+
+    The user is assumed to be active, which is true for users managing
+    their subscriptions. Feeds without stats yet count their subscribers when
+    stats are created.
+    """
+    models.FeedStats.objects.filter(feed_id=feed_id).update(
+        subscriber_count=F('subscriber_count') + delta
+    )
+
+
+def _count_active_subscribers(feed: models.Feed, current_date: datetime) -> int:
+    return feed.subscribers.filter(
+        user__is_active=True,
+        user__last_login__gte=get_active_reader_threshold(current_date)
+    ).count()
+
+
+def _aggregate_window(feed: models.Feed, current_date: datetime) -> dict:
+    return (
+        feed.article_set.filter(published_at__gt=current_date - WINDOW)
+        .aggregate(articles_in_window=Count('id'),
+                   oldest_in_window=Min('published_at'))
+    )
+
+
+def _forget_cached_stats(feed: models.Feed):
+    try:
+        del feed._state.fields_cache['stats']
+    except KeyError:
+        pass
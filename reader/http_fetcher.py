@@ -1,64 +1,211 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import hashlib
 from logging import getLogger
-from typing import Optional
+from tempfile import SpooledTemporaryFile
+import threading
+import time
+from typing import Optional, Tuple
 
 import attr
 from allauth.utils import build_absolute_uri
 from django.conf import settings
 from django.urls import reverse
-from django.utils.http import http_date
+from django.utils.http import parse_http_date
+from django.utils.timezone import now
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+from . import politeness
 
 
 MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
 TIMEOUT = (15, 60)
+CHUNK_SIZE = 64 * 1024
+
+# Bodies bigger than this are spilled to disk while being downloaded
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+
+# Number of hosts and connections per host kept open by each thread
+POOL_HOSTS = 32
+POOL_CONNECTIONS_PER_HOST = 2
+
+# Sessions not used for this number of seconds are closed
+SESSION_MAX_IDLE = 300
+
+# Connection statistics are logged every this number of requests
+LOG_STATS_EVERY = 1000
 
 logger = getLogger(__name__)
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'new_connections': 0}
+
+
+class _CountingPoolMixin:
+
+    def _new_conn(self):
+        _record_new_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTP adapter keeping track of how often connections are reused."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        _record_request()
+        return super().send(request, **kwargs)
+
+
+def _record_new_connection():
+    with _stats_lock:
+        _stats['new_connections'] += 1
+
+
+def _record_request():
+    with _stats_lock:
+        _stats['requests'] += 1
+        stats = dict(_stats) if _stats['requests'] % LOG_STATS_EVERY == 0 \
+            else None
+
+    if stats is not None:
+        logger.info('Made %d HTTP requests opening %d connections',
+                    stats['requests'], stats['new_connections'])
+
+
+def get_connection_stats() -> dict:
+    """Number of requests and new connections made by this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['reused_connections'] = stats['requests'] - stats['new_connections']
+    return stats
+
+
+def get_session() -> requests.Session:
+    """Get the HTTP session of the current thread.
+
+    Sessions keep connections alive between fetches, which saves TCP and TLS
+    handshakes when many feeds and images are served by the same hosts. They
+    are not thread-safe, so each worker thread gets its own. A session left
+    idle for a while is closed, the remote ends would have closed its
+    connections anyway.
+    """
+    current_time = time.monotonic()
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        if current_time - _local.last_used_at > SESSION_MAX_IDLE:
+            logger.debug('Closing idle HTTP session')
+            session.close()
+            session = None
+
+    if session is None:
+        session = requests.Session()
+        adapter = CountingHTTPAdapter(
+            pool_connections=POOL_HOSTS,
+            pool_maxsize=POOL_CONNECTIONS_PER_HOST
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+
+    _local.last_used_at = current_time
+    return session
 
 
 @attr.s
 class FeedFetchResult:
-    content: bytes = attr.ib()
-    hash: bytes = attr.ib()
+    content: Optional[bytes] = attr.ib()
+    hash: Optional[bytes] = attr.ib()
     is_html: bool = attr.ib()
     final_url: str = attr.ib()
+    status_code: int = attr.ib()
+    etag: str = attr.ib(default='')
+    last_modified: str = attr.ib(default='')
+    expires_in: Optional[timedelta] = attr.ib(default=None)
+
+    @property
+    def is_modified(self) -> bool:
+        """Whether the feed changed since the last fetch."""
+        return self.content is not None
 
 
 class FetchFileTooBigError(Exception):
     pass
 
 
-def fetch_feed(uri: str, last_fetched_at: Optional[datetime],
+def fetch_feed(uri: str, etag: str, last_modified: str,
                last_hash: Optional[bytes], subscriber_count: int,
-               feed_id: Optional[int]) -> Optional[FeedFetchResult]:
-    """Retrieve a new version of the feed via HTTP if available."""
+               feed_id: Optional[int]) -> FeedFetchResult:
+    """Retrieve a new version of the feed via HTTP if available.
+
+    The validators returned by the server on the previous fetch are sent back
+    to let it answer with a 304 when the feed did not change. Servers that do
+    not support conditional requests still send the whole feed, in this case
+    the hash of the content tells if something changed.
+
+    The result has no content when the feed did not change.
+
+    Raises politeness.HostRateLimitedError when the host serving the feed
+    already receives too many requests.
+    """
     request_headers = {
         'User-Agent': get_user_agent(subscriber_count, feed_id)
     }
-    if last_fetched_at:
-        request_headers['If-Modified-Since'] = http_date(
-            last_fetched_at.timestamp()
-        )
+    if etag:
+        request_headers['If-None-Match'] = etag
+    if last_modified:
+        request_headers['If-Modified-Since'] = last_modified
 
-    with requests.get(uri, headers=request_headers, stream=True,
-                      timeout=TIMEOUT) as r:
+    with politeness.host_slot(uri), \
+            get_session().get(uri, headers=request_headers, stream=True,
+                              timeout=TIMEOUT) as r:
         r.raise_for_status()
 
         if r.status_code == 304:
             logger.info('Feed did not change since last fetch, got HTTP 304')
-            return None
+            # A 304 response may omit validators that did not change
+            return FeedFetchResult(
+                None, None, False, r.url, r.status_code,
+                r.headers.get('ETag', etag),
+                r.headers.get('Last-Modified', last_modified),
+                get_freshness_lifetime(r.headers)
+            )
+
+        etag = r.headers.get('ETag', '')
+        last_modified = r.headers.get('Last-Modified', '')
+        expires_in = get_freshness_lifetime(r.headers)
 
-        _check_content_length(r)
+        body, current_hash = _download(r)
+        with body:
+            if last_hash == current_hash:
+                logger.info(
+                    'Feed did not change since last fetch, hashes match'
+                )
+                return FeedFetchResult(None, None, False, r.url,
+                                       r.status_code, etag, last_modified,
+                                       expires_in)
 
-        current_hash = hashlib.sha1(r.content).digest()
-        if last_hash == current_hash:
-            logger.info('Feed did not change since last fetch, hashes match')
-            return None
+            content = body.read()
 
         is_html = r.headers.get('Content-Type', '').startswith('text/html')
 
-        return FeedFetchResult(r.content, current_hash, is_html, r.url)
+        return FeedFetchResult(content, current_hash, is_html, r.url,
+                               r.status_code, etag, last_modified, expires_in)
 
 
 def fetch_image(session: requests.Session, uri: str) -> bytes:
@@ -66,11 +213,95 @@ def fetch_image(session: requests.Session, uri: str) -> bytes:
     request_headers = {
         'User-Agent': get_user_agent()
     }
-    with session.get(uri, headers=request_headers, stream=True,
-                     timeout=TIMEOUT) as r:
+    with politeness.host_slot(uri), \
+            session.get(uri, headers=request_headers, stream=True,
+                        timeout=TIMEOUT) as r:
         r.raise_for_status()
-        _check_content_length(r)
-        return r.content
+        body, _ = _download(r)
+        with body:
+            return body.read()
+
+
+def _download(r: requests.Response) -> Tuple[SpooledTemporaryFile, bytes]:
+    """Read the body of a response in chunks and compute its SHA-1.
+
+    The download is aborted as soon as the body gets bigger than the maximal
+    size, even when the server did not announce its length. Big bodies are
+    kept on disk rather than in memory, this way the body of a feed that did
+    not change is never entirely loaded in memory.
+
+    The caller is responsible for closing the returned file.
+    """
+    _check_content_length(r)
+
+    body = SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    content_hash = hashlib.sha1()
+    size = 0
+    try:
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_DOWNLOAD_BYTES:
+                raise FetchFileTooBigError(
+                    'File length is over {} bytes'.format(MAX_DOWNLOAD_BYTES)
+                )
+            content_hash.update(chunk)
+            body.write(chunk)
+    except Exception:
+        body.close()
+        raise
+
+    body.seek(0)
+    return body, content_hash.digest()
+
+
+def get_freshness_lifetime(headers) -> Optional[timedelta]:
+    """Time during which the server considers the response fresh.
+
+    Based on the Cache-Control max-age directive or on the Expires header.
+    """
+    directives = dict()
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+
+    if 'no-cache' in directives or 'no-store' in directives:
+        return None
+
+    try:
+        return timedelta(seconds=int(directives['max-age']))
+    except (KeyError, ValueError):
+        pass
+
+    expires = _parse_http_date(headers.get('Expires', ''))
+    if expires is None:
+        return None
+
+    date = _parse_http_date(headers.get('Date', '')) or now()
+    return expires - date
+
+
+def get_retry_after(headers) -> Optional[timedelta]:
+    """Delay requested by the server in a Retry-After header."""
+    retry_after = headers.get('Retry-After', '')
+    try:
+        return timedelta(seconds=int(retry_after))
+    except ValueError:
+        pass
+
+    retry_at = _parse_http_date(retry_after)
+    if retry_at is None:
+        return None
+
+    return retry_at - now()
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        timestamp = parse_http_date(value)
+    except ValueError:
+        return None
+
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
 
 
 def _check_content_length(r: requests.Response):
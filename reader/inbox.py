@@ -0,0 +1,167 @@
+"""Timeline of the articles of the feeds each reader is subscribed to.
+
+Building the home page means joining articles to the subscriptions of the
+reader, filtering out what was read and sorting the result, the cost grows
+with the number of feeds followed. When READER_INBOX_ENABLED is set, each
+article is instead copied in the inbox of every subscriber when it is
+created, along with its dates and whether it is read. Boards then read a
+range of an index of the inbox, whatever the number of feeds.
+
+The inbox is a copy: articles, subscriptions and read state stay the source
+of truth. After enabling it, existing subscriptions are copied with the
+rebuild_inbox management command.
+
+Copying new articles and copying the articles of a new subscription both
+lock the row of the feed first. Otherwise a subscription created in a
+transaction still open while a synchronization copies new articles would
+miss them: neither side sees what the other has not committed yet. With the
+lock, the second side waits for the first one to commit and sees its rows.
+"""
+from typing import Iterable
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, QuerySet, Subquery
+
+from . import models, read_state
+from .settings import READER_INBOX_ENABLED
+
+
+def is_enabled() -> bool:
+    return READER_INBOX_ENABLED
+
+
+def add_articles(feed: models.Feed, article_ids: Iterable[int]):
+    """Copy new articles of a feed in the inbox of its subscribers."""
+    article_ids = list(article_ids)
+    if not is_enabled() or not article_ids:
+        return
+
+    # New articles are above the watermarks, nobody has read them yet
+    rows = (
+        models.Subscription.objects
+        .filter(feed=feed, feed__article__id__in=article_ids)
+        .values_list('reader_id', 'feed__article__id',
+                     'feed__article__published_at',
+                     'feed__article__created_at')
+    )
+    sql, params = rows.query.sql_with_params()
+    with transaction.atomic():
+        _lock_feed(feed.id)
+        _insert_entries(
+            'SELECT *, FALSE FROM ({}) AS articles'.format(sql), params,
+            update_read_state=False
+        )
+
+
+def update_article_dates(article_ids: Iterable[int]):
+    """Refresh the copies of dates of updated articles."""
+    article_ids = list(article_ids)
+    if not is_enabled() or not article_ids:
+        return
+
+    published_at = (
+        models.Article.objects.filter(id=OuterRef('article'))
+        .values('published_at')[:1]
+    )
+    models.InboxEntry.objects.filter(article_id__in=article_ids).update(
+        published_at=Subquery(published_at)
+    )
+
+
+def add_subscription(subscription: models.Subscription):
+    """Copy the articles of a feed in the inbox of a subscriber.
+
+    Entries already in the inbox get their read state refreshed, which also
+    makes it the way to rebuild the inbox of a subscription.
+    """
+    if not is_enabled():
+        return
+
+    rows = (
+        read_state.annotate_is_read(
+            models.Article.objects.filter(feed_id=subscription.feed_id),
+            subscription.reader_id
+        )
+        .order_by()
+        .values_list('id', 'published_at', 'created_at', 'is_read')
+    )
+    sql, params = rows.query.sql_with_params()
+    with transaction.atomic():
+        _lock_feed(subscription.feed_id)
+        _insert_entries(
+            'SELECT %s, articles.* FROM ({}) AS articles'.format(sql),
+            (subscription.reader_id,) + tuple(params),
+            update_read_state=True
+        )
+
+
+def remove_subscription(subscription: models.Subscription):
+    if not is_enabled():
+        return
+
+    models.InboxEntry.objects.filter(
+        reader_id=subscription.reader_id,
+        article__feed_id=subscription.feed_id
+    ).delete()
+
+
+def get_entries(reader) -> QuerySet:
+    """Entries of the inbox of a reader with their articles."""
+    stars = models.ReaderProfile.stars.through.objects.filter(
+        readerprofile=reader, article=OuterRef('article')
+    )
+    return (
+        models.InboxEntry.objects.filter(reader=reader)
+        .select_related('article__feed')
+        .prefetch_related('article__attachment_set')
+        .annotate(is_starred=Exists(stars))
+    )
+
+
+def get_articles(entries: Iterable[models.InboxEntry]):
+    """Articles of inbox entries flagged like annotated articles."""
+    articles = list()
+    for entry in entries:
+        article = entry.article
+        article.is_read = entry.is_read
+        article.is_starred = entry.is_starred
+        articles.append(article)
+    return articles
+
+
+def _lock_feed(feed_id: int):
+    """Lock a feed until the end of the transaction, see module docstring."""
+    list(
+        models.Feed.objects.select_for_update().filter(id=feed_id)
+        .values_list('id', flat=True)
+    )
+
+
+def _insert_entries(select_sql: str, params, update_read_state: bool):
+    """Insert the entries selected by a query with INSERT ... SELECT.
+
+    The query selects the reader, article, dates and read state columns.
+    """
+    opts = models.InboxEntry._meta
+    quote = connection.ops.quote_name
+    columns = [
+        quote(opts.get_field(name).column)
+        for name in ('reader', 'article', 'published_at', 'created_at',
+                     'is_read')
+    ]
+    on_conflict = 'DO NOTHING'
+    if update_read_state:
+        on_conflict = 'DO UPDATE SET {0} = EXCLUDED.{0}'.format(columns[4])
+    sql = (
+        'INSERT INTO {table} ({columns}) {select} '
+        'ON CONFLICT ({reader}, {article}) {on_conflict}'
+    ).format(
+        table=quote(opts.db_table),
+        columns=', '.join(columns),
+        select=select_sql,
+        reader=columns[0],
+        article=columns[1],
+        on_conflict=on_conflict
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+
+from ... import bulk_fetcher, http_fetcher, politeness
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare sequential and concurrent fetching of synthetic feeds '
+        'served by a local HTTP server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feeds', type=int, default=200)
+        parser.add_argument('--articles', type=int, default=50)
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Seconds the server waits before answering')
+
+    def handle(self, *args, **options):
+        handler = _get_handler(options['articles'], options['latency'])
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        fetch_kwargs = [
+            {
+                'uri': 'http://127.0.0.1:{}/feeds/{}'.format(
+                    server.server_port, i
+                ),
+                'etag': '',
+                'last_modified': '',
+                'last_hash': None,
+                'subscriber_count': 1,
+                'feed_id': i
+            }
+            for i in range(options['feeds'])
+        ]
+
+        # All synthetic feeds are served by the same host, the per-host
+        # limits would throttle the benchmark
+        try:
+            with mock.patch.object(politeness, 'host_slot', _no_limit):
+                start = time.monotonic()
+                for kwargs in fetch_kwargs:
+                    http_fetcher.fetch_feed(**kwargs)
+                sequential_duration = time.monotonic() - start
+
+                start = time.monotonic()
+                errors = [
+                    result
+                    for _, result in bulk_fetcher.fetch_feeds(fetch_kwargs)
+                    if isinstance(result, Exception)
+                ]
+                bulk_duration = time.monotonic() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(
+            'Sequential: {} feeds in {:.2f}s ({:.1f} feeds/s)'.format(
+                len(fetch_kwargs), sequential_duration,
+                len(fetch_kwargs) / sequential_duration
+            )
+        )
+        self.stdout.write(
+            'Bulk: {} feeds in {:.2f}s ({:.1f} feeds/s), {} errors'.format(
+                len(fetch_kwargs), bulk_duration,
+                len(fetch_kwargs) / bulk_duration, len(errors)
+            )
+        )
+
+
+@contextmanager
+def _no_limit(uri):
+    yield
+
+
+def _get_handler(num_articles: int, latency: float):
+    items = ''.join(
+        '<item><guid>{0}</guid><title>Article {0}</title>'
+        '<link>https://example.com/{0}</link>'
+        '<description>{1}</description></item>'.format(i, 'Lorem ipsum ' * 50)
+        for i in range(num_articles)
+    )
+    body = (
+        '<?xml version="1.0"?><rss version="2.0"><channel>'
+        '<title>Synthetic feed</title><link>https://example.com</link>'
+        '<description>Benchmark</description>{}</channel></rss>'
+    ).format(items).encode()
+
+    class SyntheticFeedHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/rss+xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return SyntheticFeedHandler
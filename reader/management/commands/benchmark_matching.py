@@ -0,0 +1,70 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from ... import models, tasks
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare scanning and indexing existing articles when matching them '
+        'with the articles of a synthetic feed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1000, 5000, 20000])
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            existing_articles, parsed_defaults = _get_articles(size)
+
+            start = time.monotonic()
+            _scan(existing_articles, parsed_defaults)
+            scan_duration = time.monotonic() - start
+
+            start = time.monotonic()
+            index = tasks.ObjectIndex(existing_articles, ('id_in_feed',),
+                                      tasks.ARTICLE_COMPARED_FIELDS)
+            for id_in_feed, defaults in parsed_defaults:
+                index.is_unchanged(defaults, id_in_feed=id_in_feed)
+            index_duration = time.monotonic() - start
+
+            self.stdout.write(
+                '{} articles: scan {:.3f}s, index {:.3f}s'.format(
+                    size, scan_duration, index_duration
+                )
+            )
+
+
+def _scan(existing_articles, parsed_defaults):
+    """Matching as done before existing objects were indexed."""
+    for id_in_feed, defaults in parsed_defaults:
+        for candidate in existing_articles:
+            if tasks._is_object_equivalent(candidate,
+                                           {'id_in_feed': id_in_feed}):
+                tasks._is_object_equivalent(candidate, defaults)
+                break
+
+
+def _get_articles(size: int):
+    feed = models.Feed(id=1, name='Synthetic feed')
+    published_at = now()
+    existing_articles = list()
+    parsed_defaults = list()
+    for i in range(size):
+        defaults = {
+            'uri': 'https://example.com/{}'.format(i),
+            'title': 'Article {}'.format(i),
+            'content': 'Lorem ipsum {} '.format(i) * 50,
+            'published_at': published_at - timedelta(hours=i),
+            'updated_at': None
+        }
+        existing_articles.append(
+            models.Article(id=i, feed=feed, id_in_feed=str(i), **defaults)
+        )
+        parsed_defaults.append((str(i), dict(defaults)))
+
+    return existing_articles, parsed_defaults
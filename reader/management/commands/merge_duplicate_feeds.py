@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ... import models, tasks
+
+
+class Command(BaseCommand):
+    help = 'Merge feeds whose URIs point to the same feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the duplicates')
+
+    def handle(self, *args, **options):
+        canonical_uris = (
+            models.Feed.objects.values('canonical_uri')
+            .annotate(num_feeds=Count('id'))
+            .filter(num_feeds__gt=1)
+            .values_list('canonical_uri', flat=True)
+        )
+
+        num_merged = 0
+        for canonical_uri in canonical_uris:
+            # The oldest feed survives, it has the longest history
+            survivor, *duplicates = (
+                models.Feed.objects.filter(canonical_uri=canonical_uri)
+                .order_by('id')
+            )
+            for duplicate in duplicates:
+                self.stdout.write('Merging {} into {}'.format(
+                    duplicate.uri, survivor.uri
+                ))
+                if not options['dry_run']:
+                    tasks.merge_feeds(duplicate.id, survivor.id)
+                num_merged += 1
+
+        self.stdout.write('Found {} duplicate feeds'.format(num_merged))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+
+from ... import inbox, models
+
+
+class Command(BaseCommand):
+    help = 'Copy the articles of subscribed feeds in the inbox of readers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('reader_ids', type=int, nargs='*',
+                            help='Readers to rebuild, all readers by default')
+
+    def handle(self, *args, **options):
+        if not inbox.is_enabled():
+            raise CommandError('READER_INBOX_ENABLED is not set')
+
+        subscriptions = models.Subscription.objects.order_by('id')
+        entries = models.InboxEntry.objects.all()
+        if options['reader_ids']:
+            subscriptions = subscriptions.filter(
+                reader_id__in=options['reader_ids']
+            )
+            entries = entries.filter(reader_id__in=options['reader_ids'])
+
+        # Entries of feeds readers unsubscribed from
+        subscribed = models.Subscription.objects.filter(
+            reader=OuterRef('reader'), feed=OuterRef('article__feed')
+        )
+        num_removed, _ = (
+            entries.annotate(subscribed=Exists(subscribed))
+            .filter(subscribed=False)
+            .delete()
+        )
+
+        num_subscriptions = 0
+        for num_subscriptions, subscription in enumerate(
+                subscriptions.iterator(chunk_size=200), 1):
+            inbox.add_subscription(subscription)
+
+        self.stdout.write(
+            'Rebuilt the inbox of {} subscriptions, removed {} entries'.format(
+                num_subscriptions, num_removed
+            )
+        )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from ... import feed_stats, models
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized stats of feeds from the real tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed_ids', type=int, nargs='*',
+                            help='Feeds to reconcile, all feeds by default')
+
+    def handle(self, *args, **options):
+        feeds = models.Feed.objects.select_related('stats').order_by('id')
+        if options['feed_ids']:
+            feeds = feeds.filter(id__in=options['feed_ids'])
+
+        num_drifted = 0
+        num_feeds = 0
+        for num_feeds, feed in enumerate(feeds.iterator(chunk_size=200), 1):
+            before = _get_counters(feed)
+            feed_stats.reconcile(feed)
+            after = _get_counters(feed)
+            if before != after:
+                num_drifted += 1
+                self.stdout.write('Feed {}: {} -> {}'.format(
+                    feed.id, before, after
+                ))
+
+        self.stdout.write('Reconciled {} feeds, {} had drifted'.format(
+            num_feeds, num_drifted
+        ))
+
+
+def _get_counters(feed: models.Feed):
+    try:
+        stats = feed.stats
+    except models.FeedStats.DoesNotExist:
+        return None
+
+    return (stats.article_count, stats.subscriber_count,
+            stats.articles_in_window, stats.oldest_in_window)
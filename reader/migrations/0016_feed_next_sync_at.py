@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0015_feed_is_sync_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
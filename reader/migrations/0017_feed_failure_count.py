@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0016_feed_next_sync_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='failure_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0017_feed_failure_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='etag',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='fetch_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_modified',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='not_modified_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:04
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0018_feed_http_validators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='skip_days',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=10), blank=True, default=list, size=7),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='skip_hours',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(), blank=True, default=list, size=24),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='ttl',
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
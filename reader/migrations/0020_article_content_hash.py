@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0019_feed_sync_hints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='content_hash',
+            field=models.BinaryField(blank=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0020_article_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='head_hash',
+            field=models.BinaryField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='head_id_in_feed',
+            field=models.CharField(blank=True, max_length=400),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='head_published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_full_sync_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0021_feed_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='last_sync_articles',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_sync_bytes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_sync_duration',
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
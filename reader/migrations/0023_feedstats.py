@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0022_feed_sync_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedStats',
+            fields=[
+                ('feed', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='reader.Feed')),
+                ('article_count', models.IntegerField(default=0)),
+                ('subscriber_count', models.IntegerField(default=0)),
+                ('articles_in_window', models.IntegerField(default=0)),
+                ('oldest_in_window', models.DateTimeField(blank=True, null=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
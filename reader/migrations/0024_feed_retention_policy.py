@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0023_feedstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='retention_max_age',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='retention_max_articles',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:18
+
+from django.db import migrations, models
+
+from reader.utils import canonicalize_uri
+
+
+def fill_canonical_uris(apps, schema_editor):
+    Feed = apps.get_model('reader', 'Feed')
+    for feed in Feed.objects.only('id', 'uri').iterator():
+        Feed.objects.filter(id=feed.id).update(
+            canonical_uri=canonicalize_uri(feed.uri)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0024_feed_retention_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='canonical_uri',
+            field=models.URLField(blank=True, db_index=True, editable=False, max_length=2048),
+        ),
+        migrations.RunPython(fill_canonical_uris, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Each subscription is read up to its oldest unread article, articles read
+# after it become exceptions
+CONVERT_READ_ARTICLES_SQL = [
+    """
+    UPDATE reader_subscription s SET read_up_to_id = COALESCE(
+        (
+            SELECT MIN(a.id) - 1 FROM reader_article a
+            WHERE a.feed_id = s.feed_id AND NOT EXISTS (
+                SELECT 1 FROM reader_readerprofile_read r
+                WHERE r.article_id = a.id AND r.readerprofile_id = s.reader_id
+            )
+        ),
+        (SELECT MAX(a.id) FROM reader_article a WHERE a.feed_id = s.feed_id)
+    )
+    """,
+    """
+    INSERT INTO reader_readstateexception (reader_id, article_id, is_read)
+    SELECT r.readerprofile_id, r.article_id, true
+    FROM reader_readerprofile_read r
+    JOIN reader_article a ON a.id = r.article_id
+    LEFT JOIN reader_subscription s
+        ON s.reader_id = r.readerprofile_id AND s.feed_id = a.feed_id
+    WHERE s.read_up_to_id IS NULL OR r.article_id > s.read_up_to_id
+    """,
+]
+
+RESTORE_READ_ARTICLES_SQL = [
+    """
+    INSERT INTO reader_readerprofile_read (readerprofile_id, article_id)
+    SELECT s.reader_id, a.id
+    FROM reader_subscription s
+    JOIN reader_article a
+        ON a.feed_id = s.feed_id AND a.id <= s.read_up_to_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM reader_readstateexception e
+        WHERE e.reader_id = s.reader_id AND e.article_id = a.id
+        AND NOT e.is_read
+    )
+    UNION
+    SELECT reader_id, article_id FROM reader_readstateexception
+    WHERE is_read
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0025_feed_canonical_uri'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='read_up_to_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReadStateException',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_read', models.BooleanField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reader.Article')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reader.ReaderProfile')),
+            ],
+            options={
+                'unique_together': {('reader', 'article')},
+            },
+        ),
+        migrations.RunSQL(CONVERT_READ_ARTICLES_SQL,
+                          reverse_sql=RESTORE_READ_ARTICLES_SQL),
+        migrations.RemoveField(
+            model_name='readerprofile',
+            name='read',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0026_read_state_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['feed', '-published_at', '-created_at', '-id'], name='reader_arti_feed_id_ce6431_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0027_article_pagination_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('is_read', models.BooleanField(default=False)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reader.Article')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reader.ReaderProfile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['reader', '-published_at', '-created_at', '-article'], name='reader_inbox_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(condition=models.Q(is_read=False), fields=['reader', '-published_at', '-created_at', '-article'], name='reader_inbox_unread_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='inboxentry',
+            unique_together={('reader', 'article')},
+        ),
+    ]
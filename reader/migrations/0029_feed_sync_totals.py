@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:52
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0028_inbox_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='total_sync_articles',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='total_sync_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='total_sync_duration',
+            field=models.DurationField(default=datetime.timedelta),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:54
+
+from django.db import migrations
+
+# Feeds existing before stats were introduced get their article count in one
+# aggregate. Stats are left unreconciled, the other counters are computed
+# the first time they are read.
+CREATE_MISSING_STATS_SQL = """
+    INSERT INTO reader_feedstats (feed_id, article_count, subscriber_count,
+                                  articles_in_window)
+    SELECT f.id, COUNT(a.id), 0, 0
+    FROM reader_feed f
+    LEFT JOIN reader_article a ON a.feed_id = f.id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM reader_feedstats s WHERE s.feed_id = f.id
+    )
+    GROUP BY f.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0029_feed_sync_totals'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_MISSING_STATS_SQL,
+                          reverse_sql=migrations.RunSQL.noop),
+    ]
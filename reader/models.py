@@ -1,3 +1,4 @@
+from datetime import timedelta
 from typing import Optional
 from urllib.parse import urlsplit
 from uuid import uuid4
@@ -11,6 +12,7 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.template.defaultfilters import filesizeformat
 
+from .utils import canonicalize_uri
 from .validators import http_port_validator
 
 
@@ -26,17 +28,96 @@ class Feed(models.Model):
         validators=[URLValidator(schemes=['http', 'https']),
                     http_port_validator]
     )
+    # Same for all the URIs pointing to the same feed, see
+    # utils.canonicalize_uri
+    canonical_uri = models.URLField(max_length=URI_MAX_LENGTH, db_index=True,
+                                    blank=True, null=False, editable=False)
     last_fetched_at = models.DateTimeField(null=True, blank=True)
     last_hash = models.BinaryField(max_length=20, null=True, blank=True)
+    etag = models.TextField(blank=True, null=False)
+    last_modified = models.TextField(blank=True, null=False)
+    fetch_count = models.PositiveIntegerField(default=0)
+    not_modified_count = models.PositiveIntegerField(default=0)
     last_failure = models.TextField(blank=True, null=False)
+    failure_count = models.PositiveIntegerField(default=0)
     frequency_per_year = models.IntegerField(null=True, blank=True)
     is_sync_enabled = models.BooleanField(null=False, default=True)
+    next_sync_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    ttl = models.DurationField(null=True, blank=True)
+    skip_hours = ArrayField(
+        models.PositiveSmallIntegerField(),
+        default=list,
+        blank=True,
+        null=False,
+        size=24,
+    )
+    skip_days = ArrayField(
+        models.CharField(max_length=10),
+        default=list,
+        blank=True,
+        null=False,
+        size=7,
+    )
+    # Newest article seen, where incremental synchronizations stop
+    head_id_in_feed = models.CharField(max_length=400, blank=True, null=False)
+    head_published_at = models.DateTimeField(null=True, blank=True)
+    head_hash = models.BinaryField(max_length=20, null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    # Retention policy, the defaults from settings apply when not set
+    retention_max_articles = models.PositiveIntegerField(null=True, blank=True)
+    retention_max_age = models.DurationField(null=True, blank=True)
+    # Cost of the last synchronization that processed articles, including
+    # the remainders of a capped synchronization
+    last_sync_articles = models.PositiveIntegerField(default=0)
+    last_sync_bytes = models.PositiveIntegerField(default=0)
+    last_sync_duration = models.DurationField(null=True, blank=True)
+    # Running totals of the same costs over all synchronizations
+    total_sync_articles = models.BigIntegerField(default=0)
+    total_sync_bytes = models.BigIntegerField(default=0)
+    total_sync_duration = models.DurationField(default=timedelta)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ('created_at',)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered to notice when synchronization gets enabled again
+        if 'is_sync_enabled' in field_names:
+            instance._was_sync_enabled = instance.is_sync_enabled
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.canonical_uri = canonicalize_uri(self.uri)
+        extra_fields = set()
+        if 'uri' in (kwargs.get('update_fields') or ()):
+            extra_fields.add('canonical_uri')
+
+        was_sync_enabled = getattr(self, '_was_sync_enabled', True)
+        if self.is_sync_enabled and not was_sync_enabled:
+            # Give the feed a fresh start, otherwise the next failure would
+            # disable it again right away
+            self.failure_count = 0
+            self.last_failure = ''
+            self.next_sync_at = None
+            extra_fields |= {'failure_count', 'last_failure', 'next_sync_at'}
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and extra_fields:
+            kwargs['update_fields'] = set(update_fields) | extra_fields
+        super().save(*args, **kwargs)
+        self._was_sync_enabled = self.is_sync_enabled
+
+    @property
+    def not_modified_rate(self) -> Optional[float]:
+        """Ratio of fetches answered by an HTTP 304."""
+        if not self.fetch_count:
+            return None
+
+        return self.not_modified_count / self.fetch_count
+
     @property
     def domain(self):
         domain = urlsplit(self.uri).netloc
@@ -48,6 +129,24 @@ class Feed(models.Model):
         return 'Feed {} {}: {}'.format(self.pk, self.name, self.uri)
 
 
+class FeedStats(models.Model):
+    """Counters of a feed kept up to date instead of aggregated on demand.
+
+    Articles in the window are the ones published during the last year, the
+    window is recomputed when its oldest article leaves it.
+    """
+    feed = models.OneToOneField(Feed, models.CASCADE, primary_key=True,
+                                related_name='stats')
+    article_count = models.IntegerField(default=0)
+    subscriber_count = models.IntegerField(default=0)
+    articles_in_window = models.IntegerField(default=0)
+    oldest_in_window = models.DateTimeField(null=True, blank=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return 'Stats of feed {}'.format(self.feed_id)
+
+
 class Article(models.Model):
     id_in_feed = models.CharField(max_length=400)
     uri = models.URLField(max_length=URI_MAX_LENGTH, blank=True, null=False)
@@ -55,6 +154,7 @@ class Article(models.Model):
     content = models.TextField(blank=True, null=False)
     published_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(null=True, blank=True)
+    content_hash = models.BinaryField(max_length=20, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     feed = models.ForeignKey(Feed, models.CASCADE)
@@ -65,6 +165,9 @@ class Article(models.Model):
         indexes = [
             # Index to speed up calculating frequency per year
             models.Index(fields=['feed', 'published_at']),
+            # Index matching the order of pages of articles
+            models.Index(fields=['feed', '-published_at', '-created_at',
+                                 '-id']),
         ]
 
     def __str__(self):
@@ -103,7 +206,6 @@ class ReaderProfile(models.Model):
                                    through='Subscription')
     stars = models.ManyToManyField(Article, related_name='stared_by',
                                    blank=True)
-    read = models.ManyToManyField(Article, related_name='read_by', blank=True)
 
     def __str__(self):
         return 'ReadProfile of {}'.format(self.user)
@@ -120,11 +222,45 @@ class Subscription(models.Model):
         null=False,
         size=100,
     )
+    # Articles of the feed up to this id are read, see read_state
+    read_up_to_id = models.IntegerField(null=True, blank=True)
 
     class Meta:
         unique_together = ('reader', 'feed')
 
 
+class ReadStateException(models.Model):
+    """Article read or unread against the watermark of its subscription."""
+    reader = models.ForeignKey(ReaderProfile, on_delete=models.CASCADE)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    is_read = models.BooleanField()
+
+    class Meta:
+        unique_together = ('reader', 'article')
+
+
+class InboxEntry(models.Model):
+    """Article of a subscribed feed copied in the timeline of a reader."""
+    reader = models.ForeignKey(ReaderProfile, on_delete=models.CASCADE)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    # Copies of the article dates, to sort the timeline with an index
+    published_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('reader', 'article')
+        indexes = [
+            models.Index(fields=['reader', '-published_at', '-created_at',
+                                 '-article'],
+                         name='reader_inbox_timeline_idx'),
+            models.Index(fields=['reader', '-published_at', '-created_at',
+                                 '-article'],
+                         name='reader_inbox_unread_idx',
+                         condition=models.Q(is_read=False)),
+        ]
+
+
 class Board(models.Model):
     name = models.CharField(_('name'), max_length=100)
     reader = models.ForeignKey(ReaderProfile, on_delete=models.CASCADE)
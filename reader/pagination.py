@@ -0,0 +1,192 @@
+"""Paginate articles with a cursor instead of an offset.
+
+The OFFSET of a deep page forces the database to read and throw away every
+article of the previous pages, and Django's paginator counts all the
+articles on each page view to know the number of pages. Users with a large
+backlog page through hundreds of pages.
+
+Articles are ordered newest first by (published_at, created_at, id), a page
+is the articles following or preceding the cursor of the last or first
+article of the page currently displayed. Only "newer" and "older" links can
+be offered, the total number of pages is never known.
+
+Articles without a publication date come first, like PostgreSQL sorts NULLs
+in a descending order.
+
+Inbox entries copy the dates of their article, they are paginated the same
+way with the id of their article as last key.
+
+Comparing keys is a disjunction that the database cannot use to walk the
+index, a redundant bound on the leading key is added when there is one so
+that the scan starts at the cursor instead of the first article of the feed.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import attr
+from django.db.models import F, Q, QuerySet
+from django.http import Http404
+
+Key = Tuple[Optional[datetime], datetime, int]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def newest_first(id_field: str='id') -> tuple:
+    return (
+        F('published_at').desc(nulls_first=True),
+        F('created_at').desc(),
+        F(id_field).desc()
+    )
+
+
+def oldest_first(id_field: str='id') -> tuple:
+    return (
+        F('published_at').asc(nulls_last=True),
+        F('created_at').asc(),
+        F(id_field).asc()
+    )
+
+
+@attr.s
+class Page:
+    object_list: list = attr.ib()
+    newer_cursor: Optional[str] = attr.ib()
+    older_cursor: Optional[str] = attr.ib()
+
+    def has_other_pages(self) -> bool:
+        return bool(self.newer_cursor or self.older_cursor)
+
+
+def _to_timestamp(date: datetime) -> str:
+    return str((date - EPOCH) // timedelta(microseconds=1))
+
+
+def _from_timestamp(value: str) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def encode_cursor(article, id_field: str='id') -> str:
+    published_at = ''
+    if article.published_at is not None:
+        published_at = _to_timestamp(article.published_at)
+
+    return '{}.{}.{}'.format(
+        published_at, _to_timestamp(article.created_at),
+        getattr(article, id_field)
+    )
+
+
+def decode_cursor(cursor: str) -> Key:
+    """Decode a cursor.
+
+    Raises ValueError when it is malformed and OverflowError when its dates
+    are out of range.
+    """
+    published_at, created_at, article_id = cursor.split('.')
+    return (
+        _from_timestamp(published_at) if published_at else None,
+        _from_timestamp(created_at),
+        int(article_id)
+    )
+
+
+def _older_than(key: Key, id_field: str='id') -> Q:
+    published_at, created_at, article_id = key
+    older_creation = Q(created_at__lt=created_at)
+    same_creation = Q(created_at=created_at,
+                      **{id_field + '__lt': article_id})
+    older_on_same_date = older_creation | same_creation
+    if published_at is None:
+        unpublished = Q(published_at__isnull=True) & older_on_same_date
+        return unpublished | Q(published_at__isnull=False)
+
+    same_date = Q(published_at=published_at) & older_on_same_date
+    older = Q(published_at__lt=published_at) | same_date
+    return Q(published_at__lte=published_at) & older
+
+
+def _newer_than(key: Key, id_field: str='id') -> Q:
+    published_at, created_at, article_id = key
+    newer_creation = Q(created_at__gt=created_at)
+    same_creation = Q(created_at=created_at,
+                      **{id_field + '__gt': article_id})
+    newer_on_same_date = newer_creation | same_creation
+    if published_at is None:
+        unpublished = Q(published_at__isnull=True, created_at__gte=created_at)
+        return unpublished & newer_on_same_date
+
+    same_date = Q(published_at=published_at) & newer_on_same_date
+    newer = Q(published_at__gt=published_at) | Q(published_at__isnull=True)
+    return newer | same_date
+
+
+def paginate(queryset: QuerySet, page_size: int,
+             after: Optional[str]=None, before: Optional[str]=None,
+             id_field: str='id') -> Page:
+    """Get the page of articles older than `after` or newer than `before`.
+
+    Without cursor the first page, with the newest articles, is returned.
+    Each page is a single query fetching one more article than the page
+    size to know if there is a page after it.
+    """
+    try:
+        after_key = decode_cursor(after) if after else None
+        before_key = decode_cursor(before) if before else None
+    except (ValueError, OverflowError):
+        raise Http404('Invalid cursor')
+
+    if before_key is not None:
+        articles = _get_articles(
+            queryset.filter(_newer_than(before_key, id_field))
+            .order_by(*oldest_first(id_field)),
+            page_size
+        )
+        if len(articles) <= page_size:
+            # Reached the newest articles, show a full first page instead
+            return paginate(queryset, page_size, id_field=id_field)
+
+        articles = list(reversed(articles[:page_size]))
+        return Page(articles, encode_cursor(articles[0], id_field),
+                    encode_cursor(articles[-1], id_field))
+
+    has_newer = after_key is not None
+    if has_newer:
+        queryset = queryset.filter(_older_than(after_key, id_field))
+
+    articles = _get_articles(queryset.order_by(*newest_first(id_field)),
+                             page_size)
+    has_older = len(articles) > page_size
+    articles = articles[:page_size]
+    if not articles:
+        # The articles following the cursor are gone, link back to the newer
+        # ones
+        return Page(articles, after, None)
+
+    return Page(
+        articles,
+        encode_cursor(articles[0], id_field) if has_newer else None,
+        encode_cursor(articles[-1], id_field) if has_older else None
+    )
+
+
+def _get_articles(queryset: QuerySet, page_size: int) -> List:
+    return list(queryset[:page_size + 1])
+
+
+class KeysetPaginationMixin:
+    """Replace the paginator of a ListView of articles by cursors."""
+    cursor_id_field = 'id'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate(
+            queryset, page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+            id_field=self.cursor_id_field
+        )
+        object_list = self.get_page_articles(page.object_list)
+        return None, page, object_list, page.has_other_pages()
+
+    def get_page_articles(self, object_list):
+        return object_list
@@ -0,0 +1,147 @@
+"""Limit the pressure put on each remote host.
+
+Feeds and images are fetched concurrently by many workers in different
+processes, many feeds are hosted on the same few platforms. Each host gets a
+token bucket limiting its request rate as well as a cap on the number of
+concurrent requests. The state is kept in Redis so that limits are shared by
+all workers.
+
+Slots taken by a request expire on their own so that a crashed worker cannot
+block a host forever.
+"""
+from contextlib import contextmanager
+from logging import getLogger
+import time
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+from redis import RedisError
+
+from .settings import (
+    READER_REDIS, READER_HOST_RATE, READER_HOST_BURST,
+    READER_HOST_MAX_CONCURRENCY
+)
+
+# A slot outlives the longest possible request, see http_fetcher.TIMEOUT
+SLOT_TTL = 120
+
+# Seconds to wait before retrying when all slots of a host are taken
+CONCURRENCY_RETRY_AFTER = 5
+
+logger = getLogger(__name__)
+
+# Take a slot for a host if both its bucket has a token left and it has fewer
+# concurrent requests than allowed. Returns whether a slot was taken and when
+# to retry otherwise.
+ACQUIRE_SCRIPT = READER_REDIS.register_script("""
+local bucket_key = KEYS[1]
+local slots_key = KEYS[2]
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local max_concurrency = tonumber(ARGV[4])
+local slot_id = ARGV[5]
+local slot_ttl = tonumber(ARGV[6])
+local concurrency_retry_after = ARGV[7]
+
+redis.call('ZREMRANGEBYSCORE', slots_key, '-inf', now)
+if redis.call('ZCARD', slots_key) >= max_concurrency then
+    return {0, concurrency_retry_after}
+end
+
+local bucket = redis.call('HMGET', bucket_key, 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+if tokens < 1 then
+    return {0, tostring((1 - tokens) / rate)}
+end
+
+redis.call('HSET', bucket_key, 'tokens', tostring(tokens - 1),
+           'updated_at', tostring(now))
+redis.call('EXPIRE', bucket_key, math.ceil(burst / rate) + 1)
+redis.call('ZADD', slots_key, now + slot_ttl, slot_id)
+redis.call('EXPIRE', slots_key, slot_ttl)
+return {1, '0'}
+""")
+
+
+class HostRateLimitedError(Exception):
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(
+            'Host {} is over its limit, retry in {:.1f}s'.format(
+                host, retry_after
+            )
+        )
+        self.host = host
+        self.retry_after = retry_after
+
+
+def get_host(uri: str) -> str:
+    return urlsplit(uri).netloc.lower()
+
+
+def _bucket_key(host: str) -> str:
+    return 'reader_host_bucket_{}'.format(host)
+
+
+def _slots_key(host: str) -> str:
+    return 'reader_host_slots_{}'.format(host)
+
+
+@contextmanager
+def host_slot(uri: str):
+    """Hold one of the request slots of the host serving an URI.
+
+    Raises HostRateLimitedError when the host is over its limits. When Redis
+    is not available requests are let through rather than failed.
+    """
+    host = get_host(uri)
+    slot_id = uuid4().hex
+    try:
+        acquired, retry_after = ACQUIRE_SCRIPT(
+            keys=[_bucket_key(host), _slots_key(host)],
+            args=[time.time(), READER_HOST_RATE, READER_HOST_BURST,
+                  READER_HOST_MAX_CONCURRENCY, slot_id, SLOT_TTL,
+                  CONCURRENCY_RETRY_AFTER]
+        )
+    except RedisError as e:
+        logger.warning('Could not get a slot for host %s: %s', host, e)
+        acquired, retry_after, slot_id = True, 0, None
+
+    if not acquired:
+        raise HostRateLimitedError(host, float(retry_after))
+
+    try:
+        yield
+    finally:
+        if slot_id is not None:
+            _release_slot(host, slot_id)
+
+
+def _release_slot(host: str, slot_id: str):
+    try:
+        READER_REDIS.zrem(_slots_key(host), slot_id)
+    except RedisError as e:
+        logger.warning('Could not release slot of host %s: %s', host, e)
+
+
+def get_host_state(host: str) -> dict:
+    """Current state of the limiter of a host, for display purpose."""
+    now = time.time()
+    tokens, updated_at = READER_REDIS.hmget(_bucket_key(host),
+                                            'tokens', 'updated_at')
+    if tokens is None:
+        tokens = READER_HOST_BURST
+    else:
+        tokens = min(
+            READER_HOST_BURST,
+            float(tokens) + max(0, now - float(updated_at)) * READER_HOST_RATE
+        )
+    active_requests = READER_REDIS.zcount(_slots_key(host), now, '+inf')
+    return {
+        'tokens': tokens,
+        'active_requests': active_requests,
+        'max_concurrency': READER_HOST_MAX_CONCURRENCY,
+    }
@@ -0,0 +1,258 @@
+"""Keep track of the articles each reader has read.
+
+Storing one row per read article makes the table grow as readers times
+articles. Instead each subscription has a watermark: articles of the feed
+with an id up to it are read. Ids grow with the insertion of articles so the
+watermark moves forward when a reader marks a whole feed as read.
+
+Articles read or unread out of order are exceptions to the watermark:
+- a read article above the watermark, or of a feed the reader is not
+  subscribed to
+- an unread article below the watermark
+
+Marking many articles as read is done with set-based statements in the
+database, articles are never loaded in Python.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from django.db import connection
+from django.db.models import (
+    BooleanField, Case, Exists, OuterRef, Q, QuerySet, Subquery, Value, When
+)
+from django.db.models.functions import Greatest
+
+from . import models
+from .settings import READER_INBOX_ENABLED
+
+# Number of read exceptions inserted by a single statement
+BATCH_SIZE = 5000
+
+
+def annotate_is_read(queryset: QuerySet, reader) -> QuerySet:
+    """Annotate articles with whether a reader has read them."""
+    exceptions = models.ReadStateException.objects.filter(
+        reader=reader, article=OuterRef('id')
+    )
+    return queryset.annotate(
+        read_by_watermark=Exists(_get_covering_subscriptions(reader)),
+        read_exception=Exists(exceptions.filter(is_read=True)),
+        unread_exception=Exists(exceptions.filter(is_read=False)),
+    ).annotate(
+        is_read=Case(
+            When(read_exception=True, then=Value(True)),
+            When(read_by_watermark=True, unread_exception=False,
+                 then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        )
+    )
+
+
+def filter_unread(queryset: QuerySet, reader) -> QuerySet:
+    return annotate_is_read(queryset, reader).filter(is_read=False)
+
+
+def set_read(reader, article: models.Article, is_read: bool):
+    """Mark a single article as read or unread."""
+    read_by_watermark = models.Subscription.objects.filter(
+        reader=reader, feed_id=article.feed_id,
+        read_up_to_id__gte=article.id
+    ).exists()
+    if read_by_watermark == is_read:
+        models.ReadStateException.objects.filter(
+            reader=reader, article=article
+        ).delete()
+    else:
+        models.ReadStateException.objects.update_or_create(
+            reader=reader, article=article, defaults={'is_read': is_read}
+        )
+    _update_inbox(reader, is_read, article=article)
+
+
+def mark_feeds_read(reader, feed_ids: Iterable[int],
+                    before: Optional[datetime]=None):
+    """Mark all the articles of subscribed feeds as read.
+
+    Watermarks are moved to the newest article of each feed, or to the newest
+    article received before a date, exceptions they now cover are not needed
+    anymore. A watermark never moves backward.
+    """
+    feed_ids = list(feed_ids)
+    newest_articles = models.Article.objects.filter(feed=OuterRef('feed'))
+    if before is not None:
+        newest_articles = newest_articles.filter(created_at__lt=before)
+    newest_article_id = newest_articles.order_by('-id').values('id')[:1]
+    # GREATEST ignores NULLs in PostgreSQL
+    models.Subscription.objects.filter(
+        reader=reader, feed_id__in=feed_ids
+    ).update(read_up_to_id=Greatest('read_up_to_id',
+                                    Subquery(newest_article_id)))
+
+    watermark = (
+        models.Subscription.objects
+        .filter(reader=reader, feed=OuterRef('article__feed'))
+        .values('read_up_to_id')[:1]
+    )
+    covered_exceptions = models.ReadStateException.objects.filter(
+        reader=reader, article__feed_id__in=feed_ids,
+        article_id__lte=Subquery(watermark)
+    )
+    inbox_filters = dict(article__feed_id__in=feed_ids,
+                         article_id__lte=Subquery(watermark))
+    if before is not None:
+        # Articles received after the date keep being unread
+        received_before = Q(article__created_at__lt=before)
+        covered_exceptions = covered_exceptions.filter(
+            Q(is_read=True) | received_before
+        )
+        inbox_filters['created_at__lt'] = before
+    covered_exceptions.delete()
+    _update_inbox(reader, True, **inbox_filters)
+
+
+def mark_articles_read(reader, articles: QuerySet,
+                       before: Optional[datetime]=None):
+    """Mark articles as read without moving watermarks.
+
+    Read exceptions are inserted by batches straight from the articles
+    query with INSERT ... SELECT.
+    """
+    if before is not None:
+        articles = articles.filter(created_at__lt=before)
+
+    models.ReadStateException.objects.filter(
+        reader=reader, article__in=articles.values('id'), is_read=False
+    ).delete()
+    _update_inbox(reader, True, article__in=articles.values('id'))
+
+    unread_articles = (
+        articles.annotate(
+            read_by_watermark=Exists(_get_covering_subscriptions(reader))
+        )
+        .filter(read_by_watermark=False)
+        .order_by()
+        .values('id')
+    )
+    articles_sql, articles_params = unread_articles.query.sql_with_params()
+
+    opts = models.ReadStateException._meta
+    quote = connection.ops.quote_name
+    sql = (
+        'WITH batch AS ('
+        '  SELECT id FROM ({articles}) AS articles'
+        '  WHERE id > %s ORDER BY id LIMIT %s'
+        '), inserted AS ('
+        '  INSERT INTO {table} ({reader}, {article}, {is_read})'
+        '  SELECT %s, id, TRUE FROM batch'
+        '  ON CONFLICT ({reader}, {article}) DO NOTHING'
+        ') '
+        'SELECT MAX(id) FROM batch'
+    ).format(
+        articles=articles_sql,
+        table=quote(opts.db_table),
+        reader=quote(opts.get_field('reader').column),
+        article=quote(opts.get_field('article').column),
+        is_read=quote(opts.get_field('is_read').column)
+    )
+
+    last_id = 0
+    with connection.cursor() as cursor:
+        while last_id is not None:
+            cursor.execute(
+                sql, tuple(articles_params) + (last_id, BATCH_SIZE, reader.id)
+            )
+            last_id = cursor.fetchone()[0]
+
+
+def merge_feeds(duplicate_id: int, survivor_id: int,
+                article_mapping: Dict[int, int]):
+    """Carry the read state of a duplicate feed over to its survivor.
+
+    Articles moved to the survivor keep their ids, watermarks of the
+    duplicate still apply to them: subscriptions keep theirs or raise the
+    one of the survivor. Articles both feeds have, mapped from the duplicate
+    to the survivor, are read if either was read. They get exceptions where
+    this differs from the resulting watermark, in a single statement for all
+    readers.
+
+    Must run before subscriptions of the duplicate are merged.
+    """
+    if not article_mapping:
+        return
+
+    subscription_table = models.Subscription._meta.db_table
+    exception_table = models.ReadStateException._meta.db_table
+    sql = """
+        WITH mapping AS (
+            SELECT * FROM unnest(%(duplicate_ids)s::integer[],
+                                 %(survivor_ids)s::integer[])
+                AS m (duplicate_id, survivor_id)
+        ), watermarks AS (
+            SELECT reader_id,
+                MAX(read_up_to_id) FILTER (WHERE feed_id = %(duplicate)s)
+                    AS duplicate_watermark,
+                MAX(read_up_to_id) FILTER (WHERE feed_id = %(survivor)s)
+                    AS survivor_watermark,
+                MAX(read_up_to_id) AS merged_watermark
+            FROM {subscription}
+            WHERE feed_id IN (%(duplicate)s, %(survivor)s)
+            GROUP BY reader_id
+        ), readers AS (
+            SELECT reader_id FROM watermarks
+            UNION
+            SELECT e.reader_id FROM {exception} e JOIN mapping m
+                ON e.article_id IN (m.duplicate_id, m.survivor_id)
+        ), states AS (
+            SELECT r.reader_id, m.survivor_id AS article_id,
+                COALESCE(ed.is_read, m.duplicate_id <= w.duplicate_watermark,
+                         FALSE)
+                OR COALESCE(es.is_read, m.survivor_id <= w.survivor_watermark,
+                            FALSE) AS is_read,
+                COALESCE(m.survivor_id <= w.merged_watermark, FALSE)
+                    AS read_by_watermark
+            FROM readers r CROSS JOIN mapping m
+            LEFT JOIN watermarks w ON w.reader_id = r.reader_id
+            LEFT JOIN {exception} ed
+                ON ed.reader_id = r.reader_id
+                AND ed.article_id = m.duplicate_id
+            LEFT JOIN {exception} es
+                ON es.reader_id = r.reader_id
+                AND es.article_id = m.survivor_id
+        ), covered AS (
+            DELETE FROM {exception} e USING states s
+            WHERE e.reader_id = s.reader_id AND e.article_id = s.article_id
+            AND s.is_read = s.read_by_watermark
+        )
+        INSERT INTO {exception} (reader_id, article_id, is_read)
+        SELECT reader_id, article_id, is_read FROM states
+        WHERE is_read <> read_by_watermark
+        ON CONFLICT (reader_id, article_id)
+        DO UPDATE SET is_read = EXCLUDED.is_read
+    """.format(
+        subscription=connection.ops.quote_name(subscription_table),
+        exception=connection.ops.quote_name(exception_table)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'duplicate_ids': list(article_mapping.keys()),
+            'survivor_ids': list(article_mapping.values()),
+            'duplicate': duplicate_id,
+            'survivor': survivor_id
+        })
+
+
+def _get_covering_subscriptions(reader) -> QuerySet:
+    """Subscriptions whose watermark covers the outer article."""
+    return models.Subscription.objects.filter(
+        reader=reader, feed=OuterRef('feed'),
+        read_up_to_id__gte=OuterRef('id')
+    )
+
+
+def _update_inbox(reader, is_read: bool, **filters):
+    """Keep the copy of the read state in the inbox up to date."""
+    if READER_INBOX_ENABLED:
+        models.InboxEntry.objects.filter(reader=reader, **filters).update(
+            is_read=is_read
+        )
@@ -0,0 +1,119 @@
+"""Remove old articles of feeds according to their retention policy.
+
+A feed keeps at most a number of articles and, optionally, only articles
+younger than a maximum age. Starred articles are always kept.
+
+Retention is enforced right after each synchronization of a feed. Articles
+are deleted in small batches, each in its own transaction, within a time
+budget per feed. When the budget runs out the caller schedules the rest for
+later instead of holding the worker, this keeps transactions short and
+spreads the load on the database over time.
+"""
+from datetime import datetime
+from logging import getLogger
+import time
+from typing import Optional
+
+import attr
+from django.db.models import Q
+
+from . import feed_stats, models
+from .settings import (
+    READER_FEED_ARTICLE_THRESHOLD, READER_FEED_ARTICLE_MAX_AGE,
+    READER_RETENTION_BATCH_SIZE, READER_RETENTION_TIME_BUDGET
+)
+
+logger = getLogger(__name__)
+
+
+@attr.s
+class RetentionResult:
+    num_deleted: int = attr.ib()
+    # False when the time budget ran out before the policy was enforced
+    is_complete: bool = attr.ib()
+
+
+def get_max_articles(feed: models.Feed) -> int:
+    if feed.retention_max_articles is not None:
+        return feed.retention_max_articles
+
+    return READER_FEED_ARTICLE_THRESHOLD
+
+
+def get_max_age(feed: models.Feed):
+    if feed.retention_max_age is not None:
+        return feed.retention_max_age
+
+    return READER_FEED_ARTICLE_MAX_AGE
+
+
+def enforce_retention(feed: models.Feed,
+                      current_date: datetime) -> Optional[RetentionResult]:
+    """Delete articles of a feed exceeding its retention policy.
+
+    Returns None when the feed was within its policy.
+    """
+    max_articles = get_max_articles(feed)
+    max_age = get_max_age(feed)
+    stats = feed_stats.get_feed_stats(feed, current_date)
+    excess = stats.article_count - max_articles
+    if excess <= 0 and max_age is None:
+        return None
+
+    deadline = time.monotonic() + READER_RETENTION_TIME_BUDGET.total_seconds()
+    deletable_articles = feed.article_set.filter(stared_by__isnull=True)
+    num_deleted = 0
+    is_complete = True
+
+    while excess > 0:
+        if time.monotonic() >= deadline:
+            is_complete = False
+            break
+
+        # Oldest articles first, the default ordering is newest first
+        ids = list(
+            deletable_articles.reverse()
+            .values_list('id', flat=True)[:min(excess,
+                                               READER_RETENTION_BATCH_SIZE)]
+        )
+        deleted = _delete_batch(ids)
+        if not deleted:
+            break
+        excess -= deleted
+        num_deleted += deleted
+
+    if max_age is not None:
+        cutoff = current_date - max_age
+        published_too_long_ago = Q(published_at__lt=cutoff)
+        created_too_long_ago = Q(published_at__isnull=True,
+                                 created_at__lt=cutoff)
+        too_old_articles = deletable_articles.filter(
+            published_too_long_ago | created_too_long_ago
+        )
+        while True:
+            if time.monotonic() >= deadline:
+                is_complete = False
+                break
+
+            ids = list(
+                too_old_articles
+                .values_list('id', flat=True)[:READER_RETENTION_BATCH_SIZE]
+            )
+            deleted = _delete_batch(ids)
+            if not deleted:
+                break
+            num_deleted += deleted
+
+    if num_deleted:
+        feed_stats.record_removed_articles(feed, num_deleted, current_date)
+        logger.info('Deleted %d old articles of %s', num_deleted, feed)
+
+    return RetentionResult(num_deleted, is_complete)
+
+
+def _delete_batch(ids) -> int:
+    if not ids:
+        return 0
+
+    _, deleted = models.Article.objects.filter(id__in=ids).delete()
+    return deleted.get('reader.Article', 0)
@@ -0,0 +1,164 @@
+"""Decide when each feed should be synchronized next.
+
+Polling every feed at the same pace wastes a lot of requests: most feeds
+publish a few articles per week while some publish dozens per day. The
+interval between two synchronizations is derived from the observed
+publication rate of the feed, then shortened for feeds read by many users and
+lengthened when the last fetch did not bring anything new. Feeds that fail
+are retried less and less often.
+
+Servers and feeds can also tell when to come back: HTTP caching headers,
+Retry-After and the RSS ttl, skipHours and skipDays elements are honored,
+within reasonable limits.
+"""
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+import math
+import random
+from typing import List, Optional
+
+import attr
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import iterparse, ParseError
+
+from .settings import (
+    READER_SYNC_MIN_INTERVAL, READER_SYNC_MAX_INTERVAL,
+    READER_SYNC_MAX_FAILURE_BACKOFF, READER_SYNC_MAX_HINT_INTERVAL
+)
+
+YEAR = timedelta(days=365)
+
+# Number of fetches made on average between two articles of a feed
+FETCHES_PER_ARTICLE = 4
+
+# Factor applied to the interval when a fetch found nothing new
+UNCHANGED_FACTOR = 2
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday',
+        'Sunday')
+
+# Maximal random deviation applied to the interval to avoid many feeds
+# being synchronized at the exact same time
+JITTER = 0.1
+
+
+def get_sync_interval(frequency_per_year: Optional[int],
+                      subscriber_count: int, has_changed: bool) -> timedelta:
+    """Compute the time to wait before synchronizing a feed again.
+
+    Feeds with an unknown frequency are synchronized as often as allowed
+    until enough articles are known to estimate their publication rate.
+    """
+    if not frequency_per_year:
+        return READER_SYNC_MIN_INTERVAL
+
+    interval = YEAR / (frequency_per_year * FETCHES_PER_ARTICLE)
+
+    # A feed with 10 subscribers is polled twice as often as a feed with a
+    # single one, 100 subscribers three times as often...
+    interval /= 1 + math.log10(max(subscriber_count, 1))
+
+    if not has_changed:
+        interval *= UNCHANGED_FACTOR
+
+    return clamp_interval(interval)
+
+
+def clamp_interval(interval: timedelta) -> timedelta:
+    return max(READER_SYNC_MIN_INTERVAL,
+               min(READER_SYNC_MAX_INTERVAL, interval))
+
+
+def get_failure_backoff(failure_count: int) -> timedelta:
+    """Compute the time to wait before retrying a failing feed.
+
+    The delay doubles with each consecutive failure.
+    """
+    # Prevent overflowing timedelta on feeds failing for a very long time
+    failure_count = min(failure_count, 32)
+    backoff = READER_SYNC_MIN_INTERVAL * 2 ** failure_count
+    return min(READER_SYNC_MAX_FAILURE_BACKOFF, backoff)
+
+
+def get_next_sync_at(current_date: datetime,
+                     interval: timedelta) -> datetime:
+    jitter = interval * random.uniform(-JITTER, JITTER)
+    return current_date + interval + jitter
+
+
+@attr.s
+class FeedHints:
+    ttl: Optional[timedelta] = attr.ib(default=None)
+    skip_hours: List[int] = attr.ib(factory=list)
+    skip_days: List[str] = attr.ib(factory=list)
+
+
+def parse_feed_hints(content: bytes) -> FeedHints:
+    """Read the RSS ttl, skipHours and skipDays elements of a feed.
+
+    These elements belong to the channel and are almost always placed before
+    the items, parsing stops at the first item to avoid reading the whole
+    document a second time. Documents that are not XML give no hints.
+    """
+    hints = FeedHints()
+    parent = None
+    try:
+        for event, element in iterparse(BytesIO(content),
+                                        events=('start', 'end')):
+            name = element.tag.rpartition('}')[2]
+            if event == 'start':
+                if name in ('item', 'entry'):
+                    break
+                if name in ('skipHours', 'skipDays'):
+                    parent = name
+                continue
+
+            text = (element.text or '').strip()
+            if name == 'ttl' and text.isdigit():
+                hints.ttl = timedelta(minutes=int(text))
+            elif name == 'hour' and parent == 'skipHours' and text.isdigit():
+                hints.skip_hours.append(int(text) % 24)
+            elif name == 'day' and parent == 'skipDays':
+                if text.capitalize() in DAYS:
+                    hints.skip_days.append(text.capitalize())
+            elif name in ('skipHours', 'skipDays'):
+                parent = None
+    except (ParseError, DefusedXmlException):
+        pass
+
+    return hints
+
+
+def apply_hints(interval: timedelta, *hints: Optional[timedelta]
+                ) -> timedelta:
+    """Wait at least as long as the server or the feed asks to.
+
+    A hint can only delay a synchronization by READER_SYNC_MAX_HINT_INTERVAL
+    at most, this protects from servers asking to never come back.
+    """
+    for hint in hints:
+        if hint is not None:
+            interval = max(interval, min(hint, READER_SYNC_MAX_HINT_INTERVAL))
+    return interval
+
+
+def skip_excluded_hours(next_sync_at: datetime, skip_hours: List[int],
+                        skip_days: List[str]) -> datetime:
+    """Move a date out of the hours and days a feed should not be fetched.
+
+    Hours are in GMT. A feed excluding every hour or every day is abusive,
+    its exclusions are ignored.
+    """
+    skip_hours = set(skip_hours)
+    skip_days = set(skip_days)
+    if len(skip_hours) >= 24 or len(skip_days) >= len(DAYS):
+        return next_sync_at
+
+    candidate = next_sync_at.astimezone(timezone.utc)
+    while True:
+        is_day_skipped = DAYS[candidate.weekday()] in skip_days
+        if candidate.hour not in skip_hours and not is_day_skipped:
+            return candidate
+
+        candidate = candidate.replace(minute=0, second=0, microsecond=0)
+        candidate += timedelta(hours=1)
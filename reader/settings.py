@@ -1,5 +1,31 @@
+from datetime import timedelta
+
 from django.conf import settings
+from redis import StrictRedis
 
 
 READER_CACHE_IMAGES = getattr(settings, 'READER_CACHE_IMAGES', False)
 READER_FEED_ARTICLE_THRESHOLD = getattr(settings, 'READER_FEED_ARTICLE_THRESHOLD', 20_000)
+READER_SYNC_MIN_INTERVAL = getattr(settings, 'READER_SYNC_MIN_INTERVAL', timedelta(minutes=30))
+READER_SYNC_MAX_INTERVAL = getattr(settings, 'READER_SYNC_MAX_INTERVAL', timedelta(days=1))
+READER_SYNC_MAX_FAILURES = getattr(settings, 'READER_SYNC_MAX_FAILURES', 15)
+READER_SYNC_MAX_FAILURE_BACKOFF = getattr(settings, 'READER_SYNC_MAX_FAILURE_BACKOFF', timedelta(days=7))
+READER_SYNC_MAX_HINT_INTERVAL = getattr(settings, 'READER_SYNC_MAX_HINT_INTERVAL', timedelta(days=2))
+READER_SYNC_DISPATCH_RATE = getattr(settings, 'READER_SYNC_DISPATCH_RATE', 500)
+READER_SYNC_DISPATCH_LEASE = getattr(settings, 'READER_SYNC_DISPATCH_LEASE', timedelta(minutes=5))
+READER_REDIS = getattr(settings, 'READER_REDIS', None)
+if READER_REDIS is None:
+    READER_REDIS = StrictRedis()
+READER_HOST_RATE = getattr(settings, 'READER_HOST_RATE', 1.0)
+READER_HOST_BURST = getattr(settings, 'READER_HOST_BURST', 5)
+READER_HOST_MAX_CONCURRENCY = getattr(settings, 'READER_HOST_MAX_CONCURRENCY', 2)
+READER_BULK_FETCH_CONCURRENCY = getattr(settings, 'READER_BULK_FETCH_CONCURRENCY', 200)
+READER_SYNC_BULK_SIZE = getattr(settings, 'READER_SYNC_BULK_SIZE', 20)
+READER_SYNC_FULL_INTERVAL = getattr(settings, 'READER_SYNC_FULL_INTERVAL', timedelta(days=1))
+READER_SYNC_MAX_ARTICLES = getattr(settings, 'READER_SYNC_MAX_ARTICLES', 1000)
+READER_FEED_ARTICLE_MAX_AGE = getattr(settings, 'READER_FEED_ARTICLE_MAX_AGE', None)
+READER_RETENTION_BATCH_SIZE = getattr(settings, 'READER_RETENTION_BATCH_SIZE', 500)
+READER_RETENTION_FOLLOW_UP_DELAY = getattr(settings, 'READER_RETENTION_FOLLOW_UP_DELAY', timedelta(seconds=30))
+READER_RETENTION_TIME_BUDGET = getattr(settings, 'READER_RETENTION_TIME_BUDGET', timedelta(seconds=5))
+READER_INBOX_ENABLED = getattr(settings, 'READER_INBOX_ENABLED', False)
+READER_FEED_STATS_MAX_AGE = getattr(settings, 'READER_FEED_STATS_MAX_AGE', timedelta(days=1))
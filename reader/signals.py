@@ -1,7 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from . import models
+from . import feed_stats, inbox, models
 
 
 @receiver(post_save, sender=models.User)
@@ -13,3 +13,25 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=models.User)
 def save_user_profile(sender, instance, **kwargs):
     instance.reader_profile.save()
+
+
+@receiver(post_save, sender=models.Subscription)
+def count_new_subscriber(sender, instance, created, **kwargs):
+    if created:
+        feed_stats.record_subscription(instance.feed_id, 1)
+
+
+@receiver(post_delete, sender=models.Subscription)
+def count_removed_subscriber(sender, instance, **kwargs):
+    feed_stats.record_subscription(instance.feed_id, -1)
+
+
+@receiver(post_save, sender=models.Subscription)
+def fill_subscriber_inbox(sender, instance, created, **kwargs):
+    if created:
+        inbox.add_subscription(instance)
+
+
+@receiver(post_delete, sender=models.Subscription)
+def empty_subscriber_inbox(sender, instance, **kwargs):
+    inbox.remove_subscription(instance)
@@ -0,0 +1,180 @@
+"""Make sure a feed is synchronized by a single worker at a time.
+
+The dispatcher, the admin, follow-ups of capped synchronizations and users
+adding a feed can all ask for the same feed to be synchronized at the same
+time. A worker synchronizing a feed holds a lease on it in Redis, requests
+arriving meanwhile are coalesced into the running synchronization:
+
+- a normal request is dropped, the running synchronization satisfies it
+- a forced request while a normal synchronization runs upgrades it: the
+  feed is synchronized again with force once the lease is released
+
+Leases expire on their own so that a crashed worker cannot block a feed
+forever. A worker holding leases longer than LEASE_TTL, like one
+synchronizing a group of feeds, renews them every LEASE_RENEWAL_INTERVAL.
+"""
+from logging import getLogger
+from typing import Optional
+from uuid import uuid4
+
+from redis import RedisError
+
+from .settings import READER_REDIS
+
+# A lease outlives the synchronization of a single feed, longer holders
+# renew their leases
+LEASE_TTL = 600
+LEASE_RENEWAL_INTERVAL = LEASE_TTL // 3
+
+COUNTERS_KEY = 'reader_sync_lease_counters'
+
+logger = getLogger(__name__)
+
+# Take the lease if it is free. Otherwise record that a forced request
+# arrived during a normal synchronization. Returns whether the lease was
+# taken.
+ACQUIRE_SCRIPT = READER_REDIS.register_script("""
+local lease_key = KEYS[1]
+local pending_key = KEYS[2]
+local counters_key = KEYS[3]
+local token = ARGV[1]
+local force = ARGV[2]
+local ttl = tonumber(ARGV[3])
+
+local current = redis.call('GET', lease_key)
+if not current then
+    redis.call('SET', lease_key, token .. ':' .. force, 'EX', ttl)
+    redis.call('HINCRBY', counters_key, 'acquired', 1)
+    return 1
+end
+
+if force == '1' and string.sub(current, -1) == '0' then
+    redis.call('SET', pending_key, '1', 'EX', ttl)
+    redis.call('HINCRBY', counters_key, 'upgraded', 1)
+else
+    redis.call('HINCRBY', counters_key, 'coalesced', 1)
+end
+return 0
+""")
+
+# Release the lease if it is still owned. Returns whether a forced
+# synchronization was requested meanwhile.
+RELEASE_SCRIPT = READER_REDIS.register_script("""
+local lease_key = KEYS[1]
+local pending_key = KEYS[2]
+local token = ARGV[1]
+
+local current = redis.call('GET', lease_key)
+if not current or string.sub(current, 1, string.len(token)) ~= token then
+    return 0
+end
+
+redis.call('DEL', lease_key)
+local pending = redis.call('GET', pending_key)
+redis.call('DEL', pending_key)
+if pending then
+    return 1
+end
+return 0
+""")
+
+
+# Extend the lease and the pending forced request if the lease is still
+# owned. Returns whether the lease is still owned.
+RENEW_SCRIPT = READER_REDIS.register_script("""
+local lease_key = KEYS[1]
+local pending_key = KEYS[2]
+local token = ARGV[1]
+local ttl = tonumber(ARGV[2])
+
+local current = redis.call('GET', lease_key)
+if not current or string.sub(current, 1, string.len(token)) ~= token then
+    return 0
+end
+
+redis.call('EXPIRE', lease_key, ttl)
+redis.call('EXPIRE', pending_key, ttl)
+return 1
+""")
+
+
+def _lease_key(name: str) -> str:
+    return 'reader_sync_lease_{}'.format(name)
+
+
+def _pending_key(name: str) -> str:
+    return 'reader_sync_pending_{}'.format(name)
+
+
+def feed_lease_name(feed_id: int) -> str:
+    return 'feed_{}'.format(feed_id)
+
+
+def acquire(name: str, force: bool=False) -> Optional[str]:
+    """Take the lease of a synchronization.
+
+    Returns a token to release the lease with, or None when another worker
+    holds it. When Redis is not available the lease is granted rather than
+    synchronizations being blocked.
+    """
+    token = uuid4().hex
+    try:
+        acquired = ACQUIRE_SCRIPT(
+            keys=[_lease_key(name), _pending_key(name), COUNTERS_KEY],
+            args=[token, '1' if force else '0', LEASE_TTL]
+        )
+    except RedisError as e:
+        logger.warning('Could not take sync lease %s: %s', name, e)
+        return ''
+
+    if not acquired:
+        logger.info('Synchronization %s already in progress', name)
+        return None
+
+    return token
+
+
+def release(name: str, token: str) -> bool:
+    """Release the lease of a synchronization.
+
+    Returns whether a forced synchronization was requested while the lease
+    was held, the caller is responsible for running it.
+    """
+    if not token:
+        return False
+
+    try:
+        return bool(RELEASE_SCRIPT(
+            keys=[_lease_key(name), _pending_key(name)], args=[token]
+        ))
+    except RedisError as e:
+        logger.warning('Could not release sync lease %s: %s', name, e)
+        return False
+
+
+def renew(name: str, token: str) -> bool:
+    """Extend a lease for another LEASE_TTL.
+
+    Returns whether the lease is still owned, a lease that expired may have
+    been taken by another worker meanwhile.
+    """
+    if not token:
+        return True
+
+    try:
+        return bool(RENEW_SCRIPT(
+            keys=[_lease_key(name), _pending_key(name)],
+            args=[token, LEASE_TTL]
+        ))
+    except RedisError as e:
+        logger.warning('Could not renew sync lease %s: %s', name, e)
+        return True
+
+
+def get_counters() -> dict:
+    """How often leases were taken, coalesced and upgraded."""
+    counters = READER_REDIS.hgetall(COUNTERS_KEY)
+    return {
+        key: int(counters.get(key.encode(), 0))
+        for key in ('acquired', 'coalesced', 'upgraded')
+    }
@@ -1,104 +1,525 @@
-from datetime import timedelta
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import hashlib
+import itertools
 from logging import getLogger
-import random
-from typing import Optional, Tuple
+import time
+from typing import List, Optional, Tuple
 
 from atoma.exceptions import FeedDocumentError
 from atoma.simple import simple_parse_bytes, Feed as ParsedFeed
+import attr
 from django.contrib.auth import get_user_model
-from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import File
 from django.core.files.storage import default_storage
-from django.db.models import Count, ObjectDoesNotExist
+from django.db.models import Count, F, ObjectDoesNotExist, Q, Value
 from django.db.models.base import ModelBase
+from django.db.models.functions import Coalesce
 from django.db.utils import IntegrityError
 from django.template.defaultfilters import filesizeformat
 from django.utils.timezone import now
 from psycopg2 import errorcodes as pg_error_codes
+from redis import RedisError
 import requests
 from spinach import Tasks, Batch
 
 from um import background_messages
 
 from . import (
-    models, html_processing, image_processing, http_fetcher, caching, utils
+    models, html_processing, image_processing, http_fetcher, caching, utils,
+    scheduling, politeness, bulk_fetcher, upsert, feed_stats, retention,
+    sync_lease, feed_merging, inbox
+)
+from .settings import (
+    READER_CACHE_IMAGES, READER_FEED_ARTICLE_THRESHOLD,
+    READER_SYNC_DISPATCH_RATE, READER_SYNC_DISPATCH_LEASE,
+    READER_SYNC_MAX_FAILURES, READER_SYNC_BULK_SIZE, READER_SYNC_FULL_INTERVAL,
+    READER_SYNC_MAX_ARTICLES, READER_RETENTION_FOLLOW_UP_DELAY,
+    READER_HOST_MAX_CONCURRENCY, READER_SYNC_MAX_HINT_INTERVAL
 )
-from .settings import READER_CACHE_IMAGES, READER_FEED_ARTICLE_THRESHOLD
 
 tasks = Tasks()
 logger = getLogger(__name__)
 
+DISPATCH_PERIOD = timedelta(minutes=1)
+DISPATCHER_METRICS_CACHE_KEY = 'reader_dispatcher_metrics'
 
-@tasks.task(name='synchronize_all_feeds', periodicity=timedelta(minutes=30),
-            max_retries=2, max_concurrency=1)
-def synchronize_all_feeds():
-    """Synchronize feeds every 30 minutes.
+# Errors expected when fetching a feed, they do not fail the task
+FETCH_ERRORS = (
+    politeness.HostRateLimitedError,
+    requests.exceptions.RequestException,
+    http_fetcher.FetchFileTooBigError
+)
+
+# Fields compared to decide whether a stored object must be updated, in the
+# order of the defaults built from a parsed feed
+ARTICLE_COMPARED_FIELDS = (
+    'uri', 'title', 'content', 'published_at', 'updated_at'
+)
+ATTACHMENT_COMPARED_FIELDS = ('title', 'mime_type', 'size_in_bytes', 'duration')
+
+# Incremental synchronization stops after this many known unchanged articles,
+# existing hashes are fetched by chunks of articles while looking for them
+INCREMENTAL_KNOWN_RUN = 5
+INCREMENTAL_CHUNK_SIZE = 20
+
+# Leave time to other feeds before continuing a capped synchronization
+SYNC_FOLLOW_UP_DELAY = timedelta(seconds=30)
+
+# Articles left over by a capped synchronization wait in the cache for the
+# follow-up. If they are gone, the feed is fetched again with force and
+# without cap, a cache that keeps losing them cannot make it loop
+SYNC_REMAINDER_CACHE_KEY = 'reader_sync_remainder_{}'
+SYNC_REMAINDER_TIMEOUT = timedelta(hours=1)
+
+# Time to wait before retrying when another worker holds a lease
+LEASE_RETRY_DELAY = timedelta(seconds=10)
 
-    To avoid a spike of load, the synchronization is spread over the whole
-    period.
+# Articles written together get creation dates this far apart, in the
+# order of the feed
+CREATION_DATE_STEP = timedelta(microseconds=1)
+
+
+@attr.s
+class SyncRemainder:
+    parsed_feed: ParsedFeed = attr.ib()
+    # Creation date of the oldest article written by the synchronization
+    # that left this remainder
+    created_before: datetime = attr.ib()
+
+
+@attr.s
+class SyncPlan:
+    feed_ids: List[int] = attr.ib()
+    duplicates_dropped: int = attr.ib()
+    lag: Optional[timedelta] = attr.ib(default=None)
+
+
+def _get_due_feeds(current_date: datetime):
+    """Queryset of feeds that need to be synchronized.
 
     Feeds that have their sync explicitly disabled or that have no active
     subscribers are not synchronized.
+
+    Filtering on subscribers joins one row per active subscriber, callers
+    must group rows by feed.
+    """
+    inactive_user_threshold = feed_stats.get_active_reader_threshold(
+        current_date
+    )
+    is_due = Q(next_sync_at__isnull=True) | Q(next_sync_at__lte=current_date)
+    return (
+        models.Feed.objects
+        .filter(is_due)
+        .filter(
+            is_sync_enabled=True,
+            subscribers__user__is_active=True,
+            subscribers__user__last_login__gte=inactive_user_threshold
+        )
+    )
+
+
+def plan_feeds_to_sync(current_date: datetime,
+                       limit: Optional[int]=None) -> SyncPlan:
+    """Build the set of the next due feeds, the most late first.
+
+    Rows are grouped by feed in the database so that each feed is planned only
+    once, the number of joined rows tells how many duplicates were dropped.
+    """
+    rows = (
+        _get_due_feeds(current_date)
+        .values('id', 'next_sync_at')
+        .annotate(num_rows=Count('id'))
+        .order_by(F('next_sync_at').asc(nulls_first=True), 'id')
+        .values_list('id', 'next_sync_at', 'num_rows')
+    )
+    if limit is not None:
+        rows = rows[:limit]
+
+    feed_ids = list()
+    duplicates_dropped = 0
+    lag = None
+    for feed_id, next_sync_at, num_rows in rows:
+        feed_ids.append(feed_id)
+        duplicates_dropped += num_rows - 1
+        if lag is None and next_sync_at is not None:
+            lag = current_date - next_sync_at
+
+    return SyncPlan(feed_ids, duplicates_dropped, lag)
+
+
+@tasks.task(name='dispatch_due_feeds', periodicity=DISPATCH_PERIOD,
+            max_retries=2, max_concurrency=1)
+def dispatch_due_feeds():
+    """Hand due feeds to workers at a steady rate.
+
+    Every period the next due feeds are enqueued, evenly spread over the
+    period. At most READER_SYNC_DISPATCH_RATE feeds are dispatched each
+    minute, feeds not dispatched stay in the backlog for the next period.
+    When READER_SYNC_BULK_SIZE is more than one, feeds are dispatched in
+    groups fetched concurrently by a single task, see group_feeds.
+
+    Dispatched feeds are pushed back in the schedule for a short lease after
+    the end of the period, the synchronization itself then sets the actual
+    next date. If the synchronization task is lost, the feed is dispatched
+    again once the lease is over.
     """
     current_date = now()
-    inactive_user_threshold = current_date - (timedelta(seconds=settings.SESSION_COOKIE_AGE) * 2)
-    feeds_to_sync = models.Feed.objects.filter(
-        is_sync_enabled=True,
-        subscribers__user__is_active=True,
-        subscribers__user__last_login__gte=inactive_user_threshold
+    max_feeds = int(
+        READER_SYNC_DISPATCH_RATE * DISPATCH_PERIOD.total_seconds() / 60
+    )
+    plan = plan_feeds_to_sync(current_date, limit=max_feeds)
+    num_due_feeds = (
+        _get_due_feeds(current_date).values('id').distinct().count()
     )
+    backlog = num_due_feeds - len(plan.feed_ids)
 
-    ats = list()
-    for i in range(0, 29):
-        ats.append(current_date + timedelta(minutes=i))
+    if plan.feed_ids:
+        models.Feed.objects.filter(id__in=plan.feed_ids).update(
+            next_sync_at=(
+                current_date + DISPATCH_PERIOD + READER_SYNC_DISPATCH_LEASE
+            )
+        )
 
-    batch = Batch()
-    for feed_id in feeds_to_sync.values_list('id', flat=True):
-        batch.schedule_at('synchronize_feed', random.choice(ats), feed_id)
-    tasks.schedule_batch(batch)
+        hosts = {
+            feed_id: politeness.get_host(uri)
+            for feed_id, uri in models.Feed.objects
+            .filter(id__in=plan.feed_ids).values_list('id', 'uri')
+        }
+        groups = group_feeds(plan.feed_ids, hosts)
+        step = DISPATCH_PERIOD / len(groups)
+        batch = Batch()
+        for i, group in enumerate(groups):
+            if len(group) == 1:
+                batch.schedule_at('synchronize_feed', current_date + step * i,
+                                  group[0])
+            else:
+                batch.schedule_at('synchronize_feeds',
+                                  current_date + step * i, group)
+        tasks.schedule_batch(batch)
+
+    metrics = {
+        'dispatched_at': current_date,
+        'rate_per_minute': (
+            len(plan.feed_ids) * 60 / DISPATCH_PERIOD.total_seconds()
+        ),
+        'backlog': backlog,
+        'lag_seconds': plan.lag.total_seconds() if plan.lag else 0,
+        'duplicates_dropped': plan.duplicates_dropped
+    }
+    try:
+        metrics['sync_leases'] = sync_lease.get_counters()
+    except RedisError as e:
+        logger.warning('Could not get sync lease counters: %s', e)
+    cache.set(DISPATCHER_METRICS_CACHE_KEY, metrics, timeout=None)
+    logger.info(
+        'Dispatched %d feeds (%.1f/min), %d left in backlog, %ds behind '
+        'schedule, dropped %d duplicates', len(plan.feed_ids),
+        metrics['rate_per_minute'], backlog, metrics['lag_seconds'],
+        plan.duplicates_dropped
+    )
+
+
+def group_feeds(feed_ids: List[int], hosts: dict) -> List[List[int]]:
+    """Split feeds in groups of at most READER_SYNC_BULK_SIZE feeds.
+
+    Feeds of a group are fetched concurrently, a group holds at most
+    READER_HOST_MAX_CONCURRENCY feeds of the same host so that none of them
+    is deferred by the host limiter. Feeds keep their order as much as
+    possible, each one goes to the first group with room for it.
+    """
+    groups = list()
+    for feed_id in feed_ids:
+        host = hosts.get(feed_id)
+        for group, group_hosts in groups:
+            is_full = len(group) >= READER_SYNC_BULK_SIZE
+            if not is_full and group_hosts[host] < READER_HOST_MAX_CONCURRENCY:
+                break
+        else:
+            group, group_hosts = list(), Counter()
+            groups.append((group, group_hosts))
+
+        group.append(feed_id)
+        group_hosts[host] += 1
+
+    return [group for group, _ in groups]
+
+
+def get_dispatcher_metrics() -> Optional[dict]:
+    """Metrics of the last run of the dispatcher."""
+    return cache.get(DISPATCHER_METRICS_CACHE_KEY)
 
 
 @tasks.task(name='synchronize_feed')
-def synchronize_feed(feed_id: int, force=False):
+def synchronize_feed(feed_id: int, force=False, capped=True):
+    """Synchronize a feed unless another worker is already doing it.
+
+    An uncapped synchronization writes all the articles of the feed at once.
+    """
+    lease_name = sync_lease.feed_lease_name(feed_id)
+    lease_token = sync_lease.acquire(lease_name, force)
+    if lease_token is None:
+        return
+
+    try:
+        _synchronize_feed(feed_id, force, capped)
+    finally:
+        if sync_lease.release(lease_name, lease_token):
+            _schedule_upgraded_syncs([feed_id])
+
+
+def _synchronize_feed(feed_id: int, force: bool, capped: bool=True):
     task_start_date = now()
 
+    feed = _get_feed_to_sync(feed_id)
+    if feed is None:
+        return
+
+    logger.info('Starting synchronization of %s', feed)
     try:
-        # Fetch the feed from db as well as its subscribers count in a single
-        # query, this approach may give incorrect results if other annotations
-        # are added in the future.
-        # See https://code.djangoproject.com/ticket/10060
-        feed = (
-            models.Feed.objects.annotate(Count('subscribers')).get(pk=feed_id)
+        feed_request = http_fetcher.fetch_feed(
+            **_get_fetch_kwargs(feed, force)
         )
+    except FETCH_ERRORS as e:
+        _handle_fetch_error(feed, e, force, task_start_date)
+        return
+
+    _handle_fetch_result(feed, feed_request, task_start_date, force, capped)
+
+
+@tasks.task(name='synchronize_feeds')
+def synchronize_feeds(feed_ids: List[int], force=False):
+    """Synchronize many feeds, downloading them concurrently.
+
+    Feeds are all fetched at once before being processed one by one. The
+    lease of a feed is released as soon as it is processed, the leases of
+    the feeds still waiting are renewed meanwhile.
+    """
+    leases = dict()
+    for feed_id in feed_ids:
+        lease_name = sync_lease.feed_lease_name(feed_id)
+        lease_token = sync_lease.acquire(lease_name, force)
+        if lease_token is not None:
+            leases[feed_id] = (lease_name, lease_token)
+
+    try:
+        _synchronize_feeds(leases, force)
+    finally:
+        _release_leases(leases)
+
+
+def _release_leases(leases: dict):
+    """Release the leases of feeds, emptying the dict."""
+    upgraded_feed_ids = list()
+    while leases:
+        feed_id, lease = leases.popitem()
+        if sync_lease.release(*lease):
+            upgraded_feed_ids.append(feed_id)
+    _schedule_upgraded_syncs(upgraded_feed_ids)
+
+
+def _renew_leases(leases: dict):
+    for feed_id, lease in leases.items():
+        if not sync_lease.renew(*lease):
+            logger.warning('Lost the sync lease of feed %d', feed_id)
+
+
+def _synchronize_feeds(leases: dict, force: bool):
+    task_start_date = now()
+
+    feeds = list()
+    for feed_id in list(leases):
+        feed = _get_feed_to_sync(feed_id)
+        if feed is not None:
+            feeds.append(feed)
+
+    logger.info('Starting synchronization of %d feeds', len(feeds))
+    results = bulk_fetcher.fetch_feeds(
+        [_get_fetch_kwargs(feed, force) for feed in feeds]
+    )
+
+    # Each feed is processed as soon as it is downloaded, its content is
+    # released before the next one is taken
+    unexpected_error = None
+    renewed_at = time.monotonic()
+    for index, result in results:
+        feed = feeds[index]
+        if isinstance(result, FETCH_ERRORS):
+            _handle_fetch_error(feed, result, force, task_start_date)
+        elif isinstance(result, Exception):
+            logger.error('Unexpected error while fetching %s: %r', feed,
+                         result)
+            unexpected_error = unexpected_error or result
+        else:
+            _handle_fetch_result(feed, result, task_start_date, force)
+
+        _release_leases({feed.id: leases.pop(feed.id)})
+        if time.monotonic() - renewed_at >= sync_lease.LEASE_RENEWAL_INTERVAL:
+            _renew_leases(leases)
+            renewed_at = time.monotonic()
+
+    if unexpected_error is not None:
+        raise unexpected_error
+
+
+@tasks.task(name='synchronize_feed_remainder')
+def synchronize_feed_remainder(feed_id: int):
+    """Write the articles left over by a capped synchronization."""
+    lease_name = sync_lease.feed_lease_name(feed_id)
+    lease_token = sync_lease.acquire(lease_name)
+    if lease_token is None:
+        tasks.schedule_at('synchronize_feed_remainder',
+                          now() + LEASE_RETRY_DELAY, feed_id)
+        return
+
+    try:
+        _synchronize_feed_remainder(feed_id)
+    finally:
+        if sync_lease.release(lease_name, lease_token):
+            _schedule_upgraded_syncs([feed_id])
+
+
+def _synchronize_feed_remainder(feed_id: int):
+    cache_key = SYNC_REMAINDER_CACHE_KEY.format(feed_id)
+    remainder = cache.get(cache_key)
+    if remainder is None:
+        logger.warning('Articles left over by the synchronization of feed '
+                       '%d are gone, synchronizing it with force and without '
+                       'cap', feed_id)
+        tasks.schedule('synchronize_feed', feed_id, force=True, capped=False)
+        return
+
+    # Removed before processing, it may leave a remainder of its own
+    cache.delete(cache_key)
+    feed = _get_feed_to_sync(feed_id)
+    if feed is None:
+        return
+
+    logger.info('Continuing synchronization of %s with %d articles', feed,
+                len(remainder.parsed_feed.articles))
+    processing_start = time.monotonic()
+    synchronize_parsed_feed(feed, remainder.parsed_feed,
+                            created_before=remainder.created_before)
+
+    # The remainder is part of the synchronization that left it
+    duration = timedelta(seconds=time.monotonic() - processing_start)
+    last_duration = feed.last_sync_duration or timedelta()
+    feed.last_sync_duration = last_duration + duration
+    feed.total_sync_duration += duration
+    feed.save(update_fields=['last_sync_duration', 'total_sync_duration'])
+
+
+def _schedule_upgraded_syncs(feed_ids: List[int]):
+    """Run the forced synchronizations requested while feeds were leased."""
+    if not feed_ids:
+        return
+
+    logger.info('Forced synchronization requested during synchronization '
+                'of feeds %s', feed_ids)
+    batch = Batch()
+    for feed_id in feed_ids:
+        batch.schedule('synchronize_feed', feed_id, force=True)
+    tasks.schedule_batch(batch)
+
+
+def _get_feed_to_sync(feed_id: int) -> Optional[models.Feed]:
+    try:
+        feed = models.Feed.objects.select_related('stats').get(pk=feed_id)
     except ObjectDoesNotExist:
         logger.info('Not synchronizing feed %d, does not exist', feed_id)
-        return
+        return None
 
     if feed.is_sync_enabled is False:
         logger.info('Not synchronizing feed %d, sync is disabled', feed_id)
-        return
+        return None
 
-    logger.info('Starting synchronization of %s', feed)
-    try:
-        feed_request = http_fetcher.fetch_feed(
-            feed.uri,
-            feed.last_fetched_at if not force else None,
-            bytes(feed.last_hash) if feed.last_hash and not force else None,
-            feed.subscribers__count,
-            feed_id
+    return feed
+
+
+def _get_fetch_kwargs(feed: models.Feed, force: bool) -> dict:
+    """Arguments of http_fetcher.fetch_feed for a feed.
+
+    Forcing the synchronization ignores what is known about the previous
+    fetch.
+    """
+    return {
+        'uri': feed.uri,
+        'etag': feed.etag if not force else '',
+        'last_modified': feed.last_modified if not force else '',
+        'last_hash': (
+            bytes(feed.last_hash) if feed.last_hash and not force else None
+        ),
+        'subscriber_count': feed_stats.get_feed_stats(feed).subscriber_count,
+        'feed_id': feed.id
+    }
+
+
+def _handle_fetch_error(feed: models.Feed, error: Exception, force: bool,
+                        current_date: datetime):
+    if isinstance(error, politeness.HostRateLimitedError):
+        logger.info('Deferring synchronization of %s: %s', feed, error)
+        tasks.schedule_at(
+            'synchronize_feed',
+            current_date + timedelta(seconds=error.retry_after),
+            feed.id, force=force
         )
-    except (requests.exceptions.RequestException,
-            http_fetcher.FetchFileTooBigError) as e:
-        logger.warning('Could not synchronize %s: %s', feed, e)
-        feed.last_failure = repr(e)
-        feed.save()
         return
 
-    if feed_request is None:
+    if _is_throttling_error(error):
+        _defer_throttled_feed(feed, error, current_date)
+        return
+
+    logger.warning('Could not synchronize %s: %s', feed, error)
+    _record_failure(feed, error, current_date)
+
+
+def _defer_throttled_feed(feed: models.Feed, error: Exception,
+                          current_date: datetime):
+    """Come back later to a feed whose server asked to slow down.
+
+    Throttling is not a failure of the feed, a server busy for a long time
+    must not get it disabled. It is synchronized again at its usual pace,
+    but not before the server's Retry-After.
+    """
+    retry_after = http_fetcher.get_retry_after(error.response.headers)
+    logger.info('Server of %s is throttling, retrying after %s', feed,
+                retry_after)
+    feed.last_failure = repr(error)
+    _schedule_next_sync(feed, current_date, has_changed=False,
+                        expires_in=retry_after)
+    if retry_after is not None:
+        # The jitter must not bring the synchronization before the date
+        # asked by the server
+        retry_at = current_date + min(retry_after,
+                                      READER_SYNC_MAX_HINT_INTERVAL)
+        feed.next_sync_at = max(feed.next_sync_at, retry_at)
+    feed.save()
+
+
+def _handle_fetch_result(feed: models.Feed,
+                         feed_request: http_fetcher.FeedFetchResult,
+                         current_date: datetime, force: bool=False,
+                         capped: bool=True):
+    """Process a fetched feed: store its articles and update the feed.
+
+    Forcing the synchronization processes all the articles of the feed.
+    """
+    processing_start = time.monotonic()
+    feed.fetch_count += 1
+    if not feed_request.is_modified:
         # Feed did not change since last synchronization
-        feed.last_fetched_at = task_start_date
+        if feed_request.status_code == 304:
+            feed.not_modified_count += 1
+        feed.etag = feed_request.etag
+        feed.last_modified = feed_request.last_modified
+        feed.last_fetched_at = current_date
         feed.last_failure = ''
+        feed.failure_count = 0
+        _schedule_next_sync(feed, current_date, has_changed=False,
+                            expires_in=feed_request.expires_in)
         feed.save()
+        _enforce_retention(feed, current_date)
         return
 
     if feed_request.is_html:
@@ -108,115 +529,349 @@ def synchronize_feed(feed_id: int, force=False):
         parsed_feed = simple_parse_bytes(feed_request.content)
     except FeedDocumentError as e:
         logger.warning('Could not synchronize %s: %s', feed, e)
-        feed.last_failure = repr(e)
-        feed.save()
+        _record_failure(feed, e, current_date)
         return
 
     parsed_feed_title = utils.shrink_str(parsed_feed.title)
     if feed.name != parsed_feed_title:
-        logger.info('Renaming feed %d from "%s" to "%s"', feed_id, feed.name,
+        logger.info('Renaming feed %d from "%s" to "%s"', feed.id, feed.name,
                     parsed_feed_title)
         feed.name = parsed_feed_title
 
-    synchronize_parsed_feed(feed, parsed_feed)
+    synchronize_parsed_feed(feed, parsed_feed, full=force, capped=capped)
+    feed.last_sync_articles = len(parsed_feed.articles)
+    feed.last_sync_bytes = len(feed_request.content)
+    feed.last_sync_duration = timedelta(
+        seconds=time.monotonic() - processing_start
+    )
+    feed.total_sync_articles += feed.last_sync_articles
+    feed.total_sync_bytes += feed.last_sync_bytes
+    feed.total_sync_duration += feed.last_sync_duration
 
-    feed.last_fetched_at = task_start_date
+    hints = scheduling.parse_feed_hints(feed_request.content)
+    feed.ttl = hints.ttl
+    feed.skip_hours = hints.skip_hours
+    feed.skip_days = hints.skip_days
+
+    feed.last_fetched_at = current_date
     feed.last_hash = feed_request.hash
+    feed.etag = feed_request.etag
+    feed.last_modified = feed_request.last_modified
     feed.last_failure = ''
+    feed.failure_count = 0
     feed.frequency_per_year = calculate_frequency_per_year(feed)
+    _schedule_next_sync(feed, current_date, has_changed=True,
+                        expires_in=feed_request.expires_in)
     feed.save()
+    _enforce_retention(feed, current_date)
 
     # Update feed URI if it was redirected
     if feed_request.final_url != feed.uri:
         logger.info(
             'Feed was redirected: %s -> %s', feed.uri, feed_request.final_url
         )
-        feed.uri = feed_request.final_url
+        _follow_redirect(feed, feed_request.final_url)
+
+
+def _follow_redirect(feed: models.Feed, uri: str):
+    """Change the URI of a feed, merging it if another feed has this URI."""
+    other_feed = feed_merging.find_feed(uri, exclude=feed)
+    if other_feed is None:
+        feed.uri = uri
         try:
             feed.save(update_fields=['uri'])
+            return
         except IntegrityError as e:
             if e.__cause__.pgcode != pg_error_codes.UNIQUE_VIOLATION:
                 raise
 
-            logger.warning(
-                'Could not change feed %d URI to %s, another feed '
-                'already has this URI', feed.id, feed.uri,
-            )
+        other_feed = models.Feed.objects.get(uri=uri)
+
+    # The lease of the feed is held until the end of its synchronization,
+    # the merge waits for it
+    logger.warning('Feed %d now points to %s, merging them', feed.id,
+                   other_feed)
+    tasks.schedule('merge_feeds', feed.id, other_feed.id)
+
+
+@tasks.task(name='merge_feeds')
+def merge_feeds(duplicate_id: int, survivor_id: int):
+    """Merge a duplicate feed into its survivor.
+
+    Both feeds are leased so that they are not synchronized while their
+    articles and subscriptions are moved. The merge is retried later when
+    one of them is being synchronized.
+    """
+    leases = dict()
+    try:
+        for feed_id in (duplicate_id, survivor_id):
+            lease_name = sync_lease.feed_lease_name(feed_id)
+            lease_token = sync_lease.acquire(lease_name)
+            if lease_token is None:
+                tasks.schedule_at('merge_feeds', now() + LEASE_RETRY_DELAY,
+                                  duplicate_id, survivor_id)
+                return
+            leases[feed_id] = (lease_name, lease_token)
+
+        _merge_feeds(duplicate_id, survivor_id)
+    finally:
+        _release_leases(leases)
+
+
+def _merge_feeds(duplicate_id: int, survivor_id: int):
+    feeds = models.Feed.objects.in_bulk([duplicate_id, survivor_id])
+    if len(feeds) != 2:
+        logger.info('Not merging feed %d into %d, one does not exist',
+                    duplicate_id, survivor_id)
+        return
 
+    feed_merging.merge_feeds(feeds[duplicate_id], feeds[survivor_id])
 
-def synchronize_parsed_feed(feed: models.Feed, parsed_feed: ParsedFeed):
-    """Synchronize articles, attachments and images from a parsed feed."""
+
+def _record_failure(feed: models.Feed, error: Exception,
+                    current_date: datetime):
+    """Back off from a failing feed and disable it when it keeps failing."""
+    feed.last_failure = repr(error)
+    feed.failure_count += 1
+
+    if feed.failure_count < READER_SYNC_MAX_FAILURES:
+        interval = scheduling.get_failure_backoff(feed.failure_count)
+        feed.next_sync_at = scheduling.get_next_sync_at(current_date, interval)
+        logger.info('Feed %d failed %d times, next synchronization in %s',
+                    feed.id, feed.failure_count, interval)
+        feed.save()
+        return
+
+    logger.warning('Disabling synchronization of %s after %d failures',
+                   feed, feed.failure_count)
+    feed.is_sync_enabled = False
+    feed.save()
+
+    subscribers = get_user_model().objects.filter(reader_profile__feeds=feed)
+    for user in subscribers:
+        background_messages.warning(
+            user,
+            f'Synchronization of feed "{feed.name}" has been disabled after '
+            f'{feed.failure_count} consecutive failures'
+        )
+
+
+def _is_throttling_error(error: Exception) -> bool:
+    """Whether the server asked to slow down with a 429 or a 503."""
+    if not isinstance(error, requests.exceptions.HTTPError):
+        return False
+
+    if error.response is None:
+        return False
+
+    return error.response.status_code in (429, 503)
+
+
+def _schedule_next_sync(feed: models.Feed, current_date: datetime,
+                        has_changed: bool,
+                        expires_in: Optional[timedelta]=None):
+    interval = scheduling.get_sync_interval(
+        feed.frequency_per_year,
+        feed_stats.get_feed_stats(feed).subscriber_count, has_changed
+    )
+    interval = scheduling.apply_hints(interval, expires_in, feed.ttl)
+    next_sync_at = scheduling.get_next_sync_at(current_date, interval)
+    feed.next_sync_at = scheduling.skip_excluded_hours(
+        next_sync_at, feed.skip_hours, feed.skip_days
+    )
+    logger.info('Next synchronization of feed %d at %s', feed.id,
+                feed.next_sync_at)
+
+
+def get_article_hash(defaults: dict) -> bytes:
+    """Digest of the compared fields of an article."""
+    content_hash = hashlib.sha1()
+    for field in ARTICLE_COMPARED_FIELDS:
+        value = defaults[field]
+        if isinstance(value, datetime):
+            value = value.astimezone(timezone.utc).isoformat()
+        content_hash.update(str(value).encode())
+        content_hash.update(b'\x00')
+
+    return content_hash.digest()
+
+
+def _get_article_defaults(parsed_article) -> dict:
+    return {
+        'uri': parsed_article.link or '',
+        'title': parsed_article.title or '',
+        'content': parsed_article.content,
+        'published_at': parsed_article.published_at,
+        'updated_at': parsed_article.updated_at
+    }
+
+
+def synchronize_parsed_feed(feed: models.Feed, parsed_feed: ParsedFeed,
+                            full: bool=False,
+                            created_before: Optional[datetime]=None,
+                            capped: bool=True):
+    """Synchronize articles, attachments and images from a parsed feed.
+
+    New and modified articles are found in memory by comparing them with the
+    existing ones, then written with a few bulk statements. Unchanged articles
+    are not written at all.
+
+    Unless a full synchronization is requested or due, feeds listing their
+    articles newest first are processed incrementally: processing stops at
+    the first run of known and unchanged articles. The fields of the feed
+    keeping track of this are updated but not saved.
+
+    At most READER_SYNC_MAX_ARTICLES articles are written. The articles
+    from the first one left unwritten on are kept in the cache and processed
+    shortly after by a synchronize_feed_remainder task. It calls this
+    function with the creation date of the oldest article written, all the
+    articles given are processed, created before it, and the fields of the
+    feed are not touched. An uncapped synchronization writes all articles.
+    """
+    current_date = now()
     images_uris = set()
     articles_to_uncache = list()
-    parsed_articles = list()
+    parsed_articles = dict()
 
     for parsed_article in parsed_feed.articles:
-        if parsed_article.id is not None:
-            parsed_articles.append(parsed_article)
-        else:
+        if parsed_article.id is None:
             logger.info('Parsed article has no ID, skipping %s', parsed_article)
+            continue
+
+        # Keep the first occurrence of an ID, a row cannot be upserted twice
+        # in the same statement
+        parsed_articles.setdefault(parsed_article.id[:400], parsed_article)
+
+    articles_defaults = {
+        id_in_feed: _get_article_defaults(parsed_article)
+        for id_in_feed, parsed_article in parsed_articles.items()
+    }
+    content_hashes = {
+        id_in_feed: get_article_hash(defaults)
+        for id_in_feed, defaults in articles_defaults.items()
+    }
+
+    if created_before is None:
+        parsed_articles = _select_articles_to_process(
+            feed, parsed_articles, articles_defaults, content_hashes, full,
+            current_date
+        )
 
-    existing_articles = (
+    if not parsed_articles:
+        return
+
+    articles_query = (
         models.Article.objects.filter(feed=feed)
-        .filter(id_in_feed__in={a.id[:400] for a in parsed_articles})
-        .select_related('feed')
-        .prefetch_related('attachment_set')
+        .filter(id_in_feed__in=parsed_articles.keys())
+    )
+    # The hash of an article tells if it changed without loading its content,
+    # which is only needed for articles stored before hashes existed
+    existing_articles = ObjectIndex(
+        itertools.chain(
+            articles_query.filter(content_hash__isnull=False)
+            .only('id', 'feed', 'id_in_feed', 'content_hash'),
+            articles_query.filter(content_hash__isnull=True)
+        ),
+        lookup_fields=('id_in_feed',)
     )
 
-    for parsed_article in reversed(parsed_articles):
-
-        article, created, modified = create_or_update_if_needed(
-            models.Article,
-            existing_articles,
-            id_in_feed=parsed_article.id[:400],
-            feed=feed,
-            defaults={
-                'uri': parsed_article.link or '',
-                'title': parsed_article.title or '',
-                'content': parsed_article.content,
-                'published_at': parsed_article.published_at,
-                'updated_at': parsed_article.updated_at
-            }
-        )
+    # Articles are processed newest first so that a capped synchronization
+    # ingests the most recent ones, the rest is left to a follow-up
+    rows_to_write = list()
+    articles_to_backfill = list()
+    articles = dict()
+    remaining_ids = list()
+    for position, id_in_feed in enumerate(parsed_articles):
+        defaults = articles_defaults[id_in_feed]
+        content_hash = content_hashes[id_in_feed]
+        existing_article = existing_articles.get(id_in_feed=id_in_feed)
+        if existing_article:
+            existing_article.feed = feed
+            articles[id_in_feed] = existing_article
+            if existing_article.content_hash is not None:
+                unchanged = bytes(existing_article.content_hash) == content_hash
+            else:
+                unchanged = _is_object_equivalent(existing_article, defaults)
+                if unchanged:
+                    existing_article.content_hash = content_hash
+                    articles_to_backfill.append(existing_article)
+
+            if unchanged:
+                logger.debug('Not updated %s', existing_article)
+                continue
 
-        if created or modified:
-            images_uris.update(
-                html_processing.find_images_in_article(parsed_article.content,
-                                                       feed.uri)
-            )
+        if capped and len(rows_to_write) >= READER_SYNC_MAX_ARTICLES:
+            # Only left over when an article actually needs to be written
+            articles.pop(id_in_feed, None)
+            remaining_ids = list(parsed_articles)[position:]
+            break
 
-        if modified:
-            articles_to_uncache.append(article)
+        row = {'feed': feed.id, 'id_in_feed': id_in_feed}
+        row.update(defaults)
+        row['content_hash'] = content_hash
+        rows_to_write.append(row)
 
-        current_attachments = set()
-        for parsed_attachment in parsed_article.attachments:
-            attachment, _, _ = create_or_update_if_needed(
-                models.Attachment,
-                article.attachment_set.all(),
-                uri=parsed_attachment.link,
-                article=article,
-                defaults={
-                    'title': parsed_attachment.title,
-                    'mime_type': parsed_attachment.mime_type or '',
-                    'size_in_bytes': parsed_attachment.size_in_bytes or None,
-                    'duration': parsed_attachment.duration
-                }
+    # Insert the oldest articles first, like the feed would have published
+    rows_to_write.reverse()
+    _set_creation_dates(rows_to_write, created_before)
+
+    if articles_to_backfill:
+        models.Article.objects.bulk_update(articles_to_backfill,
+                                           ['content_hash'])
+
+    written_articles = upsert.bulk_upsert(
+        models.Article, rows_to_write,
+        unique_fields=('feed', 'id_in_feed'),
+        update_fields=ARTICLE_COMPARED_FIELDS + ('content_hash',)
+    )
+    created_dates = list()
+    created_ids = list()
+    for article_id, (_, id_in_feed), created in written_articles:
+        parsed_article = parsed_articles[id_in_feed]
+        images_uris.update(
+            html_processing.find_images_in_article(parsed_article.content,
+                                                   feed.uri)
+        )
+        if created:
+            created_dates.append(articles_defaults[id_in_feed]['published_at'])
+            created_ids.append(article_id)
+            articles[id_in_feed] = models.Article(
+                id=article_id, feed=feed, id_in_feed=id_in_feed
             )
-            current_attachments.add(attachment)
+        else:
+            article = articles.get(id_in_feed)
+            if article is None:
+                # Inserted by someone else after the existing articles were
+                # loaded, the upsert updated it
+                article = models.Article(id=article_id, feed=feed,
+                                         id_in_feed=id_in_feed)
+                articles[id_in_feed] = article
+            articles_to_uncache.append(article)
 
-        attachments_ids_to_delete = set()
-        for attachment in article.attachment_set.all():
-            if attachment not in current_attachments:
-                attachments_ids_to_delete.add(attachment.id)
+    if written_articles:
+        logger.info('Created %d and updated %d articles of %s',
+                    len(created_dates),
+                    len(written_articles) - len(created_dates), feed)
+        feed_stats.record_new_articles(feed, created_dates, current_date)
+        inbox.add_articles(feed, created_ids)
+        inbox.update_article_dates(a.id for a in articles_to_uncache)
+
+    _synchronize_attachments(
+        [
+            (article, parsed_articles[id_in_feed])
+            for id_in_feed, article in articles.items()
+        ],
+        existing_article_ids=[article.id for article in articles.values()]
+    )
 
-        deleted_attachments, _ = (
-            models.Attachment.objects
-            .filter(article=article)
-            .filter(id__in=attachments_ids_to_delete)
-            .delete()
+    if remaining_ids:
+        remainder = SyncRemainder(
+            attr.evolve(parsed_feed, articles=[
+                parsed_articles[id_in_feed] for id_in_feed in remaining_ids
+            ]),
+            rows_to_write[0]['created_at']
         )
-        if deleted_attachments:
-            logger.info('Deleted %d old attachments', deleted_attachments)
+        _schedule_remainder(feed, remainder, current_date)
 
     if articles_to_uncache:
         logger.info('Removing %d updated articles from cache',
@@ -234,6 +889,193 @@ def synchronize_parsed_feed(feed: models.Feed, parsed_feed: ParsedFeed):
     cache_images(images_uris)
 
 
+def _select_articles_to_process(feed: models.Feed, parsed_articles: dict,
+                                articles_defaults: dict, content_hashes: dict,
+                                full: bool, current_date: datetime) -> dict:
+    """Decide between a full and an incremental synchronization.
+
+    The fields of the feed tracking the newest article are updated.
+    """
+    full = full or _is_full_sync_needed(feed, articles_defaults, current_date)
+    if full:
+        feed.last_full_sync_at = current_date
+    else:
+        parsed_articles = _get_articles_to_process(feed, parsed_articles,
+                                                   content_hashes)
+        logger.info('Incremental synchronization of %s, processing %d of '
+                    '%d articles', feed, len(parsed_articles),
+                    len(articles_defaults))
+
+    newest_id = next(iter(articles_defaults), None)
+    if newest_id is not None:
+        feed.head_id_in_feed = newest_id
+        feed.head_published_at = articles_defaults[newest_id]['published_at']
+        feed.head_hash = content_hashes[newest_id]
+
+    return parsed_articles
+
+
+def _set_creation_dates(rows: List[dict],
+                        created_before: Optional[datetime]):
+    """Date rows in the order they are inserted, oldest article first.
+
+    Boards sort articles sharing a publication date, or without one, by
+    creation date. Rows left over by a capped synchronization are dated
+    right before the rows it wrote, they contain older articles.
+    """
+    if created_before is None:
+        first_date = now()
+    else:
+        first_date = created_before - CREATION_DATE_STEP * len(rows)
+
+    for i, row in enumerate(rows):
+        row['created_at'] = first_date + CREATION_DATE_STEP * i
+
+
+def _schedule_remainder(feed: models.Feed, remainder: SyncRemainder,
+                        current_date: datetime):
+    """Keep the articles a capped synchronization did not write for later."""
+    logger.info('Synchronization of %s capped to %d articles, continuing '
+                'with %d articles at %s', feed, READER_SYNC_MAX_ARTICLES,
+                len(remainder.parsed_feed.articles),
+                current_date + SYNC_FOLLOW_UP_DELAY)
+    cache.set(
+        SYNC_REMAINDER_CACHE_KEY.format(feed.id), remainder,
+        timeout=SYNC_REMAINDER_TIMEOUT.total_seconds()
+    )
+    tasks.schedule_at('synchronize_feed_remainder',
+                      current_date + SYNC_FOLLOW_UP_DELAY, feed.id)
+
+
+def _is_full_sync_needed(feed: models.Feed, articles_defaults: dict,
+                         current_date: datetime) -> bool:
+    """Tell if all the articles of a feed must be processed."""
+    if feed.last_full_sync_at is None:
+        return True
+
+    if feed.last_full_sync_at + READER_SYNC_FULL_INTERVAL <= current_date:
+        return True
+
+    # Stopping early only makes sense if articles are listed newest first
+    dates = [d['published_at'] for d in articles_defaults.values()
+             if d['published_at'] is not None]
+    if any(newer < older for newer, older in zip(dates, dates[1:])):
+        return True
+
+    # The newest article is older than the newest seen last time, the feed
+    # was reordered or articles were removed
+    newest_date = dates[0] if dates else None
+    if newest_date and feed.head_published_at:
+        return newest_date < feed.head_published_at
+
+    return False
+
+
+def _get_articles_to_process(feed: models.Feed, parsed_articles: dict,
+                             content_hashes: dict) -> dict:
+    """Keep the parsed articles preceding a run of known unchanged ones."""
+    newest_id = next(iter(parsed_articles), None)
+    if newest_id is not None and newest_id == feed.head_id_in_feed:
+        if content_hashes[newest_id] == bytes(feed.head_hash or b''):
+            logger.debug('Newest article of %s did not change', feed)
+            return dict()
+
+    rv = dict()
+    known_run = 0
+    items = list(parsed_articles.items())
+    for i in range(0, len(items), INCREMENTAL_CHUNK_SIZE):
+        chunk = items[i:i + INCREMENTAL_CHUNK_SIZE]
+        stored_hashes = dict(
+            models.Article.objects.filter(feed=feed)
+            .filter(id_in_feed__in=[id_in_feed for id_in_feed, _ in chunk])
+            .filter(content_hash__isnull=False)
+            .values_list('id_in_feed', 'content_hash')
+        )
+        for id_in_feed, parsed_article in chunk:
+            stored_hash = stored_hashes.get(id_in_feed)
+            if stored_hash is None or (
+                    bytes(stored_hash) != content_hashes[id_in_feed]):
+                known_run = 0
+                rv[id_in_feed] = parsed_article
+                continue
+
+            known_run += 1
+            if known_run >= INCREMENTAL_KNOWN_RUN:
+                return rv
+
+    return rv
+
+
+def _synchronize_attachments(articles_and_parsed_articles: list,
+                             existing_article_ids: list):
+    """Reconcile the attachments of many articles at once.
+
+    Existing attachments are fetched with a single query, then new ones are
+    inserted, modified ones updated and removed ones deleted with one
+    statement each.
+    """
+    existing_attachments = list(
+        models.Attachment.objects.filter(article_id__in=existing_article_ids)
+    )
+    attachments_index = ObjectIndex(
+        existing_attachments,
+        lookup_fields=('article_id', 'uri'),
+        compared_fields=ATTACHMENT_COMPARED_FIELDS
+    )
+
+    attachments_to_create = list()
+    attachments_to_update = list()
+    kept_attachments_ids = set()
+    seen_lookups = set()
+    for article, parsed_article in articles_and_parsed_articles:
+        for parsed_attachment in parsed_article.attachments:
+            lookup = {'article_id': article.id, 'uri': parsed_attachment.link}
+            if (article.id, parsed_attachment.link) in seen_lookups:
+                continue
+            seen_lookups.add((article.id, parsed_attachment.link))
+
+            defaults = {
+                'title': parsed_attachment.title,
+                'mime_type': parsed_attachment.mime_type or '',
+                'size_in_bytes': parsed_attachment.size_in_bytes or None,
+                'duration': parsed_attachment.duration
+            }
+            attachment = attachments_index.get(**lookup)
+            if attachment is None:
+                attachments_to_create.append(models.Attachment(
+                    article=article, uri=parsed_attachment.link, **defaults
+                ))
+                continue
+
+            kept_attachments_ids.add(attachment.id)
+            if not attachments_index.is_unchanged(defaults, **lookup):
+                for k, v in defaults.items():
+                    setattr(attachment, k, v)
+                attachments_to_update.append(attachment)
+
+    attachments_ids_to_delete = [
+        attachment.id for attachment in existing_attachments
+        if attachment.id not in kept_attachments_ids
+    ]
+
+    if attachments_to_create:
+        models.Attachment.objects.bulk_create(attachments_to_create)
+        logger.info('Created %d attachments', len(attachments_to_create))
+
+    if attachments_to_update:
+        models.Attachment.objects.bulk_update(attachments_to_update,
+                                              ATTACHMENT_COMPARED_FIELDS)
+        logger.info('Updated %d attachments', len(attachments_to_update))
+
+    if attachments_ids_to_delete:
+        deleted_attachments, _ = (
+            models.Attachment.objects
+            .filter(id__in=attachments_ids_to_delete)
+            .delete()
+        )
+        logger.info('Deleted %d old attachments', deleted_attachments)
+
+
 @tasks.task(name='cache_images')
 def cache_images(images_uris):
     if not READER_CACHE_IMAGES:
@@ -249,46 +1091,58 @@ def cache_images(images_uris):
     logger.info('Attempting to cache %d images (%d already cached)',
                 len(images_uris), len(already_cached_uris))
 
-    with requests.Session() as session:
-        for image_uri in images_uris:
-            try:
-                image_data = http_fetcher.fetch_image(session, image_uri)
-                processed = image_processing.process_image_data(image_data)
-            except (requests.RequestException,
-                    http_fetcher.FetchFileTooBigError,
-                    image_processing.ImageProcessingError) as e:
-                failure_reason = str(e)
-                if failure_reason == 'Tracking pixel':
-                    logger.info('Detected tracking pixel')
-                else:
-                    logger.warning('Failed to cache image: %s', failure_reason)
-                _create_cached_image_object(
-                    uri=image_uri,
-                    failure_reason=failure_reason[:99]
-                )
-                continue
-
-            cached_image = _create_cached_image_object(
+    deferred_uris = list()
+    retry_after = 0
+    session = http_fetcher.get_session()
+    for image_uri in images_uris:
+        try:
+            image_data = http_fetcher.fetch_image(session, image_uri)
+            processed = image_processing.process_image_data(image_data)
+        except politeness.HostRateLimitedError as e:
+            deferred_uris.append(image_uri)
+            retry_after = max(retry_after, e.retry_after)
+            continue
+        except (requests.RequestException,
+                http_fetcher.FetchFileTooBigError,
+                image_processing.ImageProcessingError) as e:
+            failure_reason = str(e)
+            if failure_reason == 'Tracking pixel':
+                logger.info('Detected tracking pixel')
+            else:
+                logger.warning('Failed to cache image: %s', failure_reason)
+            _create_cached_image_object(
                 uri=image_uri,
-                format=processed.image_format,
-                width=processed.width,
-                height=processed.height,
-                size_in_bytes=processed.size_in_bytes
+                failure_reason=failure_reason[:99]
             )
-            if cached_image is None:
-                continue
+            continue
+
+        cached_image = _create_cached_image_object(
+            uri=image_uri,
+            format=processed.image_format,
+            width=processed.width,
+            height=processed.height,
+            size_in_bytes=processed.size_in_bytes
+        )
+        if cached_image is None:
+            continue
 
-            try:
-                default_storage.save(
-                    cached_image.image_path, File(processed.data)
-                )
-            except Exception:
-                cached_image.delete()
-                raise
+        try:
+            default_storage.save(
+                cached_image.image_path, File(processed.data)
+            )
+        except Exception:
+            cached_image.delete()
+            raise
 
-            logger.info('Cached image %s %dx%d %s', cached_image.format,
-                        cached_image.width, cached_image.height,
-                        filesizeformat(cached_image.size_in_bytes))
+        logger.info('Cached image %s %dx%d %s', cached_image.format,
+                    cached_image.width, cached_image.height,
+                    filesizeformat(cached_image.size_in_bytes))
+
+    if deferred_uris:
+        logger.info('Deferring caching of %d images', len(deferred_uris))
+        tasks.schedule_at('cache_images',
+                          now() + timedelta(seconds=retry_after),
+                          deferred_uris)
 
 
 def _create_cached_image_object(**kwargs) -> Optional[models.CachedImage]:
@@ -312,18 +1166,37 @@ def create_feed(user_id: int, uri: str):
                        uri, user_id)
         return
 
+    # Only one worker may create a feed from an URI, the others wait for it
+    # to be created
+    lease_name = 'uri_{}'.format(hashlib.sha1(uri.encode()).hexdigest())
+    lease_token = sync_lease.acquire(lease_name)
+    if lease_token is None:
+        tasks.schedule_at('create_feed', now() + LEASE_RETRY_DELAY,
+                          user_id, uri)
+        return
+
+    try:
+        _create_feed(user, uri)
+    finally:
+        sync_lease.release(lease_name, lease_token)
+
+
+def _create_feed(user, uri: str):
     # Check if the feed already exists
     parsed_feed = None
-    try:
-        feed = models.Feed.objects.get(uri=uri)
-    except ObjectDoesNotExist:
-        feed = None
-    else:
+    feed = feed_merging.find_feed(uri)
+    if feed is not None:
         logger.info('Feed already exists: %s', feed)
 
     if feed is None:
         try:
             feed, parsed_feed = _fetch_and_create_feed(uri)
+        except politeness.HostRateLimitedError as e:
+            logger.info('Deferring creation of feed "%s": %s', uri, e)
+            tasks.schedule_at('create_feed',
+                              now() + timedelta(seconds=e.retry_after),
+                              user.id, uri)
+            return
         except FeedFetchError as e:
             logger.warning('%s', e)
             background_messages.warning(user, str(e))
@@ -331,10 +1204,29 @@ def create_feed(user_id: int, uri: str):
 
     _subscribe_user(user, feed)
 
-    if parsed_feed is not None:
+    if parsed_feed is None:
+        return
+
+    # The new feed may already be picked up by the dispatcher
+    lease_name = sync_lease.feed_lease_name(feed.id)
+    lease_token = sync_lease.acquire(lease_name)
+    if lease_token is None:
+        return
+
+    try:
         synchronize_parsed_feed(feed, parsed_feed)
         feed.frequency_per_year = calculate_frequency_per_year(feed)
-        feed.save(update_fields=['frequency_per_year'])
+        feed.next_sync_at = scheduling.get_next_sync_at(
+            now(), scheduling.get_sync_interval(feed.frequency_per_year, 1,
+                                                has_changed=True)
+        )
+        feed.save(update_fields=[
+            'frequency_per_year', 'next_sync_at', 'head_id_in_feed',
+            'head_published_at', 'head_hash', 'last_full_sync_at'
+        ])
+    finally:
+        if sync_lease.release(lease_name, lease_token):
+            _schedule_upgraded_syncs([feed.id])
 
 
 def _subscribe_user(user, feed):
@@ -356,7 +1248,7 @@ class FeedFetchError(Exception):
 def _fetch_and_create_feed(uri: str, process_html: bool=True
                            ) -> Tuple[models.Feed, Optional[ParsedFeed]]:
     try:
-        feed_request = http_fetcher.fetch_feed(uri, None, None, 1, None)
+        feed_request = http_fetcher.fetch_feed(uri, '', '', None, 1, None)
     except (requests.exceptions.RequestException,
             http_fetcher.FetchFileTooBigError):
         raise FeedFetchError(f'Could not create feed "{uri}", HTTP get failed')
@@ -383,6 +1275,11 @@ def _fetch_and_create_feed(uri: str, process_html: bool=True
             f'Could not create feed "{uri}", content is not a valid feed'
         )
 
+    feed = feed_merging.find_feed(feed_request.final_url)
+    if feed is not None:
+        logger.info('Submitted URI %s points to existing %s', uri, feed)
+        return feed, None
+
     feed, created = models.Feed.objects.update_or_create(
         defaults={'name': utils.shrink_str(parsed_feed.title)},
         uri=feed_request.final_url
@@ -396,20 +1293,14 @@ def _fetch_and_create_feed(uri: str, process_html: bool=True
 
 
 def calculate_frequency_per_year(feed: models.Feed) -> Optional[int]:
-    last_year = now() - timedelta(days=365)
-    oldest_article = (
-        feed.article_set.filter(published_at__gt=last_year)
-        .order_by('published_at').only('published_at', 'feed_id').first()
-    )
-    if oldest_article is None:
+    stats = feed_stats.get_window(feed)
+    if stats.oldest_in_window is None:
         return None
 
-    num_articles_over_year = (
-        feed.article_set.filter(published_at__gt=last_year).count()
-    )
+    num_articles_over_year = stats.articles_in_window
 
     try:
-        yearly_ratio = 365 / (now() - oldest_article.published_at).days
+        yearly_ratio = 365 / (now() - stats.oldest_in_window).days
     except ZeroDivisionError:
         # Oldest article has been published today
         return None
@@ -425,8 +1316,63 @@ def _is_object_equivalent(obj, attributes: dict):
     return True
 
 
+_MISSING = object()
+
+
+class ObjectIndex:
+    """Existing objects indexed by the fields used to look them up.
+
+    Finding an object is a dict lookup instead of a scan of all the existing
+    objects. The values of the compared fields of each object are stored as a
+    tuple when the index is built so that checking whether an object needs to
+    be updated costs a single tuple comparison.
+    """
+
+    def __init__(self, objects, lookup_fields, compared_fields=()):
+        self.lookup_fields = tuple(sorted(lookup_fields))
+        self.compared_fields = tuple(compared_fields)
+        self._objects = dict()
+        self._values = dict()
+        for obj in objects:
+            key = tuple(getattr(obj, f, _MISSING) for f in self.lookup_fields)
+            if key in self._objects:
+                continue
+            self._objects[key] = obj
+            self._values[key] = tuple(
+                getattr(obj, f, _MISSING) for f in self.compared_fields
+            )
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __iter__(self):
+        return iter(self._objects.values())
+
+    def _get_key(self, lookup: dict) -> tuple:
+        if tuple(sorted(lookup)) != self.lookup_fields:
+            raise ValueError('Index on {} cannot be searched by {}'.format(
+                self.lookup_fields, tuple(lookup)
+            ))
+        return tuple(lookup[f] for f in self.lookup_fields)
+
+    def get(self, **lookup):
+        return self._objects.get(self._get_key(lookup))
+
+    def is_unchanged(self, attributes: dict, **lookup) -> bool:
+        """Tell if the indexed object has all these attribute values."""
+        key = self._get_key(lookup)
+        obj = self._objects.get(key)
+        if obj is None:
+            return False
+
+        if tuple(attributes) == self.compared_fields:
+            return tuple(attributes.values()) == self._values[key]
+
+        return _is_object_equivalent(obj, attributes)
+
+
 def create_or_update_if_needed(model: ModelBase,
-                               existing_objects: list,
+                               existing_objects,
                                defaults: Optional[dict]=None, **kwargs
                                ) -> Tuple[models.models.Model, bool, bool]:
     """Create or update an object only if needed.
@@ -434,9 +1380,11 @@ def create_or_update_if_needed(model: ModelBase,
     The Django update_or_create always issues either an INSERT INTO or an
     UPDATE, even when the object exists and does not need modification.
 
-    This function solves this problem by trying to find the object in a list
-    of pre-existing objects. It only calls update_or_create when the object is
-    not found or found to be different.
+    This function solves this problem by trying to find the object in an
+    index of pre-existing objects. It only calls update_or_create when the
+    object is not found or found to be different. A plain list of objects is
+    also accepted, it is indexed on the fly which is only worth it for a
+    single call.
 
     This approach is more prone to race-conditions than the normal Django
     update_or_create but the ability to know if an object has been created or
@@ -447,14 +1395,11 @@ def create_or_update_if_needed(model: ModelBase,
     created and updated.
     """
     defaults = defaults or {}
+    if not isinstance(existing_objects, ObjectIndex):
+        existing_objects = ObjectIndex(existing_objects, kwargs, defaults)
 
-    existing_object = None
-    for candidate_object in existing_objects:
-        if _is_object_equivalent(candidate_object, kwargs):
-            existing_object = candidate_object
-            break
-
-    if existing_object and _is_object_equivalent(existing_object, defaults):
+    existing_object = existing_objects.get(**kwargs)
+    if existing_object and existing_objects.is_unchanged(defaults, **kwargs):
         logger.debug('Not updated %s', existing_object)
         return existing_object, False, False
 
@@ -469,25 +1414,46 @@ def create_or_update_if_needed(model: ModelBase,
 
 @tasks.task(name='trim_long_feeds', periodicity=timedelta(weeks=1))
 def trim_long_feeds():
-    """Remove old articles on feeds that have a large number of articles."""
+    """Remove old articles of feeds exceeding their maximum size.
+
+    Retention is normally enforced after each synchronization, this catches
+    the feeds that are not synchronized anymore. Feeds without stats, never
+    synchronized since they were added, are counted first.
+    """
+    current_date = now()
+    feeds_without_stats = models.Feed.objects.filter(stats__isnull=True)
+    for feed in feeds_without_stats.iterator():
+        feed_stats.reconcile(feed, current_date)
+
     long_feeds = (
-        models.Feed.objects.annotate(num_articles=Count('article')).
-        filter(num_articles__gt=READER_FEED_ARTICLE_THRESHOLD).
-        all()
+        models.Feed.objects.select_related('stats')
+        .filter(stats__article_count__gt=Coalesce(
+            'retention_max_articles', Value(READER_FEED_ARTICLE_THRESHOLD)
+        ))
     )
+    for feed in long_feeds.iterator():
+        _enforce_retention(feed, current_date)
 
-    def chunker(seq, size):
-        return (seq[pos:pos + size] for pos in range(0, len(seq), size))
 
-    for feed in long_feeds:
-        num_articles_to_delete = feed.num_articles - READER_FEED_ARTICLE_THRESHOLD
-        articles_id_to_delete = (
-            feed.article_set.filter(stared_by__isnull=True).
-            reverse()[:num_articles_to_delete].values_list('id', flat=True)
-        )
+@tasks.task(name='enforce_retention')
+def enforce_retention(feed_id: int):
+    """Continue deleting the articles exceeding the retention of a feed."""
+    try:
+        feed = models.Feed.objects.select_related('stats').get(pk=feed_id)
+    except ObjectDoesNotExist:
+        logger.info('Not enforcing retention of feed %d, does not exist',
+                    feed_id)
+        return
+
+    _enforce_retention(feed, now())
 
-        # Delete articles in chunks of 10k to avoid large memory consumption
-        for chunk_to_delete in chunker(articles_id_to_delete, 10_000):
-            models.Article.objects.filter(pk__in=chunk_to_delete).delete()
 
-        logger.info('Deleted %d oldest articles from %s', num_articles_to_delete, feed)
+def _enforce_retention(feed: models.Feed, current_date: datetime):
+    """Enforce retention, leaving to a task what does not fit the budget."""
+    result = retention.enforce_retention(feed, current_date)
+    if result is None or result.is_complete:
+        return
+
+    logger.info('Retention of %s ran out of time, continuing later', feed)
+    tasks.schedule_at('enforce_retention',
+                      now() + READER_RETENTION_FOLLOW_UP_DELAY, feed.id)
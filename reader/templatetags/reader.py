@@ -76,9 +76,10 @@ def example_user_agent(_) -> str:
 
 @register.simple_tag(takes_context=True)
 def url_replace(context, **kwargs):
+    """Replace parameters of the current query string, None removes them."""
     query = context['request'].GET.dict()
     query.update(kwargs)
-    return urlencode(query)
+    return urlencode({k: v for k, v in query.items() if v is not None})
 
 
 @register.filter(name='dict_get')
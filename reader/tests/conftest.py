@@ -0,0 +1,31 @@
+import pytest
+from redis import RedisError
+
+from .. import inbox, read_state
+from ..settings import READER_REDIS
+
+
+@pytest.fixture
+def reader_redis():
+    """Redis used by the reader, tests are skipped when it is unavailable.
+
+    Keys created by a test must start with `test_` or contain `.test`, they
+    are removed after the test.
+    """
+    try:
+        READER_REDIS.ping()
+    except RedisError:
+        pytest.skip('Redis is not available')
+
+    yield READER_REDIS
+
+    for pattern in ('*test_*', '*.test*'):
+        keys = list(READER_REDIS.scan_iter(match=pattern))
+        if keys:
+            READER_REDIS.delete(*keys)
+
+
+@pytest.fixture
+def inbox_enabled(monkeypatch):
+    monkeypatch.setattr(inbox, 'READER_INBOX_ENABLED', True)
+    monkeypatch.setattr(read_state, 'READER_INBOX_ENABLED', True)
@@ -0,0 +1,180 @@
+import threading
+import time
+
+from django.utils.timezone import now
+import pytest
+import requests
+
+from .. import bulk_fetcher, http_fetcher, models, politeness, tasks
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Foo</title>
+  <item><guid>1</guid><title>Article</title></item>
+</channel></rss>"""
+
+
+def _get_result(uri: str) -> http_fetcher.FeedFetchResult:
+    return http_fetcher.FeedFetchResult(FEED, b'hash', False, uri, 200, '',
+                                        '', None)
+
+
+def test_fetch_feeds(monkeypatch):
+    def fetch_feed(kwargs):
+        if kwargs['uri'] == 'error':
+            raise requests.ConnectionError()
+        # The first feed is the slowest one
+        time.sleep(0.2 if kwargs['uri'] == '0' else 0)
+        return _get_result(kwargs['uri'])
+
+    monkeypatch.setattr(bulk_fetcher, '_fetch_feed', fetch_feed)
+    results = list(bulk_fetcher.fetch_feeds(
+        [{'uri': '0'}, {'uri': 'error'}, {'uri': '2'}]
+    ))
+
+    # Results are given as they complete, not in order
+    assert results[-1][0] == 0
+    results = dict(results)
+    assert results[0].final_url == '0'
+    assert isinstance(results[1], requests.ConnectionError)
+    assert results[2].final_url == '2'
+    assert list(bulk_fetcher.fetch_feeds([])) == []
+
+
+def test_fetch_feeds_bounds_pending_results(monkeypatch):
+    lock = threading.Lock()
+    started = list()
+    monkeypatch.setattr(bulk_fetcher, 'READER_BULK_FETCH_CONCURRENCY', 3)
+
+    def fetch_feed(kwargs):
+        with lock:
+            started.append(kwargs['uri'])
+        return _get_result(kwargs['uri'])
+
+    monkeypatch.setattr(bulk_fetcher, '_fetch_feed', fetch_feed)
+    results = bulk_fetcher.fetch_feeds([{'uri': str(i)} for i in range(10)])
+
+    num_consumed = 0
+    for _ in results:
+        num_consumed += 1
+        # Downloads only start when the caller takes results
+        time.sleep(0.01)
+        with lock:
+            assert len(started) <= num_consumed + 3
+
+    assert num_consumed == 10
+
+
+@pytest.mark.django_db
+def test_synchronize_feeds(monkeypatch):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    failing_feed = models.Feed.objects.create(name='Bar',
+                                              uri='https://bar.foo/feed')
+
+    def fetch_feed(kwargs):
+        if kwargs['feed_id'] == failing_feed.id:
+            raise requests.ConnectionError('Connection refused')
+        return _get_result(kwargs['uri'])
+
+    monkeypatch.setattr(bulk_fetcher, '_fetch_feed', fetch_feed)
+    tasks.synchronize_feeds([feed.id, failing_feed.id])
+
+    feed.refresh_from_db()
+    assert feed.article_set.get().title == 'Article'
+    assert feed.failure_count == 0
+    assert feed.last_sync_bytes == len(FEED)
+
+    failing_feed.refresh_from_db()
+    assert failing_feed.failure_count == 1
+    assert 'Connection refused' in failing_feed.last_failure
+
+
+@pytest.mark.django_db
+def test_synchronization_costs_accumulate():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    for _ in range(2):
+        tasks._handle_fetch_result(feed, _get_result(feed.uri), now())
+
+    feed.refresh_from_db()
+    assert feed.last_sync_articles == 1
+    assert feed.last_sync_bytes == len(FEED)
+    assert feed.total_sync_articles == 2
+    assert feed.total_sync_bytes == 2 * len(FEED)
+    assert feed.total_sync_duration >= feed.last_sync_duration
+
+
+@pytest.mark.django_db
+def test_synchronize_feeds_renews_leases(monkeypatch):
+    feeds = [
+        models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed'),
+        models.Feed.objects.create(name='Bar', uri='https://bar.foo/feed')
+    ]
+    events = list()
+    monkeypatch.setattr(tasks.sync_lease, 'LEASE_RENEWAL_INTERVAL', 0)
+    monkeypatch.setattr(tasks.sync_lease, 'acquire',
+                        lambda name, force: 'token')
+
+    def renew(name, token):
+        events.append(('renew', name))
+        return True
+
+    def release(name, token):
+        events.append(('release', name))
+        return False
+
+    monkeypatch.setattr(tasks.sync_lease, 'renew', renew)
+    monkeypatch.setattr(tasks.sync_lease, 'release', release)
+    monkeypatch.setattr(bulk_fetcher, 'READER_BULK_FETCH_CONCURRENCY', 1)
+    monkeypatch.setattr(bulk_fetcher, '_fetch_feed',
+                        lambda kwargs: _get_result(kwargs['uri']))
+
+    tasks.synchronize_feeds([feed.id for feed in feeds])
+
+    # Each lease is released once its feed is processed, the others are
+    # renewed meanwhile
+    first, second = (tasks.sync_lease.feed_lease_name(f.id) for f in feeds)
+    assert events == [('release', first), ('renew', second),
+                      ('release', second)]
+
+
+@pytest.mark.django_db
+def test_synchronize_feeds_same_host(reader_redis, monkeypatch):
+    monkeypatch.setattr(politeness, 'READER_HOST_MAX_CONCURRENCY', 2)
+    monkeypatch.setattr(tasks, 'READER_HOST_MAX_CONCURRENCY', 2)
+    monkeypatch.setattr(tasks, 'READER_SYNC_BULK_SIZE', 20)
+    feeds = [
+        models.Feed.objects.create(name='Foo',
+                                   uri='https://bulk.test/{}'.format(i))
+        for i in range(3)
+    ]
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fetch_feed(kwargs):
+        # All the downloads of the group are in flight at the same time
+        try:
+            with politeness.host_slot(kwargs['uri']):
+                barrier.wait()
+                return _get_result(kwargs['uri'])
+        except politeness.HostRateLimitedError:
+            barrier.wait()
+            raise
+
+    deferred = list()
+
+    def schedule_at(task, at, feed_id, **kwargs):
+        deferred.append(feed_id)
+
+    monkeypatch.setattr(tasks.tasks, 'schedule_at', schedule_at)
+    monkeypatch.setattr(bulk_fetcher, '_fetch_feed', fetch_feed)
+    tasks.synchronize_feeds([feed.id for feed in feeds])
+
+    # The feed over the limit of the host is deferred, not failed
+    assert len(deferred) == 1
+    for feed in feeds:
+        feed.refresh_from_db()
+        assert feed.failure_count == 0
+    assert sum(feed.article_set.count() for feed in feeds) == 2
+
+    # This is why the dispatcher spreads the feeds of a host over groups
+    hosts = {feed.id: 'bulk.test' for feed in feeds}
+    groups = tasks.group_feeds([feed.id for feed in feeds], hosts)
+    assert [len(group) for group in groups] == [2, 1]
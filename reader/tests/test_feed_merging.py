@@ -0,0 +1,61 @@
+from django.utils.timezone import now
+import pytest
+
+from .. import feed_merging, models, read_state
+
+
+@pytest.mark.django_db
+def test_merge_feeds():
+    survivor = models.Feed.objects.create(name='Foo',
+                                          uri='https://foo.bar/feed')
+    duplicate = models.Feed.objects.create(name='Foo',
+                                           uri='http://FOO.bar:80/feed/')
+    assert feed_merging.find_feed('https://foo.bar/feed/') == survivor
+    assert feed_merging.find_feed('http://foo.bar/feed',
+                                  exclude=survivor) == duplicate
+
+    alice = models.User.objects.create(username='alice',
+                                       last_login=now()).reader_profile
+    bob = models.User.objects.create(username='bob',
+                                     last_login=now()).reader_profile
+    models.Subscription.objects.create(feed=survivor, reader=alice,
+                                       tags=['news'])
+    models.Subscription.objects.create(feed=duplicate, reader=alice,
+                                       tags=['tech'])
+    models.Subscription.objects.create(feed=duplicate, reader=bob)
+
+    shared_article = models.Article.objects.create(feed=survivor,
+                                                   id_in_feed='1')
+    duplicate_article = models.Article.objects.create(feed=duplicate,
+                                                      id_in_feed='1')
+    moved_article = models.Article.objects.create(feed=duplicate,
+                                                  id_in_feed='2')
+    bob.stars.add(duplicate_article)
+    read_state.mark_feeds_read(bob, [duplicate.id])
+    read_state.set_read(alice, duplicate_article, True)
+
+    feed_merging.merge_feeds(duplicate, survivor)
+
+    assert not models.Feed.objects.filter(id=duplicate.id).exists()
+    subscriptions = {
+        s.reader_id: s.tags
+        for s in models.Subscription.objects.filter(feed=survivor)
+    }
+    assert subscriptions == {alice.id: ['news', 'tech'], bob.id: []}
+    assert set(survivor.article_set.all()) == {shared_article, moved_article}
+    assert list(bob.stars.all()) == [shared_article]
+    read_articles = (
+        read_state.annotate_is_read(survivor.article_set.all(), bob)
+        .filter(is_read=True)
+    )
+    assert set(read_articles) == {shared_article, moved_article}
+
+    # The watermark of bob is carried over, articles read by alice in the
+    # duplicate are read in the survivor
+    assert not models.ReadStateException.objects.filter(reader=bob).exists()
+    read_articles = (
+        read_state.annotate_is_read(survivor.article_set.all(), alice)
+        .filter(is_read=True)
+    )
+    assert list(read_articles) == [shared_article]
+    assert survivor.stats.subscriber_count == 2
@@ -0,0 +1,177 @@
+from datetime import timedelta
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import threading
+
+import pytest
+import requests
+
+from .. import http_fetcher, models, tasks
+
+
+def _get_response(content: bytes) -> requests.Response:
+    r = requests.Response()
+    r.status_code = 200
+    r.raw = BytesIO(content)
+    return r
+
+
+def test_download():
+    content = b'foo' * 100_000
+    body, content_hash = http_fetcher._download(_get_response(content))
+    with body:
+        assert body.read() == content
+    assert content_hash == hashlib.sha1(content).digest()
+
+
+def test_download_too_big(monkeypatch):
+    monkeypatch.setattr(http_fetcher, 'MAX_DOWNLOAD_BYTES', 1024)
+    with pytest.raises(http_fetcher.FetchFileTooBigError):
+        http_fetcher._download(_get_response(b'a' * 1025))
+
+
+def test_session_reuses_connections():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    uri = 'http://127.0.0.1:{}/'.format(server.server_port)
+    try:
+        stats_before = http_fetcher.get_connection_stats()
+        for _ in range(3):
+            with http_fetcher.get_session().get(uri, timeout=5) as r:
+                assert r.content == b'foo'
+        stats_after = http_fetcher.get_connection_stats()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert stats_after['requests'] - stats_before['requests'] == 3
+    assert stats_after['new_connections'] - stats_before['new_connections'] == 1
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '3')
+        self.end_headers()
+        self.wfile.write(b'foo')
+
+    def log_message(self, *args):
+        pass
+
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Foo</title>
+  <item><guid>1</guid><title>Article</title></item>
+</channel></rss>"""
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 21 Oct 2015 07:28:00 GMT'
+
+
+class _ConditionalHandler(BaseHTTPRequestHandler):
+    """Serve a feed that never changes, honouring conditional requests."""
+    protocol_version = 'HTTP/1.1'
+    requests_headers = list()
+
+    def do_GET(self):
+        self.requests_headers.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(FEED)))
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    _ConditionalHandler.requests_headers = list()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ConditionalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}/feed'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def _fetch_feed(uri, etag='', last_modified=''):
+    return http_fetcher.fetch_feed(uri, etag, last_modified, None,
+                                   subscriber_count=1, feed_id=1)
+
+
+def test_fetch_feed_sends_validators(feed_server, monkeypatch):
+    # The User-Agent reads the current site from the database
+    monkeypatch.setattr(http_fetcher, 'get_user_agent', lambda *args: 'Test')
+    result = _fetch_feed(feed_server)
+    assert result.is_modified
+    assert result.content == FEED
+    assert result.etag == ETAG
+    assert result.last_modified == LAST_MODIFIED
+    headers = _ConditionalHandler.requests_headers[0]
+    assert 'If-None-Match' not in headers
+    assert 'If-Modified-Since' not in headers
+
+    result = _fetch_feed(feed_server, ETAG, LAST_MODIFIED)
+    headers = _ConditionalHandler.requests_headers[1]
+    assert headers['If-None-Match'] == ETAG
+    assert headers['If-Modified-Since'] == LAST_MODIFIED
+
+    # The 304 omits Last-Modified, the stored one is kept
+    assert not result.is_modified
+    assert result.status_code == 304
+    assert result.etag == ETAG
+    assert result.last_modified == LAST_MODIFIED
+
+
+@pytest.mark.django_db
+def test_synchronize_feed_not_modified(feed_server, monkeypatch):
+    feed = models.Feed.objects.create(name='Foo', uri=feed_server)
+    tasks._synchronize_feed(feed.id, force=False)
+    feed.refresh_from_db()
+    assert feed.etag == ETAG
+    assert feed.last_modified == LAST_MODIFIED
+    assert (feed.fetch_count, feed.not_modified_count) == (1, 0)
+    assert feed.article_set.count() == 1
+
+    def parse(content):
+        raise AssertionError('An unchanged feed must not be parsed')
+
+    monkeypatch.setattr(tasks, 'simple_parse_bytes', parse)
+    tasks._synchronize_feed(feed.id, force=False)
+    assert _ConditionalHandler.requests_headers[1]['If-None-Match'] == ETAG
+    feed.refresh_from_db()
+    assert feed.etag == ETAG
+    assert feed.last_modified == LAST_MODIFIED
+    assert (feed.fetch_count, feed.not_modified_count) == (2, 1)
+
+
+def test_get_freshness_lifetime():
+    assert http_fetcher.get_freshness_lifetime({}) is None
+    assert http_fetcher.get_freshness_lifetime({
+        'Cache-Control': 'public, max-age=600'
+    }) == timedelta(minutes=10)
+    assert http_fetcher.get_freshness_lifetime({
+        'Cache-Control': 'no-cache, max-age=600'
+    }) is None
+    assert http_fetcher.get_freshness_lifetime({
+        'Date': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        'Expires': 'Wed, 21 Oct 2015 08:28:00 GMT'
+    }) == timedelta(hours=1)
+
+
+def test_get_retry_after():
+    assert http_fetcher.get_retry_after({}) is None
+    assert http_fetcher.get_retry_after({'Retry-After': '120'}) == (
+        timedelta(minutes=2)
+    )
+    assert http_fetcher.get_retry_after({'Retry-After': 'foo'}) is None
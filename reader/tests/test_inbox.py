@@ -0,0 +1,104 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+from .. import feed_merging, inbox, models, read_state, tasks
+
+
+def _get_entries(reader):
+    return {
+        entry.article_id: entry.is_read
+        for entry in models.InboxEntry.objects.filter(reader=reader)
+    }
+
+
+@pytest.mark.django_db
+def test_inbox(inbox_enabled):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    old_article = models.Article.objects.create(feed=feed, id_in_feed='1')
+    read_state.mark_articles_read(reader, feed.article_set.all())
+
+    # Subscribing copies the existing articles with their read state
+    subscription = models.Subscription.objects.create(feed=feed,
+                                                      reader=reader)
+    assert _get_entries(reader) == {old_article.id: True}
+
+    new_article = models.Article.objects.create(feed=feed, id_in_feed='2')
+    inbox.add_articles(feed, [new_article.id])
+    assert _get_entries(reader) == {old_article.id: True,
+                                    new_article.id: False}
+
+    read_state.set_read(reader, old_article, False)
+    assert _get_entries(reader) == {old_article.id: False,
+                                    new_article.id: False}
+
+    read_state.mark_feeds_read(reader, [feed.id])
+    assert _get_entries(reader) == {old_article.id: True,
+                                    new_article.id: True}
+
+    entries = inbox.get_entries(reader)
+    articles = inbox.get_articles(entries)
+    assert {a.id: (a.is_read, a.is_starred) for a in articles} == {
+        old_article.id: (True, False), new_article.id: (True, False)
+    }
+
+    subscription.delete()
+    assert _get_entries(reader) == {}
+
+
+@pytest.mark.django_db
+def test_inbox_disabled():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    models.Subscription.objects.create(feed=feed, reader=reader)
+    article = models.Article.objects.create(feed=feed, id_in_feed='1')
+    inbox.add_articles(feed, [article.id])
+    assert not models.InboxEntry.objects.exists()
+
+
+@pytest.mark.django_db
+def test_synchronize_parsed_feed_fills_inbox(inbox_enabled):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    models.Subscription.objects.create(feed=feed, reader=reader)
+    parsed_feed = tasks.simple_parse_bytes(b"""<?xml version="1.0"?>
+    <rss version="2.0"><channel><title>Foo</title>
+      <item><guid>2</guid><pubDate>Wed, 02 Jan 2019 00:00:00 GMT</pubDate>
+      </item>
+      <item><guid>1</guid></item>
+    </channel></rss>""")
+
+    # New articles are copied under a lock of the feed, a concurrent
+    # subscription cannot miss them
+    with CaptureQueriesContext(connection) as queries:
+        tasks.synchronize_parsed_feed(feed, parsed_feed)
+    assert any('FOR UPDATE' in q['sql'] for q in queries)
+
+    articles = {a.id_in_feed: a for a in feed.article_set.all()}
+    assert _get_entries(reader) == {articles['1'].id: False,
+                                    articles['2'].id: False}
+
+    parsed_feed.articles[0].published_at = None
+    tasks.synchronize_parsed_feed(feed, parsed_feed, full=True)
+    entry = models.InboxEntry.objects.get(article=articles['2'])
+    assert entry.published_at is None
+
+
+@pytest.mark.django_db
+def test_merge_feeds_fills_inbox(inbox_enabled):
+    survivor = models.Feed.objects.create(name='Foo',
+                                          uri='https://foo.bar/feed')
+    duplicate = models.Feed.objects.create(name='Foo',
+                                           uri='http://foo.bar/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    models.Subscription.objects.create(feed=duplicate, reader=reader)
+    duplicate_article = models.Article.objects.create(feed=duplicate,
+                                                      id_in_feed='1')
+    inbox.add_articles(duplicate, [duplicate_article.id])
+    survivor_article = models.Article.objects.create(feed=survivor,
+                                                     id_in_feed='2')
+
+    feed_merging.merge_feeds(duplicate, survivor)
+    assert _get_entries(reader) == {duplicate_article.id: False,
+                                    survivor_article.id: False}
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+from .. import models, pagination
+
+
+def test_cursor():
+    article = models.Article(
+        id=42, published_at=None,
+        created_at=datetime(2019, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+    )
+    cursor = pagination.encode_cursor(article)
+    assert pagination.decode_cursor(cursor) == (None, article.created_at, 42)
+
+    article.published_at = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    cursor = pagination.encode_cursor(article)
+    assert pagination.decode_cursor(cursor) == (
+        article.published_at, article.created_at, 42
+    )
+
+    with pytest.raises(ValueError):
+        pagination.decode_cursor('foo')
+
+    queryset = models.Article.objects.none()
+    for cursor in ('foo', '1.2', '999999999999999999999.1.1'):
+        with pytest.raises(Http404):
+            pagination.paginate(queryset, 3, after=cursor)
+
+
+def _create_articles(feed):
+    published_at = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    articles = list()
+    for i in range(7):
+        # Articles 0 and 1 are not dated, 3 to 6 share the same date
+        article_published_at = None
+        if i > 1:
+            article_published_at = published_at + timedelta(days=min(i, 3))
+        articles.append(models.Article.objects.create(
+            feed=feed, id_in_feed=str(i), published_at=article_published_at
+        ))
+    return articles
+
+
+@pytest.mark.django_db
+def test_paginate():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    articles = _create_articles(feed)
+    expected = [articles[1], articles[0], articles[6], articles[5],
+                articles[4], articles[3], articles[2]]
+    assert list(feed.article_set.all()) == expected
+
+    queryset = models.Article.objects.filter(feed=feed)
+    pages = [pagination.paginate(queryset, 3)]
+    while pages[-1].older_cursor:
+        pages.append(pagination.paginate(queryset, 3,
+                                         after=pages[-1].older_cursor))
+    assert [a for p in pages for a in p.object_list] == expected
+    assert [len(p.object_list) for p in pages] == [3, 3, 1]
+    assert pages[0].newer_cursor is None
+    assert pages[-1].older_cursor is None
+
+    newer = pagination.paginate(queryset, 3, before=pages[2].newer_cursor)
+    assert newer == pages[1]
+
+    # Going back to the newest articles shows a full first page
+    newest = pagination.paginate(queryset, 3, before=pages[1].newer_cursor)
+    assert newest == pages[0]
+
+
+@pytest.mark.django_db
+def test_paginate_query_plan():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    articles = _create_articles(feed)
+    queryset = models.Article.objects.filter(feed=feed)
+    cursor = pagination.encode_cursor(articles[4])
+
+    with CaptureQueriesContext(connection) as queries:
+        pagination.paginate(queryset, 3, after=cursor)
+    assert len(queries) == 1
+    sql = queries[0]['sql'].upper()
+    assert 'OFFSET' not in sql
+    assert 'COUNT(' not in sql
+
+    # Even on a tiny table the page must be read from the index without
+    # sorting
+    page_query = (
+        queryset.filter(pagination._older_than(
+            pagination.decode_cursor(cursor)
+        ))
+        .order_by(*pagination.newest_first())[:4]
+    )
+    page_sql, params = page_query.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN ' + page_sql, params)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+    assert 'reader_arti_feed_id_ce6431_idx' in plan
+    assert 'Sort' not in plan
+
+    # The scan starts at the cursor rather than at the newest article
+    index_conditions = [line for line in plan.splitlines()
+                        if 'Index Cond' in line]
+    assert len(index_conditions) == 1
+    assert 'published_at <=' in index_conditions[0]
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from .. import politeness
+
+HOST = 'politeness.test'
+URI = 'https://{}/feed'.format(HOST)
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(politeness, 'READER_HOST_RATE', 1.0)
+    monkeypatch.setattr(politeness, 'READER_HOST_BURST', 2)
+    monkeypatch.setattr(politeness, 'READER_HOST_MAX_CONCURRENCY', 10)
+
+
+def test_get_host():
+    assert politeness.get_host('https://Foo.Bar:8080/feed') == 'foo.bar:8080'
+
+
+def test_host_rate(reader_redis, limits):
+    for _ in range(2):
+        with politeness.host_slot(URI):
+            pass
+
+    with pytest.raises(politeness.HostRateLimitedError) as e:
+        with politeness.host_slot(URI):
+            pass
+    assert e.value.host == HOST
+    assert 0 < e.value.retry_after <= 1
+
+    state = politeness.get_host_state(HOST)
+    assert state['tokens'] < 1
+    assert state['active_requests'] == 0
+
+
+def test_host_concurrency(reader_redis, limits, monkeypatch):
+    monkeypatch.setattr(politeness, 'READER_HOST_BURST', 10)
+    monkeypatch.setattr(politeness, 'READER_HOST_MAX_CONCURRENCY', 1)
+
+    with politeness.host_slot(URI):
+        assert politeness.get_host_state(HOST)['active_requests'] == 1
+        with pytest.raises(politeness.HostRateLimitedError) as e:
+            with politeness.host_slot(URI):
+                pass
+        assert e.value.retry_after == politeness.CONCURRENCY_RETRY_AFTER
+
+    # The slot is released when the request is done
+    with politeness.host_slot(URI):
+        pass
+
+
+def test_stale_slots_expire(reader_redis, limits, monkeypatch):
+    monkeypatch.setattr(politeness, 'READER_HOST_MAX_CONCURRENCY', 1)
+
+    # Slot of a crashed worker that expired a second ago
+    reader_redis.zadd(politeness._slots_key(HOST),
+                      {'crashed': time.time() - 1})
+    with politeness.host_slot(URI):
+        assert politeness.get_host_state(HOST)['active_requests'] == 1
@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.utils.timezone import now
+import pytest
+
+from .. import models, read_state
+
+
+def _read_articles(feed, reader):
+    return set(
+        read_state.annotate_is_read(feed.article_set.all(), reader)
+        .filter(is_read=True)
+    )
+
+
+@pytest.mark.django_db
+def test_watermark_and_exceptions():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    subscription = models.Subscription.objects.create(feed=feed,
+                                                      reader=reader)
+    first, second = (
+        models.Article.objects.create(feed=feed, id_in_feed=str(i))
+        for i in range(2)
+    )
+    assert _read_articles(feed, reader) == set()
+
+    read_state.set_read(reader, second, True)
+    assert _read_articles(feed, reader) == {second}
+    assert models.ReadStateException.objects.count() == 1
+
+    read_state.mark_feeds_read(reader, [feed.id])
+    subscription.refresh_from_db()
+    assert subscription.read_up_to_id == second.id
+    assert _read_articles(feed, reader) == {first, second}
+    # The exception is covered by the watermark
+    assert models.ReadStateException.objects.count() == 0
+
+    read_state.set_read(reader, first, False)
+    assert _read_articles(feed, reader) == {second}
+    assert read_state.filter_unread(feed.article_set.all(),
+                                    reader).get() == first
+
+    read_state.set_read(reader, first, True)
+    assert models.ReadStateException.objects.count() == 0
+
+    third = models.Article.objects.create(feed=feed, id_in_feed='3')
+    assert _read_articles(feed, reader) == {first, second}
+
+    read_state.mark_articles_read(reader, feed.article_set.all())
+    assert _read_articles(feed, reader) == {first, second, third}
+    assert models.ReadStateException.objects.get().article == third
+
+
+@pytest.mark.django_db
+def test_read_state_without_subscription():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    article = models.Article.objects.create(feed=feed, id_in_feed='1')
+
+    read_state.mark_articles_read(reader, feed.article_set.all())
+    assert _read_articles(feed, reader) == {article}
+
+    read_state.set_read(reader, article, False)
+    assert _read_articles(feed, reader) == set()
+    assert models.ReadStateException.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_mark_read_before_date():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    other_feed = models.Feed.objects.create(name='Bar',
+                                            uri='https://bar.foo/feed')
+    reader = models.User.objects.create(username='alice').reader_profile
+    models.Subscription.objects.create(feed=feed, reader=reader)
+    old, new = (
+        models.Article.objects.create(feed=feed, id_in_feed=str(i))
+        for i in range(2)
+    )
+    other_old, other_new = (
+        models.Article.objects.create(feed=other_feed, id_in_feed=str(i))
+        for i in range(2)
+    )
+    cutoff = now() - timedelta(hours=1)
+    models.Article.objects.filter(id__in=[old.id, other_old.id]).update(
+        created_at=cutoff - timedelta(days=1)
+    )
+
+    read_state.mark_feeds_read(reader, [feed.id], before=cutoff)
+    assert _read_articles(feed, reader) == {old}
+
+    read_state.mark_articles_read(reader, other_feed.article_set.all(),
+                                  before=cutoff)
+    assert _read_articles(other_feed, reader) == {other_old}
+
+    # The watermark does not move backward
+    read_state.mark_feeds_read(reader, [feed.id])
+    read_state.mark_feeds_read(reader, [feed.id], before=cutoff)
+    assert _read_articles(feed, reader) == {old, new}
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.utils.timezone import now
+import pytest
+
+from .. import feed_stats, models, retention, tasks
+
+
+@pytest.mark.django_db
+def test_enforce_retention():
+    current_date = now()
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed',
+                                      retention_max_articles=2)
+    articles = [
+        models.Article.objects.create(
+            feed=feed, id_in_feed=str(i),
+            published_at=current_date - timedelta(days=i)
+        )
+        for i in range(5)
+    ]
+    user = models.User.objects.create(username='alice')
+    user.reader_profile.stars.add(articles[-1])
+    feed_stats.reconcile(feed, current_date)
+
+    result = retention.enforce_retention(feed, current_date)
+    assert result == retention.RetentionResult(3, True)
+    remaining = models.Article.objects.values_list('id_in_feed', flat=True)
+    assert sorted(remaining) == ['0', '4']
+    assert feed_stats.get_feed_stats(feed).article_count == 2
+
+    # Starred articles are kept even when they are too old
+    feed.retention_max_age = timedelta(hours=12)
+    result = retention.enforce_retention(feed, current_date)
+    assert result == retention.RetentionResult(0, True)
+    result = retention.enforce_retention(feed,
+                                         current_date + timedelta(days=1))
+    assert result == retention.RetentionResult(1, True)
+    assert list(models.Article.objects.all()) == [articles[4]]
+
+
+@pytest.mark.django_db
+def test_enforce_retention_within_policy():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    assert retention.enforce_retention(feed, now()) is None
+
+
+@pytest.mark.django_db
+def test_enforce_retention_out_of_budget(monkeypatch):
+    current_date = now()
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed',
+                                      retention_max_articles=1)
+    for i in range(3):
+        models.Article.objects.create(feed=feed, id_in_feed=str(i))
+    feed_stats.reconcile(feed, current_date)
+    monkeypatch.setattr(retention, 'READER_RETENTION_TIME_BUDGET',
+                        timedelta(0))
+
+    result = retention.enforce_retention(feed, current_date)
+    assert result == retention.RetentionResult(0, False)
+
+    # The rest is left to a task instead of holding the worker
+    scheduled = list()
+    monkeypatch.setattr(tasks.tasks, 'schedule_at',
+                        lambda *args: scheduled.append(args))
+    tasks._enforce_retention(feed, current_date)
+    assert len(scheduled) == 1
+    assert scheduled[0][0] == 'enforce_retention'
+    assert scheduled[0][2] == feed.id
+
+    monkeypatch.setattr(retention, 'READER_RETENTION_TIME_BUDGET',
+                        timedelta(seconds=5))
+    tasks.enforce_retention(feed.id)
+    assert models.Article.objects.filter(feed=feed).count() == 1
+    assert len(scheduled) == 1
+
+
+@pytest.mark.django_db
+def test_trim_long_feeds():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed',
+                                      retention_max_articles=1)
+    short_feed = models.Feed.objects.create(name='Bar',
+                                            uri='https://bar.foo/feed')
+    for i in range(3):
+        models.Article.objects.create(feed=feed, id_in_feed=str(i))
+    models.Article.objects.create(feed=short_feed, id_in_feed='0')
+
+    # Feeds never synchronized have no stats yet, they are trimmed anyway
+    assert not models.FeedStats.objects.exists()
+    tasks.trim_long_feeds()
+    assert models.Article.objects.filter(feed=feed).count() == 1
+    assert models.Article.objects.filter(feed=short_feed).count() == 1
+    assert models.FeedStats.objects.count() == 2
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from .. import scheduling
+from ..settings import (
+    READER_SYNC_MIN_INTERVAL, READER_SYNC_MAX_INTERVAL,
+    READER_SYNC_MAX_FAILURE_BACKOFF, READER_SYNC_MAX_HINT_INTERVAL
+)
+
+
+def test_get_sync_interval_unknown_frequency():
+    assert scheduling.get_sync_interval(None, 1, True) == (
+        READER_SYNC_MIN_INTERVAL
+    )
+
+
+def test_get_sync_interval():
+    # Daily feed with a single subscriber
+    daily = scheduling.get_sync_interval(365, 1, True)
+    assert daily == timedelta(hours=6)
+
+    assert scheduling.get_sync_interval(365, 10, True) == daily / 2
+    assert scheduling.get_sync_interval(365, 1, False) == daily * 2
+
+
+def test_get_sync_interval_bounds():
+    assert scheduling.get_sync_interval(100_000, 1000, True) == (
+        READER_SYNC_MIN_INTERVAL
+    )
+    assert scheduling.get_sync_interval(1, 1, False) == (
+        READER_SYNC_MAX_INTERVAL
+    )
+
+
+def test_get_failure_backoff():
+    assert scheduling.get_failure_backoff(1) == READER_SYNC_MIN_INTERVAL * 2
+    assert scheduling.get_failure_backoff(3) == READER_SYNC_MIN_INTERVAL * 8
+    assert scheduling.get_failure_backoff(1000) == (
+        READER_SYNC_MAX_FAILURE_BACKOFF
+    )
+
+
+def test_parse_feed_hints():
+    hints = scheduling.parse_feed_hints(
+        b'<?xml version="1.0"?><rss version="2.0"><channel>'
+        b'<title>Foo</title><ttl>60</ttl>'
+        b'<skipHours><hour>0</hour><hour>1</hour></skipHours>'
+        b'<skipDays><day>Sunday</day></skipDays>'
+        b'<item><title>Bar</title><ttl>5</ttl></item>'
+        b'</channel></rss>'
+    )
+    assert hints.ttl == timedelta(hours=1)
+    assert hints.skip_hours == [0, 1]
+    assert hints.skip_days == ['Sunday']
+
+    assert scheduling.parse_feed_hints(b'{"version": "json"}') == (
+        scheduling.FeedHints()
+    )
+
+
+def test_apply_hints():
+    interval = timedelta(hours=1)
+    assert scheduling.apply_hints(interval, None) == interval
+    assert scheduling.apply_hints(interval, timedelta(minutes=5)) == interval
+    assert scheduling.apply_hints(interval, timedelta(hours=3)) == (
+        timedelta(hours=3)
+    )
+    assert scheduling.apply_hints(interval, timedelta(days=365)) == (
+        READER_SYNC_MAX_HINT_INTERVAL
+    )
+
+
+def test_skip_excluded_hours():
+    # 2020-01-04 is a Saturday
+    date = datetime(2020, 1, 4, 23, 30, tzinfo=timezone.utc)
+    assert scheduling.skip_excluded_hours(date, [], []) == date
+    assert scheduling.skip_excluded_hours(date, [23, 0], []) == (
+        datetime(2020, 1, 5, 1, tzinfo=timezone.utc)
+    )
+    assert scheduling.skip_excluded_hours(date, [], ['Saturday', 'Sunday']) == (
+        datetime(2020, 1, 6, 0, tzinfo=timezone.utc)
+    )
+    assert scheduling.skip_excluded_hours(date, list(range(24)), []) == date
@@ -0,0 +1,76 @@
+from redis import RedisError
+
+from .. import sync_lease
+
+NAME = 'test_feed'
+
+
+def test_acquire_release(reader_redis):
+    token = sync_lease.acquire(NAME)
+    assert token
+    assert sync_lease.acquire(NAME) is None
+
+    assert sync_lease.release(NAME, token) is False
+    other_token = sync_lease.acquire(NAME)
+    assert other_token not in (None, token)
+    assert sync_lease.release(NAME, other_token) is False
+
+
+def test_release_checks_token(reader_redis):
+    token = sync_lease.acquire(NAME)
+    assert sync_lease.release(NAME, 'not-the-token') is False
+    assert sync_lease.renew(NAME, 'not-the-token') is False
+
+    # The lease is still held by its owner
+    assert sync_lease.acquire(NAME) is None
+    assert sync_lease.release(NAME, token) is False
+    assert sync_lease.renew(NAME, token) is False
+
+
+def test_forced_request_upgrades_lease(reader_redis):
+    token = sync_lease.acquire(NAME)
+    assert sync_lease.acquire(NAME, force=True) is None
+
+    # The holder is told to synchronize again with force
+    assert sync_lease.release(NAME, token) is True
+
+    # The pending request was consumed
+    token = sync_lease.acquire(NAME)
+    assert sync_lease.release(NAME, token) is False
+
+    # A forced synchronization cannot be upgraded
+    token = sync_lease.acquire(NAME, force=True)
+    assert sync_lease.acquire(NAME, force=True) is None
+    assert sync_lease.release(NAME, token) is False
+
+
+def test_renew(reader_redis, monkeypatch):
+    lease_key = sync_lease._lease_key(NAME)
+    monkeypatch.setattr(sync_lease, 'LEASE_TTL', 10)
+    token = sync_lease.acquire(NAME)
+    assert reader_redis.ttl(lease_key) <= 10
+
+    monkeypatch.setattr(sync_lease, 'LEASE_TTL', 600)
+    assert sync_lease.renew(NAME, token) is True
+    assert reader_redis.ttl(lease_key) > 10
+
+    # A lease that expired cannot be renewed
+    reader_redis.delete(lease_key)
+    assert sync_lease.renew(NAME, token) is False
+
+
+def test_lease_without_redis(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RedisError('Connection refused')
+
+    monkeypatch.setattr(sync_lease, 'ACQUIRE_SCRIPT', fail)
+    monkeypatch.setattr(sync_lease, 'RENEW_SCRIPT', fail)
+    monkeypatch.setattr(sync_lease, 'RELEASE_SCRIPT', fail)
+
+    # Synchronizations are not blocked when Redis is down
+    token = sync_lease.acquire(NAME)
+    assert token == ''
+    assert sync_lease.renew(NAME, token) is True
+    assert sync_lease.release(NAME, token) is False
+    assert sync_lease.renew(NAME, 'token') is True
+    assert sync_lease.release(NAME, 'token') is False
@@ -1,6 +1,10 @@
+from datetime import datetime, timedelta, timezone
+
+from django.utils.timezone import now
 import pytest
+import requests
 
-from .. import models, tasks
+from .. import models, pagination, tasks
 
 
 @pytest.mark.django_db
@@ -79,3 +83,446 @@ def test_is_object_equivalent():
     assert not tasks._is_object_equivalent(attachment, {
         'non_existant': None
     })
+
+
+@pytest.mark.django_db
+def test_plan_feeds_to_sync_deduplicates():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    for username in ('alice', 'bob', 'carol'):
+        user = models.User.objects.create(username=username,
+                                          last_login=now())
+        models.Subscription.objects.create(feed=feed,
+                                           reader=user.reader_profile)
+
+    plan = tasks.plan_feeds_to_sync(now())
+    assert plan.feed_ids == [feed.id]
+    assert plan.duplicates_dropped == 2
+
+
+def _create_subscribed_feed(uri, **kwargs):
+    feed = models.Feed.objects.create(name='Foo', uri=uri, **kwargs)
+    user = models.User.objects.create(username=uri, last_login=now())
+    models.Subscription.objects.create(feed=feed, reader=user.reader_profile)
+    return feed
+
+
+@pytest.mark.django_db
+def test_plan_feeds_to_sync_due_feeds():
+    current_date = now()
+    never_synced = _create_subscribed_feed('https://foo.bar/1')
+    late = _create_subscribed_feed(
+        'https://foo.bar/2', next_sync_at=current_date - timedelta(hours=1)
+    )
+    _create_subscribed_feed('https://foo.bar/3',
+                            next_sync_at=current_date + timedelta(hours=1))
+    _create_subscribed_feed('https://foo.bar/4', is_sync_enabled=False)
+    models.Feed.objects.create(name='Foo', uri='https://foo.bar/5')
+
+    plan = tasks.plan_feeds_to_sync(current_date)
+    assert plan.feed_ids == [never_synced.id, late.id]
+    assert plan.lag == timedelta(hours=1)
+
+    plan = tasks.plan_feeds_to_sync(current_date, limit=1)
+    assert plan.feed_ids == [never_synced.id]
+
+
+@pytest.mark.django_db
+def test_dispatch_due_feeds(monkeypatch):
+    batches = list()
+    monkeypatch.setattr(tasks, 'READER_SYNC_DISPATCH_RATE', 2)
+    monkeypatch.setattr(tasks, 'READER_SYNC_BULK_SIZE', 1)
+    monkeypatch.setattr(tasks.tasks, 'schedule_batch', batches.append)
+    feeds = [_create_subscribed_feed('https://foo.bar/{}'.format(i))
+             for i in range(3)]
+
+    tasks.dispatch_due_feeds()
+
+    assert len(batches) == 1
+    jobs = batches[0].jobs_to_create
+    assert [job[2] for job in jobs] == [(feeds[0].id,), (feeds[1].id,)]
+
+    # Dispatched feeds are leased for a few minutes, not for a whole day
+    leased_until = models.Feed.objects.get(id=feeds[0].id).next_sync_at
+    assert leased_until <= (
+        now() + tasks.DISPATCH_PERIOD + tasks.READER_SYNC_DISPATCH_LEASE
+    )
+    assert models.Feed.objects.get(id=feeds[2].id).next_sync_at is None
+
+    metrics = tasks.get_dispatcher_metrics()
+    assert metrics['backlog'] == 1
+    assert metrics['rate_per_minute'] == 2
+
+    # Once the lease is over a lost synchronization is dispatched again
+    plan = tasks.plan_feeds_to_sync(leased_until + timedelta(seconds=1))
+    assert feeds[0].id in plan.feed_ids
+
+
+def test_group_feeds(monkeypatch):
+    monkeypatch.setattr(tasks, 'READER_SYNC_BULK_SIZE', 3)
+    monkeypatch.setattr(tasks, 'READER_HOST_MAX_CONCURRENCY', 2)
+    hosts = {1: 'a', 2: 'a', 3: 'a', 4: 'b', 5: 'a', 6: 'c', 7: 'd'}
+
+    # A group never holds more feeds of a host than the host limiter lets
+    # through at once
+    groups = tasks.group_feeds(list(hosts), hosts)
+    assert groups == [[1, 2, 4], [3, 5, 6], [7]]
+    assert tasks.group_feeds([], hosts) == []
+
+
+@pytest.mark.django_db
+def test_throttled_feed_is_deferred():
+    current_date = now()
+    feed = models.Feed.objects.create(
+        name='Foo', uri='https://foo.bar/feed',
+        failure_count=tasks.READER_SYNC_MAX_FAILURES - 1
+    )
+    response = requests.Response()
+    response.status_code = 429
+    response.headers['Retry-After'] = '7200'
+    error = requests.HTTPError(response=response)
+
+    # A server asking to slow down does not get the feed disabled
+    tasks._handle_fetch_error(feed, error, False, current_date)
+    feed.refresh_from_db()
+    assert feed.is_sync_enabled
+    assert feed.failure_count == tasks.READER_SYNC_MAX_FAILURES - 1
+    assert feed.next_sync_at >= current_date + timedelta(hours=2)
+
+
+@pytest.mark.django_db
+def test_enabling_sync_resets_failures():
+    feed = models.Feed.objects.create(
+        name='Foo', uri='https://foo.bar/feed', is_sync_enabled=False,
+        failure_count=tasks.READER_SYNC_MAX_FAILURES, last_failure='Timeout'
+    )
+    feed = models.Feed.objects.get(id=feed.id)
+    feed.save()
+    assert feed.failure_count == tasks.READER_SYNC_MAX_FAILURES
+
+    feed.is_sync_enabled = True
+    feed.save(update_fields=['is_sync_enabled'])
+    feed.refresh_from_db()
+    assert feed.failure_count == 0
+    assert feed.last_failure == ''
+
+    # A new failure does not disable the feed again
+    tasks._record_failure(feed, Exception('Timeout'), now())
+    feed.refresh_from_db()
+    assert feed.is_sync_enabled
+    assert feed.failure_count == 1
+
+
+@pytest.mark.django_db
+def test_synchronize_parsed_feed_upserts_articles():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    models.Article.objects.create(feed=feed, id_in_feed='1', title='Old')
+    parsed_feed = tasks.simple_parse_bytes(b"""<?xml version="1.0"?>
+    <rss version="2.0"><channel><title>Foo</title>
+      <item><guid>2</guid><title>New</title></item>
+      <item><guid>1</guid><title>Updated</title></item>
+      <item><guid>1</guid><title>Duplicate</title></item>
+    </channel></rss>""")
+
+    tasks.synchronize_parsed_feed(feed, parsed_feed)
+
+    titles = dict(
+        models.Article.objects.filter(feed=feed)
+        .values_list('id_in_feed', 'title')
+    )
+    assert titles == {'1': 'Updated', '2': 'New'}
+    assert not models.Article.objects.filter(content_hash__isnull=True)
+
+
+@pytest.mark.django_db
+def test_synchronize_parsed_feed_concurrent_insert(monkeypatch):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    bulk_upsert = tasks.upsert.bulk_upsert
+
+    def concurrent_bulk_upsert(*args, **kwargs):
+        # Another worker inserts the article after existing articles were
+        # loaded
+        models.Article.objects.create(feed=feed, id_in_feed='1', title='Old')
+        return bulk_upsert(*args, **kwargs)
+
+    monkeypatch.setattr(tasks.upsert, 'bulk_upsert', concurrent_bulk_upsert)
+    parsed_feed = tasks.simple_parse_bytes(b"""<?xml version="1.0"?>
+    <rss version="2.0"><channel><title>Foo</title>
+      <item><guid>1</guid><title>New</title></item>
+    </channel></rss>""")
+
+    tasks.synchronize_parsed_feed(feed, parsed_feed)
+    assert models.Article.objects.get(feed=feed).title == 'New'
+
+
+def test_object_index():
+    feed = models.Feed(id=1, name='Foo')
+    article = models.Article(id=1, feed=feed, id_in_feed='1', title='Foo')
+    index = tasks.ObjectIndex([article], ('id_in_feed',), ('title',))
+
+    assert len(index) == 1
+    assert list(index) == [article]
+    assert index.get(id_in_feed='1') is article
+    assert index.get(id_in_feed='2') is None
+    assert index.is_unchanged({'title': 'Foo'}, id_in_feed='1')
+    assert not index.is_unchanged({'title': 'Bar'}, id_in_feed='1')
+    assert not index.is_unchanged({'title': 'Foo'}, id_in_feed='2')
+
+    # Other attributes than the indexed ones are compared one by one
+    assert index.is_unchanged({'feed': feed}, id_in_feed='1')
+    assert not index.is_unchanged({'uri': 'https://foo.bar'}, id_in_feed='1')
+
+    with pytest.raises(ValueError):
+        index.get(uri='https://foo.bar')
+
+    # Values with the same Python hash are still different
+    assert hash(-1) == hash(-2)
+    attachment = models.Attachment(uri='https://foo.bar/a.mp3',
+                                   size_in_bytes=-1)
+    index = tasks.ObjectIndex([attachment], ('uri',), ('size_in_bytes',))
+    assert not index.is_unchanged({'size_in_bytes': -2},
+                                  uri='https://foo.bar/a.mp3')
+
+
+def test_get_article_hash():
+    published_at = datetime(2018, 1, 1, 12, tzinfo=timezone.utc)
+    defaults = {
+        'uri': 'https://foo.bar/1',
+        'title': 'Foo',
+        'content': '<p>Bar</p>',
+        'published_at': published_at,
+        'updated_at': None
+    }
+    content_hash = tasks.get_article_hash(defaults)
+    assert len(content_hash) == 20
+
+    # Same instant in another timezone
+    defaults['published_at'] = published_at.astimezone(
+        timezone(timedelta(hours=2))
+    )
+    assert tasks.get_article_hash(defaults) == content_hash
+
+    defaults['content'] = '<p>Baz</p>'
+    assert tasks.get_article_hash(defaults) != content_hash
+
+
+@pytest.mark.django_db
+def test_synchronize_parsed_feed_attachments():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    article = models.Article.objects.create(feed=feed, id_in_feed='1')
+    models.Attachment.objects.create(article=article, title='Old',
+                                     uri='https://foo.bar/old.mp3')
+    models.Attachment.objects.create(article=article, title='Kept',
+                                     uri='https://foo.bar/kept.mp3')
+    parsed_feed = tasks.simple_parse_bytes(b"""<?xml version="1.0"?>
+    <rss version="2.0"><channel><title>Foo</title>
+      <item><guid>1</guid>
+        <enclosure url="https://foo.bar/kept.mp3" type="audio/mpeg"/>
+      </item>
+      <item><guid>2</guid>
+        <enclosure url="https://foo.bar/new.mp3" type="audio/mpeg"/>
+      </item>
+    </channel></rss>""")
+
+    tasks.synchronize_parsed_feed(feed, parsed_feed)
+
+    attachments = dict(
+        models.Attachment.objects.filter(article__feed=feed)
+        .values_list('uri', 'mime_type')
+    )
+    assert attachments == {
+        'https://foo.bar/kept.mp3': 'audio/mpeg',
+        'https://foo.bar/new.mp3': 'audio/mpeg'
+    }
+
+
+def test_is_full_sync_needed():
+    current_date = datetime(2018, 1, 2, tzinfo=timezone.utc)
+    feed = models.Feed(last_full_sync_at=current_date - timedelta(hours=1),
+                       head_published_at=datetime(2018, 1, 1,
+                                                  tzinfo=timezone.utc))
+
+    def defaults(*days):
+        return {
+            str(day): {'published_at': datetime(2018, 1, day,
+                                                tzinfo=timezone.utc)}
+            for day in days
+        }
+
+    assert not tasks._is_full_sync_needed(feed, defaults(2, 1), current_date)
+
+    # Oldest article first
+    assert tasks._is_full_sync_needed(feed, defaults(1, 2), current_date)
+
+    # Newest article went back in time
+    feed.head_published_at = datetime(2018, 1, 3, tzinfo=timezone.utc)
+    assert tasks._is_full_sync_needed(feed, defaults(2, 1), current_date)
+
+    feed.head_published_at = None
+    feed.last_full_sync_at = current_date - timedelta(days=2)
+    assert tasks._is_full_sync_needed(feed, defaults(2, 1), current_date)
+
+    feed.last_full_sync_at = None
+    assert tasks._is_full_sync_needed(feed, defaults(2, 1), current_date)
+
+
+@pytest.mark.django_db
+def test_synchronize_parsed_feed_incremental():
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+
+    def parse(titles):
+        items = ''.join(
+            '<item><guid>{}</guid><title>{}</title></item>'.format(i, title)
+            for i, title in reversed(list(enumerate(titles)))
+        )
+        return tasks.simple_parse_bytes(
+            '<rss version="2.0"><channel><title>Foo</title>{}</channel>'
+            '</rss>'.format(items).encode()
+        )
+
+    titles = ['Article {}'.format(i) for i in range(10)]
+    tasks.synchronize_parsed_feed(feed, parse(titles))
+    assert feed.last_full_sync_at is not None
+    assert feed.head_id_in_feed == '9'
+    feed.save()
+
+    # The oldest article is modified, it is beyond the run of known articles
+    titles[0] = 'Modified'
+    titles.append('Article 10')
+    tasks.synchronize_parsed_feed(feed, parse(titles))
+    assert feed.head_id_in_feed == '10'
+    assert models.Article.objects.filter(feed=feed).count() == 11
+    assert models.Article.objects.get(feed=feed, id_in_feed='0').title == (
+        'Article 0'
+    )
+
+    tasks.synchronize_parsed_feed(feed, parse(titles), full=True)
+    assert models.Article.objects.get(feed=feed, id_in_feed='0').title == (
+        'Modified'
+    )
+
+
+@pytest.mark.django_db
+def test_synchronize_parsed_feed_capped(monkeypatch):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    scheduled = list()
+    monkeypatch.setattr(tasks, 'READER_SYNC_MAX_ARTICLES', 2)
+    monkeypatch.setattr(tasks.tasks, 'schedule_at',
+                        lambda *args, **kwargs: scheduled.append(args))
+    parsed_feed = tasks.simple_parse_bytes(b"""<?xml version="1.0"?>
+    <rss version="2.0"><channel><title>Foo</title>
+      <item><guid>3</guid></item>
+      <item><guid>2</guid></item>
+      <item><guid>1</guid></item>
+    </channel></rss>""")
+
+    tasks.synchronize_parsed_feed(feed, parsed_feed)
+    ids = models.Article.objects.values_list('id_in_feed', flat=True)
+    assert sorted(ids) == ['2', '3']
+    assert len(scheduled) == 1
+    assert scheduled[0][0] == 'synchronize_feed_remainder'
+
+    # The follow-up continues from the articles left over, without fetching
+    # the feed again
+    head_hash = feed.head_hash
+    feed.save()
+    tasks._synchronize_feed_remainder(feed.id)
+    assert models.Article.objects.filter(feed=feed).count() == 3
+    assert len(scheduled) == 1
+    feed.refresh_from_db()
+    assert bytes(feed.head_hash) == head_hash
+    cache_key = tasks.SYNC_REMAINDER_CACHE_KEY.format(feed.id)
+    assert tasks.cache.get(cache_key) is None
+
+    # Unchanged articles past the cap are not a remainder
+    tasks.synchronize_parsed_feed(feed, parsed_feed, full=True)
+    assert len(scheduled) == 1
+
+    # An uncapped synchronization writes all the articles at once
+    other_feed = models.Feed.objects.create(name='Bar',
+                                            uri='https://bar.foo/feed')
+    tasks.synchronize_parsed_feed(other_feed, parsed_feed, capped=False)
+    assert models.Article.objects.filter(feed=other_feed).count() == 3
+    assert len(scheduled) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('pub_date', [
+    '', '<pubDate>Wed, 02 Jan 2019 00:00:00 GMT</pubDate>'
+])
+def test_capped_synchronization_keeps_feed_order(monkeypatch, pub_date):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    monkeypatch.setattr(tasks, 'READER_SYNC_MAX_ARTICLES', 2)
+    monkeypatch.setattr(tasks.tasks, 'schedule_at', lambda *args: None)
+    items = ''.join(
+        '<item><guid>{}</guid>{}</item>'.format(i, pub_date)
+        for i in range(5, 0, -1)
+    )
+    parsed_feed = tasks.simple_parse_bytes(
+        '<?xml version="1.0"?><rss version="2.0"><channel><title>Foo</title>'
+        '{}</channel></rss>'.format(items).encode()
+    )
+
+    # Written in three passes: 5 and 4, then 3 and 2, then 1
+    tasks.synchronize_parsed_feed(feed, parsed_feed)
+    for _ in range(2):
+        tasks._synchronize_feed_remainder(feed.id)
+
+    # Boards show the articles in the order of the feed, newest first, even
+    # though the oldest ones were inserted last
+    board = (
+        models.Article.objects.filter(feed=feed)
+        .order_by(*pagination.newest_first())
+        .values_list('id_in_feed', flat=True)
+    )
+    assert list(board) == ['5', '4', '3', '2', '1']
+
+
+@pytest.mark.django_db
+def test_synchronize_feed_remainder_expired(monkeypatch):
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    scheduled = list()
+    monkeypatch.setattr(tasks.tasks, 'schedule',
+                        lambda *args, **kwargs: scheduled.append(
+                            (args, kwargs)
+                        ))
+    tasks.cache.delete(tasks.SYNC_REMAINDER_CACHE_KEY.format(feed.id))
+
+    # The fallback is not capped, it cannot leave a remainder of its own
+    tasks._synchronize_feed_remainder(feed.id)
+    assert scheduled == [
+        (('synchronize_feed', feed.id), {'force': True, 'capped': False})
+    ]
+
+
+@pytest.mark.django_db
+def test_merge_feeds_waits_for_leases(monkeypatch):
+    survivor = models.Feed.objects.create(name='Foo',
+                                          uri='https://foo.bar/feed')
+    duplicate = models.Feed.objects.create(name='Foo',
+                                           uri='http://foo.bar/feed')
+    survivor_lease = tasks.sync_lease.feed_lease_name(survivor.id)
+    leased = {survivor_lease}
+    released = list()
+    scheduled = list()
+
+    def acquire(name):
+        return None if name in leased else 'token'
+
+    monkeypatch.setattr(tasks.sync_lease, 'acquire', acquire)
+    monkeypatch.setattr(tasks.sync_lease, 'release',
+                        lambda name, token: released.append(name))
+    monkeypatch.setattr(tasks.tasks, 'schedule_at',
+                        lambda *args: scheduled.append(args))
+
+    # The survivor is being synchronized, the merge is retried later
+    tasks.merge_feeds(duplicate.id, survivor.id)
+    assert models.Feed.objects.filter(id=duplicate.id).exists()
+    assert len(scheduled) == 1
+    assert scheduled[0][2:] == (duplicate.id, survivor.id)
+    assert released == [tasks.sync_lease.feed_lease_name(duplicate.id)]
+
+    leased.clear()
+    tasks.merge_feeds(duplicate.id, survivor.id)
+    assert not models.Feed.objects.filter(id=duplicate.id).exists()
+    assert survivor_lease in released
+    assert len(scheduled) == 1
@@ -4,3 +4,18 @@ from .. import utils
 def test_shrink_str():
     assert utils.shrink_str('foo') == 'foo'
     assert utils.shrink_str('foo', max_length=3) == 'fo…'
+
+
+def test_canonicalize_uri():
+    assert utils.canonicalize_uri('HTTPS://Example.COM:443/Feed/') == (
+        'https://example.com/Feed'
+    )
+    assert utils.canonicalize_uri('http://example.com:80') == (
+        'http://example.com/'
+    )
+    assert utils.canonicalize_uri('http://example.com:8080/a?b=c#d') == (
+        'http://example.com:8080/a?b=c'
+    )
+    assert utils.canonicalize_uri('https://user:pw@example.com./') == (
+        'https://user:pw@example.com/'
+    )
@@ -0,0 +1,154 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+import pytest
+
+from .. import inbox, models, read_state, views
+
+
+def test_get_read_cutoff():
+    factory = RequestFactory()
+    assert views.get_read_cutoff(factory.post('/')) is None
+
+    request = factory.post('/?older-than=7')
+    cutoff = views.get_read_cutoff(request)
+    assert now() - timedelta(days=7, minutes=1) < cutoff
+    assert cutoff < now() - timedelta(days=6)
+
+    for older_than in ('foo', '-1', '99999999999', '999999999'):
+        request = factory.post('/?older-than={}'.format(older_than))
+        with pytest.raises(ValueError):
+            views.get_read_cutoff(request)
+
+
+def _get_view(view_class, user, **kwargs):
+    request = RequestFactory().get('/')
+    request.user = user
+    view = view_class()
+    view.setup(request, **kwargs)
+    return view
+
+
+@pytest.mark.django_db
+def test_boards_read_inbox(inbox_enabled):
+    user = models.User.objects.create(username='alice')
+    reader = user.reader_profile
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    other_feed = models.Feed.objects.create(name='Bar',
+                                            uri='https://bar.foo/feed')
+    models.Subscription.objects.create(feed=feed, reader=reader,
+                                       tags=['news'])
+    models.Subscription.objects.create(feed=other_feed, reader=reader)
+    article = models.Article.objects.create(feed=feed, id_in_feed='1')
+    other_article = models.Article.objects.create(feed=other_feed,
+                                                  id_in_feed='1')
+    inbox.add_articles(feed, [article.id])
+    inbox.add_articles(other_feed, [other_article.id])
+    board = models.Board.objects.create(name='News', reader=reader,
+                                        tags=['news'])
+
+    expected = (
+        (views.AllArticles, {}, [other_article, article]),
+        (views.DBBoardDetailList, {'pk': board.pk}, [article])
+    )
+    for view_class, kwargs, articles in expected:
+        view = _get_view(view_class, user, **kwargs)
+        queryset = view.get_queryset()
+        assert queryset.model is models.InboxEntry
+
+        _, page, object_list, _ = view.paginate_queryset(queryset, 10)
+        assert object_list == articles
+        assert all(a.is_read is False and a.is_starred is False
+                   for a in object_list)
+
+
+def _create_articles(feed, reader, start):
+    """Create a read, an unread and a starred article."""
+    read, unread, starred = [
+        models.Article.objects.create(feed=feed, id_in_feed=str(i),
+                                      title='Article {}'.format(i))
+        for i in range(start, start + 3)
+    ]
+    read_state.set_read(reader, read, True)
+    reader.stars.add(starred)
+    return {read.id: (True, False), unread.id: (False, False),
+            starred.id: (False, True)}
+
+
+@pytest.mark.django_db
+def test_article_lists_reader_flags(client):
+    user = models.User.objects.create(username='alice')
+    reader = user.reader_profile
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    models.Subscription.objects.create(feed=feed, reader=reader,
+                                       tags=['news'])
+    board = models.Board.objects.create(name='News', reader=reader,
+                                        tags=['news'])
+    flags = _create_articles(feed, reader, 0)
+
+    # Another reader's state does not leak into the flags
+    other_reader = models.User.objects.create(username='bob').reader_profile
+    models.Subscription.objects.create(feed=feed, reader=other_reader)
+    read_state.mark_feeds_read(other_reader, [feed.id])
+    other_reader.stars.add(*models.Article.objects.all())
+
+    pages = (
+        (views.FeedDetailList, 'reader:feed-detail', {'pk': feed.pk}),
+        (views.AllArticles, 'reader:home', {}),
+        (views.DBBoardDetailList, 'reader:board-detail', {'pk': board.pk})
+    )
+    client.force_login(user)
+    for view_class, url_name, kwargs in pages:
+        view = _get_view(view_class, user, **kwargs)
+        view.kwargs['show-read'] = 'true'
+        _, _, object_list, _ = view.paginate_queryset(view.get_queryset(),
+                                                      10)
+        assert {a.id: (a.is_read, a.is_starred) for a in object_list} == (
+            flags
+        )
+
+        # Buttons of the page toggle the flags
+        response = client.get(reverse(url_name, kwargs=kwargs),
+                              {'show-read': 'true'})
+        assert response.status_code == 200
+        html = response.content.decode()
+        for article_id, (is_read, is_starred) in flags.items():
+            button = 'data-id="{}" data-type="articles" data-action="{}"'
+            assert button.format(
+                article_id, 'unread' if is_read else 'read'
+            ) in html
+            assert button.format(
+                article_id, 'unstar' if is_starred else 'star'
+            ) in html
+
+
+@pytest.mark.django_db
+def test_article_lists_queries_per_page(client):
+    user = models.User.objects.create(username='alice')
+    reader = user.reader_profile
+    feed = models.Feed.objects.create(name='Foo', uri='https://foo.bar/feed')
+    models.Subscription.objects.create(feed=feed, reader=reader)
+    client.force_login(user)
+    uris = (reverse('reader:feed-detail', kwargs={'pk': feed.pk}),
+            reverse('reader:home'))
+    for uri in uris:
+        # Fill the caches of the first requests
+        client.get(uri)
+
+    # Flags are computed by the query of the page, not once per article
+    query_counts = list()
+    for start in (0, 3):
+        _create_articles(feed, reader, start)
+        counts = list()
+        for uri in uris:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(uri, {'show-read': 'true'})
+            assert response.status_code == 200
+            counts.append(len(queries))
+        query_counts.append(counts)
+
+    assert query_counts[0] == query_counts[1]
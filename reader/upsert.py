@@ -0,0 +1,70 @@
+"""Insert or update many rows with a few statements.
+
+Django's update_or_create needs a SELECT followed by an INSERT or an UPDATE
+for each object. This module relies on PostgreSQL INSERT ... ON CONFLICT DO
+UPDATE to write a whole batch of rows in a single round trip.
+"""
+from typing import List, Sequence, Tuple
+
+from django.db import connection
+from django.db.models.base import ModelBase
+from psycopg2.extras import execute_values
+
+BATCH_SIZE = 500
+
+
+def bulk_upsert(model: ModelBase, rows: List[dict],
+                unique_fields: Sequence[str],
+                update_fields: Sequence[str]) -> List[Tuple[int, tuple, bool]]:
+    """Insert rows, updating the existing ones that conflict.
+
+    Rows are dicts of field names to values, the unique fields must be
+    covered by a unique constraint of the table. Foreign keys are given by
+    the primary key of the related object.
+
+    Returns for each row written its primary key, the values of its unique
+    fields and whether it was created. A row is known to be created because
+    PostgreSQL leaves the xmax system column to zero on a fresh insert.
+
+    A batch cannot contain two rows with the same unique values.
+    """
+    if not rows:
+        return []
+
+    opts = model._meta
+    fields = [opts.get_field(name) for name in rows[0].keys()]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(f.column) for f in fields)
+    unique_columns = [quote(opts.get_field(name).column)
+                      for name in unique_fields]
+    updates = ', '.join(
+        '{0} = EXCLUDED.{0}'.format(quote(opts.get_field(name).column))
+        for name in update_fields
+    )
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES %s '
+        'ON CONFLICT ({unique_columns}) DO UPDATE SET {updates} '
+        'RETURNING {pk}, {unique_columns}, (xmax = 0)'
+    ).format(
+        table=quote(opts.db_table),
+        columns=columns,
+        unique_columns=', '.join(unique_columns),
+        updates=updates,
+        pk=quote(opts.pk.column)
+    )
+
+    values = [
+        tuple(f.get_db_prep_save(row[f.name], connection) for f in fields)
+        for row in rows
+    ]
+
+    rv = list()
+    with connection.cursor() as cursor:
+        for i in range(0, len(values), BATCH_SIZE):
+            written = execute_values(
+                cursor.cursor, sql, values[i:i + BATCH_SIZE],
+                page_size=BATCH_SIZE, fetch=True
+            )
+            rv.extend((row[0], tuple(row[1:-1]), row[-1]) for row in written)
+
+    return rv
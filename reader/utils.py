@@ -1,5 +1,39 @@
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
 def shrink_str(text: str, max_length=100) -> str:
     if len(text) < max_length:
         return text
 
     return '{}…'.format(text[:max_length - 1])
+
+
+def canonicalize_uri(uri: str) -> str:
+    """Normalize the parts of an URI that do not change the resource.
+
+    Scheme and host are lowercased, default ports, trailing slashes and
+    fragments are removed. Two URIs with the same canonical form are
+    considered to be the same feed.
+    """
+    parts = urlsplit(uri.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').rstrip('.')
+    if ':' in netloc:
+        # IPv6 address
+        netloc = '[{}]'.format(netloc)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = '{}:{}'.format(netloc, port)
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo = '{}:{}'.format(userinfo, parts.password)
+        netloc = '{}@{}'.format(userinfo, netloc)
+
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
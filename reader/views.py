@@ -1,6 +1,12 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import HttpResponseRedirect, HttpResponse
+from django.db.models import Exists, OuterRef
+from django.http import (
+    HttpResponseRedirect, HttpResponse, HttpResponseBadRequest
+)
 from django.shortcuts import render
 from django.urls import reverse, reverse_lazy
 from django.views import View
@@ -11,10 +17,14 @@ from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.utils.functional import cached_property
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from spinach import Batch
 
-from . import models, forms, tasks, static_boards, caching
+from . import (
+    models, forms, tasks, static_boards, caching, read_state, pagination,
+    inbox
+)
 
 
 def home_router(request):
@@ -80,7 +90,23 @@ class ImportFeedList(LoginRequiredMixin, SuccessMessageMixin, FormView):
         return self.success_message % len(cleaned_data['opml_uris'])
 
 
-class FeedDetailList(LoginRequiredMixin, ListView):
+def annotate_reader_flags(queryset, reader_profile):
+    """Annotate articles with whether the reader has read and starred them.
+
+    The flags only concern the current reader, unlike prefetching everyone
+    who read or starred the articles.
+    """
+    stars = models.ReaderProfile.stars.through.objects.filter(
+        readerprofile=reader_profile, article=OuterRef('id')
+    )
+    return (
+        read_state.annotate_is_read(queryset, reader_profile)
+        .annotate(is_starred=Exists(stars))
+    )
+
+
+class FeedDetailList(LoginRequiredMixin, pagination.KeysetPaginationMixin,
+                     ListView):
     model = models.Article
     template_name = 'reader/feed_detail_list.html'
     context_object_name = 'articles'
@@ -90,11 +116,14 @@ class FeedDetailList(LoginRequiredMixin, ListView):
         return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
-        return (
+        queryset = (
             super().get_queryset()
             .filter(feed=self.kwargs.get('pk'))
-            .prefetch_related('read_by', 'stared_by', 'feed', 'attachment_set')
+            .select_related('feed')
+            .prefetch_related('attachment_set')
         )
+        return annotate_reader_flags(queryset,
+                                     self.request.user.reader_profile)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -215,32 +244,66 @@ class UnstarArticleView(ToggleView):
     add = False
 
 
-class ReadArticleView(ToggleView):
-    model = models.Article
-    attribute_name = 'read_by'
-    add = True
+class ReadArticleView(LoginRequiredMixin, View):
+    is_read = True
+
+    def post(self, request, pk):
+        article = get_object_or_404(models.Article, pk=pk)
+        read_state.set_read(request.user.reader_profile, article,
+                            self.is_read)
+        return HttpResponse(status=204)
 
 
-class UnreadArticleView(ToggleView):
-    model = models.Article
-    attribute_name = 'read_by'
-    add = False
+class UnreadArticleView(ReadArticleView):
+    is_read = False
+
+
+def get_read_cutoff(request) -> Optional[datetime]:
+    """Date before which articles are marked as read, if any.
+
+    Raises ValueError when the older-than parameter is not a positive number
+    of days or is too large to be a date.
+    """
+    older_than = request.GET.get('older-than')
+    if older_than is None:
+        return None
+
+    days = int(older_than)
+    if days < 0:
+        raise ValueError('Negative number of days: {}'.format(days))
+
+    try:
+        return now() - timedelta(days=days)
+    except OverflowError as e:
+        raise ValueError(str(e)) from e
 
 
 class ReadAllView(LoginRequiredMixin, View):
 
     def post(self, request, pk=None):
-        query = models.Article.objects
+        try:
+            before = get_read_cutoff(request)
+        except ValueError:
+            return HttpResponseBadRequest()
+
+        reader_profile = request.user.reader_profile
+        subscriptions = models.Subscription.objects.filter(
+            reader=reader_profile
+        )
         if pk:
-            query = query.filter(feed_id=pk)
-        else:
-            query = query.filter(
-                feed__subscribers=self.request.user.reader_profile
-            )
-        articles = query.exclude(
-            read_by=self.request.user.reader_profile
+            subscriptions = subscriptions.filter(feed_id=pk)
+            if not subscriptions.exists():
+                # Not subscribed to the feed, there is no watermark to move
+                read_state.mark_articles_read(
+                    reader_profile, models.Article.objects.filter(feed_id=pk),
+                    before
+                )
+                return HttpResponse(status=204)
+
+        read_state.mark_feeds_read(
+            reader_profile, subscriptions.values_list('feed_id', flat=True),
+            before
         )
-        request.user.reader_profile.read.add(*articles)
         return HttpResponse(status=204)
 
 
@@ -293,11 +356,14 @@ class BoardDelete(LoginRequiredMixin, DeleteView):
         )
 
 
-class BaseBoardDetailList(LoginRequiredMixin, ListView):
+class BaseBoardDetailList(LoginRequiredMixin, pagination.KeysetPaginationMixin,
+                          ListView):
     model = models.Article
     template_name = 'reader/board_detail_list.html'
     context_object_name = 'articles'
     default_show_read = False
+    # Boards of subscribed feeds can read the inbox of the reader
+    use_inbox = False
     empty_icon = 'fa-thumbs-up'
     empty_phrase = _("You're all caught up")
 
@@ -323,19 +389,53 @@ class BaseBoardDetailList(LoginRequiredMixin, ListView):
 
         return param == 'true'
 
+    @cached_property
+    def reads_inbox(self):
+        return self.use_inbox and inbox.is_enabled()
+
+    @property
+    def cursor_id_field(self):
+        return 'article_id' if self.reads_inbox else 'id'
+
     def get_queryset(self):
-        queryset = self.filter_queryset(super().get_queryset())
-        if not self.show_read:
-            queryset = queryset.exclude(
-                read_by=self.request.user.reader_profile
+        if self.reads_inbox:
+            entries = self.filter_inbox(
+                inbox.get_entries(self.request.user.reader_profile)
             )
-        return queryset.prefetch_related(
-            'read_by', 'stared_by', 'feed', 'attachment_set'
+            if not self.show_read:
+                entries = entries.filter(is_read=False)
+            return entries
+
+        queryset = annotate_reader_flags(
+            self.filter_queryset(super().get_queryset()),
+            self.request.user.reader_profile
+        )
+        if not self.show_read:
+            queryset = queryset.filter(is_read=False)
+        return (
+            queryset.select_related('feed')
+            .prefetch_related('attachment_set')
         )
 
     def filter_queryset(self, queryset):
         raise NotImplementedError()
 
+    def filter_inbox(self, entries):
+        return entries
+
+    def get_page_articles(self, object_list):
+        if self.reads_inbox:
+            return inbox.get_articles(object_list)
+
+        return object_list
+
+    def mark_all_read(self, before: Optional[datetime]=None):
+        read_state.mark_articles_read(
+            self.request.user.reader_profile,
+            self.filter_queryset(models.Article.objects.all()),
+            before
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         all_boards = static_boards.get_boards_for_user(self.request.user)
@@ -356,6 +456,7 @@ class BaseBoardDetailList(LoginRequiredMixin, ListView):
 
 
 class DBBoardDetailList(BaseBoardDetailList):
+    use_inbox = True
 
     @cached_property
     def board(self):
@@ -370,18 +471,29 @@ class DBBoardDetailList(BaseBoardDetailList):
         return reverse('reader:board-read-all',
                        kwargs={'pk': self.kwargs['pk']})
 
-    def filter_queryset(self, queryset):
+    @cached_property
+    def feeds_id(self):
         subs = (
             models.Subscription.objects
             .filter(reader=self.request.user.reader_profile)
             .filter(tags__overlap=self.board.tags)
             .all()
         )
-        feeds_id = [s.feed_id for s in subs]
-        return queryset.filter(feed__in=feeds_id)
+        return [s.feed_id for s in subs]
+
+    def filter_queryset(self, queryset):
+        return queryset.filter(feed__in=self.feeds_id)
+
+    def filter_inbox(self, entries):
+        return entries.filter(article__feed__in=self.feeds_id)
+
+    def mark_all_read(self, before: Optional[datetime]=None):
+        read_state.mark_feeds_read(self.request.user.reader_profile,
+                                   self.feeds_id, before)
 
 
 class AllArticles(BaseBoardDetailList):
+    use_inbox = True
 
     @cached_property
     def board(self):
@@ -396,6 +508,15 @@ class AllArticles(BaseBoardDetailList):
             feed__subscribers=self.request.user.reader_profile
         )
 
+    def mark_all_read(self, before: Optional[datetime]=None):
+        reader_profile = self.request.user.reader_profile
+        read_state.mark_feeds_read(
+            reader_profile,
+            models.Subscription.objects.filter(reader=reader_profile)
+            .values_list('feed_id', flat=True),
+            before
+        )
+
 
 class Starred(BaseBoardDetailList):
     default_show_read = True
@@ -418,14 +539,14 @@ class ReadAllBoard(LoginRequiredMixin, View):
     board_class_view = BaseBoardDetailList
 
     def post(self, request, pk=None):
+        try:
+            before = get_read_cutoff(request)
+        except ValueError:
+            return HttpResponseBadRequest()
+
         kwargs = {'pk': pk}
         board_view = self.board_class_view(request=request, kwargs=kwargs)
-        queryset = models.Article.objects
-        queryset = board_view.filter_queryset(queryset)
-        articles = queryset.exclude(
-            read_by=self.request.user.reader_profile
-        )
-        request.user.reader_profile.read.add(*articles)
+        board_view.mark_all_read(before)
         return HttpResponse(status=204)
 
 